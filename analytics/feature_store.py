@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from analytics.features import FEATURE_SCHEMA_VERSION
+
+log = logging.getLogger("analytics.feature_store")
+
+META_FILE = "meta.json"
+
+
+class FeatureWindow(NamedTuple):
+    ts: np.ndarray  # (n,) float64, epoch-секунды
+    X: np.ndarray  # (n, d) float32
+    y: np.ndarray  # (n,) int8
+    columns: List[str]
+    schema_version: int
+
+
+class Segment:
+    """
+    Сегмент хранилища: каталог с колоночными файлами фиксированной ёмкости.
+
+    ts.f8     — (capacity,) float64
+    label.i1  — (capacity,) int8
+    X.f4      — (d, capacity) float32, каждая колонка признака непрерывна на диске
+
+    Файлы создаются разреженными, поэтому ёмкость на диске ничего не стоит до записи.
+    meta.json (колонки, ёмкость, rows, min/max ts) переписывается атомарно после
+    записи данных — читатель никогда не видит строк, которых ещё нет в файлах.
+    """
+
+    def __init__(self, path: str, meta: Dict):
+        self.path = path
+        self.meta = meta
+
+    @property
+    def columns(self) -> List[str]:
+        return self.meta["columns"]
+
+    @property
+    def schema_version(self) -> int:
+        return self.meta.get("schema_version", 1)
+
+    @property
+    def rows(self) -> int:
+        return self.meta["rows"]
+
+    @property
+    def capacity(self) -> int:
+        return self.meta["capacity"]
+
+    @classmethod
+    def create(cls, path: str, columns: Sequence[str], capacity: int, created_ts: float) -> "Segment":
+        os.makedirs(path, exist_ok=True)
+        d = len(columns)
+        for name, dtype, shape in (("ts.f8", np.float64, (capacity,)), ("label.i1", np.int8, (capacity,)), ("X.f4", np.float32, (d, capacity))):
+            np.memmap(os.path.join(path, name), dtype=dtype, mode="w+", shape=shape).flush()
+        seg = cls(
+            path,
+            {
+                "columns": list(columns),
+                "schema_version": FEATURE_SCHEMA_VERSION,
+                "capacity": capacity,
+                "rows": 0,
+                "created_ts": created_ts,
+                "min_ts": None,
+                "max_ts": None,
+            },
+        )
+        seg._write_meta()
+        return seg
+
+    @classmethod
+    def open(cls, path: str) -> "Segment":
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    def _write_meta(self):
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def _arrays(self, mode: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        cap, d = self.capacity, len(self.columns)
+        ts = np.memmap(os.path.join(self.path, "ts.f8"), dtype=np.float64, mode=mode, shape=(cap,))
+        label = np.memmap(os.path.join(self.path, "label.i1"), dtype=np.int8, mode=mode, shape=(cap,))
+        X = np.memmap(os.path.join(self.path, "X.f4"), dtype=np.float32, mode=mode, shape=(d, cap))
+        return ts, label, X
+
+    def append(self, ts: np.ndarray, X: np.ndarray, y: np.ndarray) -> int:
+        """Дописывает сколько влезает; возвращает число записанных строк."""
+        n = min(len(ts), self.capacity - self.rows)
+        if n <= 0:
+            return 0
+        lo, hi = self.rows, self.rows + n
+        m_ts, m_label, m_X = self._arrays("r+")
+        m_ts[lo:hi] = ts[:n]
+        m_label[lo:hi] = y[:n]
+        m_X[:, lo:hi] = X[:n].T
+        for arr in (m_ts, m_label, m_X):
+            arr.flush()
+
+        self.meta["rows"] = hi
+        self.meta["min_ts"] = float(ts[:n].min()) if self.meta["min_ts"] is None else min(self.meta["min_ts"], float(ts[:n].min()))
+        self.meta["max_ts"] = float(ts[:n].max()) if self.meta["max_ts"] is None else max(self.meta["max_ts"], float(ts[:n].max()))
+        self._write_meta()
+        return n
+
+    def view(self, since_ts: float = 0.0) -> FeatureWindow:
+        """Zero-copy представление строк с ts >= since_ts (ts в сегменте не убывают)."""
+        ts, label, X = self._arrays("r")
+        rows = self.rows
+        lo = int(np.searchsorted(ts[:rows], since_ts, side="left")) if since_ts else 0
+        return FeatureWindow(ts[lo:rows], X[:, lo:rows].T, label[lo:rows], self.columns, self.schema_version)
+
+
+class FeatureStore:
+    """
+    Колоночное хранилище размеченных признаков для обучения ML.
+
+    Записи дописываются в сегменты (каталоги seg-<created_ts>) с фиксированной
+    схемой колонок. Новый сегмент открывается при заполнении, смене схемы или по
+    возрасту (segment_sec); сегменты старше retention_sec удаляются целиком.
+    Чтение — через np.memmap: окно внутри одного сегмента не копируется.
+    """
+
+    def __init__(self, cfg):
+        self.cfg = cfg.feature_store
+        self.root = self.cfg.path
+        self._active: Optional[Segment] = None
+
+    # ------------------------
+    # Запись
+    # ------------------------
+    def append(self, items: List[Tuple[Dict[str, float], int]], ts: Optional[float] = None):
+        """Дописывает размеченные признаки; порядок колонок — отсортированные ключи."""
+        if not self.cfg.enabled or not items:
+            return
+        columns = sorted(items[0][0].keys())
+        X = np.array([[feats.get(k, 0.0) for k in columns] for feats, _ in items], dtype=np.float32)
+        y = np.fromiter((label for _, label in items), dtype=np.int8, count=len(items))
+        self.append_matrix(X, y, columns, ts)
+
+    def append_matrix(self, X: np.ndarray, y: np.ndarray, columns: Sequence[str], ts: Optional[float] = None):
+        """Дописывает матрицу признаков (n, d) с колонками columns и метки y."""
+        if not self.cfg.enabled or len(X) == 0:
+            return
+        now = time.time() if ts is None else ts
+        columns = list(columns)
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.int8)
+        stamps = np.full(len(X), now)
+
+        written = 0
+        while written < len(X):
+            seg = self._writable_segment(columns, now)
+            written += seg.append(stamps[written:], X[written:], y[written:])
+        self.enforce_retention(now)
+
+    def _writable_segment(self, columns: List[str], now: float) -> Segment:
+        seg = self._active
+        if seg is None:
+            segments = self.segments()
+            seg = segments[-1] if segments else None
+        if (
+            seg is None
+            or seg.columns != columns
+            or seg.schema_version != FEATURE_SCHEMA_VERSION
+            or seg.rows >= seg.capacity
+            or now - seg.meta["created_ts"] >= self.cfg.segment_sec
+        ):
+            # Пачка больше ёмкости переполняет сегмент в тот же now — имя не должно совпасть
+            stamp = now
+            path = os.path.join(self.root, f"seg-{stamp:.6f}")
+            while os.path.exists(path):
+                stamp += 1e-6
+                path = os.path.join(self.root, f"seg-{stamp:.6f}")
+            seg = Segment.create(path, columns, self.cfg.segment_rows, now)
+            log.info("Feature store: new segment %s (%d columns)", path, len(columns))
+        self._active = seg
+        return seg
+
+    def enforce_retention(self, now: Optional[float] = None):
+        cutoff = (time.time() if now is None else now) - self.cfg.retention_sec
+        active = self._active.path if self._active else None
+        for seg in self.segments():
+            max_ts = seg.meta["max_ts"]
+            if max_ts is not None and max_ts < cutoff and seg.path != active:
+                shutil.rmtree(seg.path, ignore_errors=True)
+                log.info("Feature store: dropped expired segment %s", seg.path)
+
+    # ------------------------
+    # Чтение
+    # ------------------------
+    def segments(self) -> List[Segment]:
+        """Сегменты по возрастанию времени создания."""
+        if not os.path.isdir(self.root):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, name)
+            if name.startswith("seg-") and os.path.exists(os.path.join(path, META_FILE)):
+                result.append(Segment.open(path))
+        return result
+
+    def iter_windows(self, since_ts: float = 0.0) -> Iterator[FeatureWindow]:
+        """Zero-copy окна по сегментам (без склейки)."""
+        for seg in self.segments():
+            if seg.rows == 0 or (seg.meta["max_ts"] is not None and seg.meta["max_ts"] < since_ts):
+                continue
+            yield seg.view(since_ts)
+
+    def load(self, since_ts: float = 0.0, max_rows: Optional[int] = None) -> Optional[FeatureWindow]:
+        """
+        Последние строки новее since_ts текущей версии схемы признаков.
+        Окно из одного сегмента возвращается view на memmap; из нескольких — склеивается.
+        """
+        windows = [w for w in self.iter_windows(since_ts) if w.schema_version == FEATURE_SCHEMA_VERSION]
+        if not windows:
+            return None
+        columns = windows[-1].columns
+        windows = [w for w in windows if w.columns == columns]
+        if max_rows is not None:
+            kept, total = [], 0
+            for w in reversed(windows):
+                take = min(len(w.ts), max_rows - total)
+                if take <= 0:
+                    break
+                kept.append(w._replace(ts=w.ts[-take:], X=w.X[-take:], y=w.y[-take:]))
+                total += take
+            windows = kept[::-1]
+        if len(windows) == 1:
+            return windows[0]
+        return FeatureWindow(
+            np.concatenate([w.ts for w in windows]),
+            np.concatenate([w.X for w in windows]),
+            np.concatenate([w.y for w in windows]),
+            columns,
+            FEATURE_SCHEMA_VERSION,
+        )
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
-import math
-from datetime import datetime
-from typing import Dict, Optional
+import zlib
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Optional, Sequence
+
+import numpy as np
 
 from state.models import CoreSignal, ExchangeStats, MarketStats
 
@@ -13,49 +16,153 @@ def _ts_to_datetime(ts) -> datetime:
     return datetime.fromisoformat(ts)
 
 
+def to_epoch(ts) -> float:
+    """Epoch-секунды из datetime, ISO-строки или числа; naive время в проекте — UTC (datetime.utcnow())."""
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+
+# Фиксированная схема признаков. Любое изменение состава, порядка или кодировок
+# требует увеличить FEATURE_SCHEMA_VERSION: модели и сегменты хранилища помечаются версией.
+# v2: стабильная кодировка exchange_pair (crc32 вместо рандомизированного hash()).
+FEATURE_SCHEMA_VERSION = 2
+FEATURE_COLUMNS: tuple[str, ...] = (
+    "buy_exchange_score",
+    "exchange_pair",
+    "hour_of_day",
+    "mid_price",
+    "net_profit_bps",
+    "net_profit_usd",
+    "sell_exchange_score",
+    "spread_abs",
+    "spread_bps",
+    "symbol_idx",
+    "volatility_1h",
+    "volume_usd",
+)
+N_FEATURES = len(FEATURE_COLUMNS)
+
+
+@lru_cache(maxsize=4096)
 def _symbol_index(symbol: str) -> int:
     return sum(ord(c) for c in symbol) % 1000
 
 
+@lru_cache(maxsize=4096)
+def _exchange_pair_code(buy_exchange: str, sell_exchange: str) -> int:
+    """Стабильный между процессами код маршрута (crc32, в отличие от hash())."""
+    return zlib.crc32(f"{buy_exchange}>{sell_exchange}".encode("utf-8")) % 10_000
+
+
 def _status_to_score(status: str) -> float:
     mapping = {"excellent": 1.0, "good": 0.8, "warming_up": 0.5, "degraded": 0.2}
     return mapping.get(status, 0.0)
 
 
-def build_signal_features(
+def fill_signal_features(
+    out: np.ndarray,
     signal: CoreSignal,
     market_stats: Optional[Dict[str, MarketStats]] = None,
     exchange_stats: Optional[Dict[str, ExchangeStats]] = None,
-) -> Dict[str, float]:
+):
+    """Пишет признаки сигнала в строку out (длина N_FEATURES, порядок FEATURE_COLUMNS)."""
     dt = _ts_to_datetime(signal.created_at)
     base_mid = (signal.buy_price + signal.sell_price) / 2 if signal.sell_price else 0.0
     spread_bps = (signal.spread / base_mid) * 10_000 if base_mid else 0.0
     net_profit_bps = (signal.net_profit / signal.volume_usd) * 10_000 if signal.volume_usd else 0.0
 
     m_stats = market_stats.get(signal.symbol) if market_stats else None
-    vol = m_stats.volatility_1h if m_stats else 0.0
-    mid = m_stats.last_mid if m_stats else base_mid
-
     buy_stats = exchange_stats.get(signal.buy_exchange) if exchange_stats else None
     sell_stats = exchange_stats.get(signal.sell_exchange) if exchange_stats else None
 
-    feature_map: Dict[str, float] = {
-        "spread_abs": float(signal.spread),
-        "spread_bps": float(spread_bps),
-        "net_profit_usd": float(signal.net_profit),
-        "net_profit_bps": float(net_profit_bps),
-        "volume_usd": float(signal.volume_usd),
-        "symbol_idx": float(_symbol_index(signal.symbol)),
-        "mid_price": float(mid),
-        "volatility_1h": float(vol),
-        "buy_exchange_score": _status_to_score(buy_stats.status) if buy_stats else 0.5,
-        "sell_exchange_score": _status_to_score(sell_stats.status) if sell_stats else 0.5,
-        "exchange_pair": float(hash((signal.buy_exchange, signal.sell_exchange)) % 10_000),
-        "hour_of_day": dt.hour / 24.0,
-    }
-
-    return feature_map
-
-
-def label_from_profit(signal: CoreSignal, profit_threshold: float) -> int:
-    return 1 if signal.net_profit >= profit_threshold else 0
+    out[:] = (
+        _status_to_score(buy_stats.status) if buy_stats else 0.5,
+        _exchange_pair_code(signal.buy_exchange, signal.sell_exchange),
+        dt.hour / 24.0,
+        m_stats.last_mid if m_stats else base_mid,
+        net_profit_bps,
+        signal.net_profit,
+        _status_to_score(sell_stats.status) if sell_stats else 0.5,
+        signal.spread,
+        spread_bps,
+        _symbol_index(signal.symbol),
+        m_stats.volatility_1h if m_stats else 0.0,
+        signal.volume_usd,
+    )
+
+
+def route_feature_matrix(
+    symbol: str,
+    routes: Sequence[str],
+    route_idx: np.ndarray,
+    ts: np.ndarray,
+    buy_price: np.ndarray,
+    sell_price: np.ndarray,
+    net_profit: np.ndarray,
+    volume_usd: float,
+    market_mid: np.ndarray,
+    volatility_1h: np.ndarray,
+    exchange_status: str = "excellent",
+) -> np.ndarray:
+    """
+    Векторный аналог fill_signal_features для сигналов одного символа (реплей
+    бэктеста), колонками NumPy. market_mid / volatility_1h — значения MarketStats
+    на момент строки; exchange_status — статус обеих бирж маршрута (в live он
+    выводится из наличия их книг, а у строки реплея обе книги были).
+    Маршрут строки — routes[route_idx] ("buy>sell"), ts — epoch (UTC).
+    """
+    n = ts.size
+    route_codes = np.array([_exchange_pair_code(*name.split(">")) for name in routes], dtype=float)
+    mid = (buy_price + sell_price) / 2
+    spread = sell_price - buy_price
+    status = _status_to_score(exchange_status)
+    out = np.empty((n, N_FEATURES))
+    out[:, 0] = status
+    out[:, 1] = route_codes[route_idx]
+    out[:, 2] = (np.floor(ts / 3600) % 24) / 24.0
+    out[:, 3] = market_mid
+    out[:, 4] = net_profit / volume_usd * 10_000 if volume_usd else 0.0
+    out[:, 5] = net_profit
+    out[:, 6] = status
+    out[:, 7] = spread
+    out[:, 8] = np.divide(spread, mid, out=np.zeros(n), where=mid != 0) * 10_000
+    out[:, 9] = _symbol_index(symbol)
+    out[:, 10] = volatility_1h
+    out[:, 11] = volume_usd
+    return out
+
+
+def is_current_schema(record: Dict) -> bool:
+    """Запись истории с признаками текущей схемы (записи без версии — схема v1)."""
+    return record.get("schema_version", 1) == FEATURE_SCHEMA_VERSION
+
+
+def features_to_dict(row: Sequence[float]) -> Dict[str, float]:
+    """Строка схемы -> словарь (формат записей истории в Redis)."""
+    return dict(zip(FEATURE_COLUMNS, (float(v) for v in row)))
+
+
+def features_row(features) -> np.ndarray:
+    """Признаки записи истории (строка схемы или словарь старого формата) -> строка FEATURE_COLUMNS."""
+    if isinstance(features, dict):
+        return np.array([features.get(name, 0.0) for name in FEATURE_COLUMNS], dtype=float)
+    return np.asarray(features, dtype=float)
+
+
+def align_columns(X: np.ndarray, order: Sequence[str], target: Sequence[str]) -> np.ndarray:
+    """Переставляет колонки X под порядок модели; отсутствующие признаки = 0."""
+    if list(order) == list(target):
+        return X
+    pos = {name: i for i, name in enumerate(order)}
+    out = np.zeros((X.shape[0], len(target)))
+    for j, name in enumerate(target):
+        i = pos.get(name)
+        if i is not None:
+            out[:, j] = X[:, i]
+    return out
+
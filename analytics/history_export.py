@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import struct
+import sys
+from typing import Any, AsyncIterator, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from analytics.features import to_epoch
+from analytics.history_store import HistoryStore
+from state.npz_codec import pack_snapshot, unpack_snapshot
+
+FORMATS = ("ndjson", "npz")
+
+# Кадр npz-потока: длина blob (uint64 LE) + npz
+_FRAME = struct.Struct("<Q")
+
+_TS_FIELDS = {"signals": "created_at", "spreads": "updated_at"}
+
+
+async def iter_chunks(
+    history: HistoryStore,
+    stream: str,
+    start_ts: float,
+    end_ts: float,
+    symbol: Optional[str] = None,
+    cursor: Optional[str] = None,
+    chunk_size: int = 5000,
+) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+    """
+    Чанки по chunk_size записей (от новых к старым) вместе с курсором продолжения:
+    блоки дискового архива плюс еще не сброшенный хвост горячего списка.
+    В памяти — один чанк; последний курсор None означает, что диапазон выгружен.
+    """
+    if stream == "spreads" and not symbol:
+        raise ValueError("symbol is required for spreads export")
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    reader = await history.open_range(stream, start_ts, end_ts, symbol, cursor)
+    try:
+        while True:
+            items, cursor = await asyncio.to_thread(reader.take, chunk_size)
+            if items or cursor is None:
+                yield items, cursor
+            if cursor is None:
+                return
+    finally:
+        reader.close()
+
+
+def encode_ndjson(items: List[Dict[str, Any]], cursor: Optional[str]) -> bytes:
+    """Строки записей + завершающая строка {"cursor": ...} для продолжения выгрузки."""
+    lines = [json.dumps(r, separators=(",", ":")) for r in items]
+    lines.append(json.dumps({"cursor": cursor}))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def to_columns(items: List[Dict[str, Any]], stream: str) -> Dict[str, np.ndarray]:
+    """
+    Колонки чанка: числа -> float64 (None -> NaN), строки и datetime (ISO) -> unicode.
+    Колонка ts — epoch-секунды записи.
+    """
+    ts_field = _TS_FIELDS[stream]
+    columns: Dict[str, np.ndarray] = {
+        "ts": np.fromiter((to_epoch(r[ts_field]) for r in items), dtype=np.float64, count=len(items))
+    }
+    names = sorted({k for r in items for k in r})
+    for name in names:
+        values = [r.get(name) for r in items]
+        present = [v for v in values if v is not None] # пустая колонка -> NaN
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+            columns[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        else:
+            columns[name] = np.array(["" if v is None else str(v) for v in values])
+    return columns
+
+
+def encode_npz(items: List[Dict[str, Any]], cursor: Optional[str], stream: str) -> bytes:
+    blob = pack_snapshot({"stream": stream, "rows": len(items), "cursor": cursor}, to_columns(items, stream))
+    return _FRAME.pack(len(blob)) + blob
+
+
+def read_npz_chunks(f: BinaryIO) -> Iterator[Tuple[Dict[str, Any], Dict[str, np.ndarray]]]:
+    """Читает npz-выгрузку по одному чанку: (meta с cursor, колонки)."""
+    while True:
+        header = f.read(_FRAME.size)
+        if len(header) < _FRAME.size:
+            return
+        (size,) = _FRAME.unpack(header)
+        yield unpack_snapshot(f.read(size))
+
+
+async def export_stream(
+    history: HistoryStore,
+    stream: str,
+    start_ts: float,
+    end_ts: float,
+    symbol: Optional[str] = None,
+    cursor: Optional[str] = None,
+    fmt: str = "ndjson",
+    chunk_size: int = 5000,
+) -> AsyncIterator[bytes]:
+    """Байтовый поток выгрузки (тело HTTP-ответа или файл)."""
+    async for items, next_cursor in iter_chunks(history, stream, start_ts, end_ts, symbol, cursor, chunk_size):
+        if fmt == "npz":
+            yield encode_npz(items, next_cursor, stream)
+        else:
+            yield encode_ndjson(items, next_cursor)
+
+
+async def _cli(args):
+    from config import CONFIG
+    from state.redis_state import RedisState
+
+    history = HistoryStore(RedisState(CONFIG.redis), CONFIG)
+    out = open(args.out, "ab" if args.cursor else "wb") if args.out != "-" else sys.stdout.buffer
+    rows = 0
+    try:
+        async for items, cursor in iter_chunks(
+            history, args.stream, args.start, args.end, args.symbol, args.cursor, args.chunk_size
+        ):
+            out.write(encode_npz(items, cursor, args.stream) if args.format == "npz" else encode_ndjson(items, cursor))
+            out.flush()
+            rows += len(items)
+            # Курсор после каждого чанка: прерванную выгрузку можно продолжить с --cursor
+            print(f"rows={rows} cursor={cursor}", file=sys.stderr)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming export of signal / spread history")
+    parser.add_argument("stream", choices=("signals", "spreads"))
+    parser.add_argument("--start", type=float, required=True, help="epoch seconds")
+    parser.add_argument("--end", type=float, required=True, help="epoch seconds")
+    parser.add_argument("--symbol")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--cursor", help="resume from cursor (appends to --out)")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--out", default="-")
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
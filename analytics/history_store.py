@@ -1,13 +1,116 @@
+import asyncio
 import json
 import logging
+import time
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
+from analytics.features import FEATURE_SCHEMA_VERSION, to_epoch
+from analytics.segment_store import SegmentStore
 from state.redis_state import _encode, RedisState
-from state.models import CoreSignal
+from state.models import CoreSignal, NormalizedBook, SignalOutcome
 
 log = logging.getLogger("analytics.history_store")
 
+# Устаревшие ZSET-индексы с полными payload (удаляются обслуживанием истории)
+LEGACY_INDEX_PATTERNS = ("history:signals:idx*", "history:spreads:idx:*")
+
+# Очередь сигналов на оценку исхода (ZSET, score = id сигнала)
+PENDING_OUTCOMES = "history:outcomes:pending:by_id"
+# Очередь старого формата (список), переносится в ZSET при старте eval engine
+LEGACY_PENDING_OUTCOMES = "history:outcomes:pending"
+
+
+def encode_cursor(ts: float, skip: int) -> str:
+    return f"{ts!r}:{skip}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Курсор — позиция в диапазоне: (ts последней отданной записи, сколько записей с этим ts пройдено)."""
+    ts, _, skip = cursor.partition(":")
+    return float(ts), int(skip)
+
+
+def _fingerprint(record: Dict[str, Any]) -> str:
+    return json.dumps(record, sort_keys=True)
+
+
+class RangeReader:
+    """
+    Диапазон истории от новых к старым: хвост из Redis, еще не сброшенный на диск,
+    затем дисковый архив. Позиция — курсор "ts:skip": записи с
+    одинаковым ts идут в порядке записи, skip — сколько из них уже пройдено.
+    take() читает сегменты (блокирующий вызов) — из asyncio через to_thread.
+    """
+
+    def __init__(self, records: Iterator[Tuple[float, Dict[str, Any]]], hi: float, skip: int):
+        self._records = records
+        self.hi = hi
+        self.skip = skip
+
+    def take(
+        self,
+        limit: int,
+        match: Optional[Callable[[Dict[str, Any]], bool]] = None,
+        max_scan: Optional[int] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Следующие limit подходящих записей и курсор продолжения (None — диапазон исчерпан)."""
+        result: List[Dict[str, Any]] = []
+        scanned = 0
+        for ts, record in self._records:
+            scanned += 1
+            if ts == self.hi:
+                self.skip += 1
+            else:
+                self.hi, self.skip = ts, 1
+            if match is None or match(record):
+                result.append(record)
+            if len(result) >= limit or (max_scan is not None and scanned >= max_scan):
+                return result, encode_cursor(self.hi, self.skip)
+        return result, None
+
+    def close(self):
+        self._records.close()
+
+
+def _no_records() -> Iterator[Tuple[float, Dict[str, Any]]]:
+    yield from ()
+
+
+def _merge_range(
+    tail: List[Tuple[float, Dict[str, Any]]],
+    disk: Iterator[Tuple[float, Dict[str, Any]]],
+    watermark: float,
+    start_ts: float,
+    hi: float,
+    skip: int,
+) -> Iterator[Tuple[float, Dict[str, Any]]]:
+    """
+    Хвост + диск без дублей: запись, сброшенная между чтением watermark и хвоста,
+    есть в обоих (ts >= watermark) — с диска она пропускается. Затем курсор:
+    ts <= hi, первые skip записей с ts == hi уже отданы.
+    """
+    seen = {_fingerprint(r) for _, r in tail}
+
+    def merged():
+        yield from tail
+        for ts, record in disk:
+            if ts >= watermark and _fingerprint(record) in seen:
+                continue
+            yield ts, record
+
+    try:
+        for ts, record in merged():
+            if ts > hi or ts < start_ts:
+                continue
+            if ts == hi and skip > 0:
+                skip -= 1
+                continue
+            yield ts, record
+    finally:
+        # Закрывает mmap сегментов, если чтение прервано
+        disk.close()
+
 
 class HistoryStore:
     """Lightweight helper to manage bounded historical data in Redis."""
@@ -16,8 +119,88 @@ class HistoryStore:
         self.redis = redis
         self.client = redis.client
         self.cfg = cfg.history
+        # Полный архив на диске; Redis-списки остаются горячим окном последних записей
+        self.disk: Dict[str, SegmentStore] = {}
+        if self.cfg.disk_enabled:
+            self.disk = {s: SegmentStore(self.cfg.disk_path, s, self.cfg) for s in ("signals", "spreads")}
+        self._disk_lock = asyncio.Lock()
         log.debug("HistoryStore initialized with TTL=%s", self.cfg.ttl_sec)
 
+    async def _append_disk(self, stream: str, record: Dict[str, Any]):
+        store = self.disk.get(stream)
+        if store is None or not store.append(record):
+            return
+        async with self._disk_lock:
+            await asyncio.to_thread(store.write, *store.drain())
+
+    async def flush_disk(self, force: bool = False):
+        """Сбрасывает неполные блоки, пролежавшие дольше disk_flush_interval_sec (или все при force)."""
+        for store in self.disk.values():
+            if force or store.due():
+                async with self._disk_lock:
+                    await asyncio.to_thread(store.write, *store.drain())
+
+    async def open_range(
+        self,
+        stream: str,
+        start_ts: float,
+        end_ts: float,
+        symbol: str | None = None,
+        cursor: str | None = None,
+    ) -> RangeReader:
+        """
+        Читатель диапазона [start_ts, end_ts] потока из дискового архива. Записи,
+        которые писатель еще держит в буфере, берутся из горячего списка Redis
+        (он длиннее буфера): сначала читается watermark диска, затем хвост списка
+        новее него — так ни одна запись не теряется между двумя чтениями.
+        Без архива (disk_enabled=False) доступно только окно горячего списка.
+        """
+        hi, skip = decode_cursor(cursor) if cursor else (end_ts, 0)
+        store = self.disk.get(stream)
+        watermark = await asyncio.to_thread(store.watermark) if store else float("-inf")
+        tail = await self._hot_tail(stream, symbol, max(watermark, start_ts))
+        disk = store.iter_range(start_ts, hi, symbol, newest_first=True) if store else _no_records()
+        return RangeReader(_merge_range(tail, disk, watermark, start_ts, hi, skip), hi, skip)
+
+    async def _hot_tail(
+        self, stream: str, symbol: str | None, since_ts: float, page: int = 500
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """(ts, запись) горячего списка с головы до первой записи старше since_ts."""
+        key = "history:signals" if stream == "signals" else f"history:spreads:{symbol}"
+        ts_field = self.cfg.disk_ts_fields[stream]
+        result: List[Tuple[float, Dict[str, Any]]] = []
+        offset = 0
+        while True:
+            raw = await self.client.lrange(key, offset, offset + page - 1)
+            for item in raw:
+                record = json.loads(item)
+                ts = to_epoch(record[ts_field])
+                if ts < since_ts:
+                    return result
+                if stream == "spreads":
+                    record.setdefault("symbol", symbol)
+                if symbol is None or record.get("symbol") == symbol:
+                    result.append((ts, record))
+            if len(raw) < page:
+                return result
+            offset += page
+
+    async def _query_range(
+        self,
+        stream: str,
+        start_ts: float,
+        end_ts: float,
+        symbol: str | None,
+        match: Callable[[Dict[str, Any]], bool],
+        limit: int,
+        cursor: str | None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        reader = await self.open_range(stream, start_ts, end_ts, symbol, cursor)
+        try:
+            return await asyncio.to_thread(reader.take, limit, match, self.cfg.query_max_scan)
+        finally:
+            reader.close()
+
 
     # ------------------------
     # Signals
@@ -28,15 +211,18 @@ class HistoryStore:
             return
 
         # Важно: используем _encode для корректной сериализации datetime
-        record = _encode(signal) 
-        
-        await self.client.lpush("history:signals", json.dumps(record))
+        record = _encode(signal)
+        payload = json.dumps(record)
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lpush("history:signals", payload)
         # Обрезаем список до максимальной длины
-        await self.client.ltrim("history:signals", 0, self.cfg.signals_max_len - 1)
-        
+        pipe.ltrim("history:signals", 0, self.cfg.signals_max_len - 1)
         if self.cfg.ttl_sec:
             # Устанавливаем TTL для очистки старых данных
-            await self.client.expire("history:signals", self.cfg.ttl_sec)
+            pipe.expire("history:signals", self.cfg.ttl_sec)
+        await pipe.execute()
+        await self._append_disk("signals", record)
 
 
     async def recent_signals(self, limit: int) -> List[Dict[str, Any]]:
@@ -45,6 +231,72 @@ class HistoryStore:
         return [json.loads(item) for item in raw]
 
 
+    async def query_signals(
+        self,
+        start_ts: float,
+        end_ts: float,
+        symbol: str | None = None,
+        buy_exchange: str | None = None,
+        sell_exchange: str | None = None,
+        min_profit: float | None = None,
+        limit: int = 100,
+        cursor: str | None = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Сигналы за [start_ts, end_ts] (от новых к старым) и курсор следующей страницы.
+        Фильтры, которых нет в индексе архива (маршрут, прибыль), применяются к записям
+        диапазона; за запрос просматривается не больше query_max_scan записей — если
+        страница не набралась, курсор все равно продвигается. None — диапазон исчерпан.
+        """
+
+        def match(r: Dict[str, Any]) -> bool:
+            return (
+                (buy_exchange is None or r.get("buy_exchange") == buy_exchange)
+                and (sell_exchange is None or r.get("sell_exchange") == sell_exchange)
+                and (min_profit is None or (r.get("net_profit") or 0.0) >= min_profit)
+            )
+
+        return await self._query_range("signals", start_ts, end_ts, symbol, match, limit, cursor)
+
+    async def signals_after(self, after_id: int | None, max_items: int) -> List[Dict[str, Any]]:
+        """Сигналы с id больше after_id (от новых к старым); id монотонен (state:signals:seq)."""
+
+        def seen(record: Dict[str, Any]) -> bool:
+            return after_id is not None and (record.get("id") or 0) <= after_id
+
+        return await self._records_until("history:signals", seen, max_items)
+
+    async def _records_since(
+        self, key: str, after: datetime | None, max_items: int
+    ) -> List[Dict[str, Any]]:
+        """Записи списка с `created_at` новее `after`, постранично с головы списка."""
+
+        def seen(record: Dict[str, Any]) -> bool:
+            return after is not None and datetime.fromisoformat(record["created_at"]) <= after
+
+        return await self._records_until(key, seen, max_items)
+
+    async def _records_until(
+        self, key: str, seen: Callable[[Dict[str, Any]], bool], max_items: int, page: int = 500
+    ) -> List[Dict[str, Any]]:
+        """Записи с головы списка до первой уже виденной (seen), постранично."""
+        result: List[Dict[str, Any]] = []
+        offset = 0
+        while len(result) < max_items:
+            raw = await self.client.lrange(key, offset, offset + page - 1)
+            if not raw:
+                break
+            for item in raw:
+                record = json.loads(item)
+                if seen(record):
+                    return result
+                result.append(record)
+                if len(result) >= max_items:
+                    return result
+            offset += page
+        return result
+
+
     # ------------------------
     # Spreads (для расчетов волатильности)
     # ------------------------
@@ -54,17 +306,53 @@ class HistoryStore:
             return
 
         key = f"history:spreads:{symbol}"
-        payload = _encode(snapshot)
-        await self.client.lpush(key, json.dumps(payload))
-        await self.client.ltrim(key, 0, self.cfg.spreads_max_len - 1)
+        record = _encode(snapshot)
+        payload = json.dumps(record)
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lpush(key, payload)
+        pipe.ltrim(key, 0, self.cfg.spreads_max_len - 1)
         if self.cfg.ttl_sec:
-            await self.client.expire(key, self.cfg.ttl_sec)
+            pipe.expire(key, self.cfg.ttl_sec)
+        await pipe.execute()
+        await self._append_disk("spreads", {"symbol": symbol, **record})
 
     async def recent_spreads(self, symbol: str, limit: int) -> List[Dict[str, Any]]:
         """Получает последние N снимков спредов для символа."""
         raw = await self.client.lrange(f"history:spreads:{symbol}", 0, limit - 1)
         return [json.loads(item) for item in raw]
 
+    async def query_spreads(
+        self,
+        symbol: str,
+        start_ts: float,
+        end_ts: float,
+        buy_exchange: str | None = None,
+        sell_exchange: str | None = None,
+        min_spread_bps: float | None = None,
+        limit: int = 100,
+        cursor: str | None = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Снимки спредов символа за [start_ts, end_ts] и курсор следующей страницы (как query_signals)."""
+
+        def match(r: Dict[str, Any]) -> bool:
+            return (
+                (buy_exchange is None or r.get("buy_exchange") == buy_exchange)
+                and (sell_exchange is None or r.get("sell_exchange") == sell_exchange)
+                and (min_spread_bps is None or (r.get("spread_bps") or 0.0) >= min_spread_bps)
+            )
+
+        return await self._query_range("spreads", start_ts, end_ts, symbol, match, limit, cursor)
+
+    async def drop_legacy_indexes(self) -> int:
+        """Удаляет ZSET-индексы старого формата (полные payload за 7 дней в памяти Redis)."""
+        dropped = 0
+        for pattern in LEGACY_INDEX_PATTERNS:
+            keys = [key async for key in self.client.scan_iter(match=pattern, count=500)]
+            if keys:
+                dropped += await self.client.delete(*keys)
+        return dropped
+
     # ------------------------
     # Features (для ML)
     # ------------------------
@@ -85,7 +373,144 @@ class HistoryStore:
         if self.cfg.ttl_sec:
             await self.client.expire("history:features:signals", self.cfg.ttl_sec)
 
+    async def append_labeled_features(self, items: List[Tuple[Dict[str, float], int]]):
+        """Пачкой добавляет размеченные признаки текущей схемы (одним pipeline)."""
+        if not self.cfg.enabled or not items:
+            return
+
+        now = datetime.utcnow().isoformat()
+        records = [
+            json.dumps({"features": f, "label": label, "created_at": now, "schema_version": FEATURE_SCHEMA_VERSION})
+            for f, label in items
+        ]
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lpush("history:features:signals", *records)
+        pipe.ltrim("history:features:signals", 0, self.cfg.features_max_len - 1)
+        if self.cfg.ttl_sec:
+            pipe.expire("history:features:signals", self.cfg.ttl_sec)
+        await pipe.execute()
+
+    async def features_since(self, after: datetime | None, max_items: int) -> List[Dict[str, Any]]:
+        """Записи признаков новее `after` (от новых к старым)."""
+        return await self._records_since("history:features:signals", after, max_items)
+
     async def recent_features(self, limit: int) -> List[Dict[str, Any]]:
         """Получает последние N записей признаков."""
         raw = await self.client.lrange("history:features:signals", 0, limit - 1)
-        return [json.loads(item) for item in raw]
\ No newline at end of file
+        return [json.loads(item) for item in raw]
+
+    # ------------------------
+    # Books (для оценки исходов сигналов)
+    # ------------------------
+    async def append_books(self, symbol: str, books: Dict[str, NormalizedBook], ts: float | None = None):
+        """Добавляет компактный снимок стаканов символа: {"ts": epoch, "books": {ex: [bid, ask]}}."""
+        if not self.cfg.enabled:
+            return
+
+        key = f"history:books:{symbol}"
+        record = {
+            "ts": ts if ts is not None else time.time(),
+            "books": {ex: [b.bid, b.ask] for ex, b in books.items()},
+        }
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lpush(key, json.dumps(record))
+        pipe.ltrim(key, 0, self.cfg.books_max_len - 1)
+        if self.cfg.ttl_sec:
+            pipe.expire(key, self.cfg.ttl_sec)
+        await pipe.execute()
+
+    async def recent_books(self, symbol: str, limit: int) -> List[Dict[str, Any]]:
+        """Получает последние N снимков стаканов (от новых к старым)."""
+        raw = await self.client.lrange(f"history:books:{symbol}", 0, limit - 1)
+        return [json.loads(item) for item in raw]
+
+    async def books_since(self, symbol: str, since_ts: float, page: int = 16) -> List[Dict[str, Any]]:
+        """Снимки стаканов новее since_ts (от старых к новым): страницы с головы списка."""
+        result: List[Dict[str, Any]] = []
+        offset = 0
+        while offset < self.cfg.books_max_len:
+            raw = await self.client.lrange(f"history:books:{symbol}", offset, offset + page - 1)
+            for item in raw:
+                snap = json.loads(item)
+                if snap["ts"] <= since_ts:
+                    return result[::-1]
+                result.append(snap)
+            if len(raw) < page:
+                break
+            offset += page
+        return result[::-1]
+
+    # ------------------------
+    # Outcomes (исходы сигналов)
+    # ------------------------
+    async def append_pending_outcome(self, signal: CoreSignal, features: Sequence[float]):
+        """
+        Ставит сигнал в очередь на оценку исхода: ZSET score = id сигнала (сигнал уже
+        записан через push_signal). При переполнении вытесняются самые старые.
+        features — строка признаков в порядке FEATURE_COLUMNS (версия схемы в записи).
+        """
+        if not self.cfg.enabled:
+            return
+
+        record = {"signal": _encode(signal), "features": [float(v) for v in features], "schema_version": FEATURE_SCHEMA_VERSION}
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zadd(PENDING_OUTCOMES, {json.dumps(record): signal.id})
+        pipe.zremrangebyrank(PENDING_OUTCOMES, 0, -(self.cfg.pending_outcomes_max_len + 1))
+        await pipe.execute()
+
+    async def oldest_pending_outcomes(self, limit: int) -> List[Dict[str, Any]]:
+        """Возвращает до N самых старых ожидающих сигналов (от старых к новым)."""
+        raw = await self.client.zrange(PENDING_OUTCOMES, 0, limit - 1)
+        return [json.loads(item) for item in raw]
+
+    async def drop_pending_outcomes(self, ids: List[int]):
+        """
+        Удаляет из очереди оцененные сигналы по id (score). Удаление точечное, поэтому
+        параллельная запись, вытеснение по лимиту и еще не созревшие записи между
+        оцененными не задеваются.
+        """
+        if not ids:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for signal_id in ids:
+            pipe.zremrangebyscore(PENDING_OUTCOMES, signal_id, signal_id)
+        await pipe.execute()
+
+    async def migrate_legacy_pending(self) -> int:
+        """
+        Переносит очередь старого формата (список history:outcomes:pending) в ZSET по id
+        и удаляет список. Записи без id сигнала оценить по новой схеме нельзя — отбрасываются.
+        """
+        raw = await self.client.lrange(LEGACY_PENDING_OUTCOMES, 0, -1)
+        moved = {}
+        for item in raw:
+            try:
+                signal_id = json.loads(item)["signal"].get("id")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                continue
+            if signal_id is not None:
+                moved[item] = signal_id
+        pipe = self.client.pipeline(transaction=True)
+        if moved:
+            pipe.zadd(PENDING_OUTCOMES, moved)
+            pipe.zremrangebyrank(PENDING_OUTCOMES, 0, -(self.cfg.pending_outcomes_max_len + 1))
+        pipe.delete(LEGACY_PENDING_OUTCOMES)
+        await pipe.execute()
+        return len(moved)
+
+    async def append_outcomes(self, outcomes: List[SignalOutcome]):
+        """Сохраняет пачку исходов в `history:outcomes` одним pipeline."""
+        if not self.cfg.enabled or not outcomes:
+            return
+
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lpush("history:outcomes", *[json.dumps(_encode(o)) for o in outcomes])
+        pipe.ltrim("history:outcomes", 0, self.cfg.outcomes_max_len - 1)
+        if self.cfg.ttl_sec:
+            pipe.expire("history:outcomes", self.cfg.ttl_sec)
+        await pipe.execute()
+
+    async def recent_outcomes(self, limit: int) -> List[Dict[str, Any]]:
+        """Получает последние N исходов сигналов."""
+        raw = await self.client.lrange("history:outcomes", 0, limit - 1)
+        return [json.loads(item) for item in raw]
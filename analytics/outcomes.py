@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+import numpy as np
+
+from analytics.feature_store import FeatureStore
+from analytics.features import FEATURE_COLUMNS, features_row, features_to_dict, is_current_schema, to_epoch
+from analytics.history_store import HistoryStore
+from core.signal_math import route_metrics
+from state.models import SignalOutcome
+
+log = logging.getLogger("analytics.outcomes")
+
+
+def horizon_key(horizon_sec: float) -> str:
+    return f"{horizon_sec:g}s"
+
+
+class BookSeries(NamedTuple):
+    ts: np.ndarray   # (S,) время снимков, по возрастанию
+    bid: np.ndarray  # (E, S), NaN если биржи не было в снимке
+    ask: np.ndarray  # (E, S)
+
+
+def build_book_series(snapshots: List[Dict[str, Any]], exchange_index: Dict[str, int]) -> BookSeries:
+    """Превращает снимки из `history:books:{symbol}` (новые первыми) в плотные массивы."""
+    ordered = sorted(snapshots, key=lambda s: s["ts"])
+    n_ex, n_snap = len(exchange_index), len(ordered)
+    ts = np.fromiter((s["ts"] for s in ordered), dtype=float, count=n_snap)
+    bid = np.full((n_ex, n_snap), np.nan)
+    ask = np.full((n_ex, n_snap), np.nan)
+    for j, snap in enumerate(ordered):
+        for ex, (b, a) in snap["books"].items():
+            i = exchange_index.get(ex)
+            if i is not None:
+                bid[i, j] = b
+                ask[i, j] = a
+    return BookSeries(ts, bid, ask)
+
+
+def evaluate_routes(
+    series: BookSeries,
+    t0: np.ndarray,
+    buy_idx: np.ndarray,
+    sell_idx: np.ndarray,
+    horizons: Sequence[float],
+    volume_usd: np.ndarray,
+    fee_rate: np.ndarray,
+    slippage_rate: np.ndarray,
+    max_gap_sec: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Векторное соединение сигналов одного символа с последующими снимками стаканов.
+
+    Возвращает:
+      survival (N,)   — секунды до первого снимка, где спред маршрута <= 0 (NaN — не закрылся в окне);
+      profit   (N, H) — чистая прибыль маршрута на каждом горизонте (NaN — нет свежего снимка).
+    Снимок без одной из книг маршрута (NaN) — пропуск данных, а не закрытие спреда.
+    """
+    ts = series.ts
+    n_snap = ts.size
+    n_sig = t0.size
+    survival = np.full(n_sig, np.nan)
+    profit = np.full((n_sig, len(horizons)), np.nan)
+    if n_snap == 0 or n_sig == 0:
+        return survival, profit
+
+    # Спред по каждому уникальному маршруту: (R, S)
+    n_ex = series.bid.shape[0]
+    route_code = buy_idx * n_ex + sell_idx
+    routes, route_of_sig = np.unique(route_code, return_inverse=True)
+    route_spread = series.bid[routes % n_ex] - series.ask[routes // n_ex]
+
+    # Индекс ближайшего закрытия спреда (<= 0) начиная с каждого снимка
+    closed = route_spread <= 0
+    close_idx = np.where(closed, np.arange(n_snap), n_snap)
+    next_close = np.minimum.accumulate(close_idx[:, ::-1], axis=1)[:, ::-1]
+
+    start = np.searchsorted(ts, t0, side="left")
+    has_start = start < n_snap
+    nc = np.full(n_sig, n_snap)
+    nc[has_start] = next_close[route_of_sig[has_start], start[has_start]]
+    closed_in_window = nc < n_snap
+    survival[closed_in_window] = np.maximum(ts[nc[closed_in_window]] - t0[closed_in_window], 0.0)
+
+    for h_pos, h in enumerate(horizons):
+        target = t0 + h
+        j = np.searchsorted(ts, target, side="right") - 1
+        # Снимок не раньше сигнала: иначе короткий горизонт при большом max_gap
+        # оценивался бы по стакану до появления сигнала
+        valid = (j >= start) & (target - ts[np.clip(j, 0, None)] <= max_gap_sec)
+        jv = j[valid]
+        _, _, net, _ = route_metrics(
+            series.ask[buy_idx[valid], jv],
+            series.bid[sell_idx[valid], jv],
+            volume_usd[valid],
+            fee_rate[valid],
+            slippage_rate[valid],
+        )
+        profit[valid, h_pos] = net
+
+    return survival, profit
+
+
+class OutcomeEvaluator:
+    """
+    Оценивает исходы сигналов из очереди `history:outcomes:pending:by_id`:
+    сколько прожил спред и какая прибыль оставалась на горизонтах 1s/5s/30s.
+    Исход на label-горизонте становится меткой ML-записи признаков.
+    """
+
+    def __init__(self, history: HistoryStore, cfg):
+        self.history = history
+        self.cfg = cfg.eval
+        self.feature_store = FeatureStore(cfg)
+        self.books_limit = cfg.history.books_max_len
+        self.exchange_index = {ex: i for i, ex in enumerate(cfg.collector.cex_exchanges)}
+        self.horizons = sorted(set(self.cfg.outcome_horizons_sec) | {self.cfg.outcome_label_horizon_sec})
+        self.label_pos = self.horizons.index(self.cfg.outcome_label_horizon_sec)
+
+    def _is_mature(self, item: Dict[str, Any], now: float, latest_ts: Dict[str, float]) -> bool:
+        """Все горизонты сигнала уже покрыты снимками его символа (или истекли)."""
+        sig = item["signal"]
+        due = to_epoch(sig["created_at"]) + self.horizons[-1]
+        covered = latest_ts.get(sig["symbol"], 0.0) >= due
+        return covered or now >= due + self.cfg.outcome_max_gap_sec
+
+    async def run_batch(self) -> int:
+        pending = await self.history.oldest_pending_outcomes(self.cfg.outcome_batch_size)
+        if not pending:
+            return 0
+
+        symbols = {item["signal"]["symbol"] for item in pending}
+        series: Dict[str, BookSeries] = {}
+        for symbol in symbols:
+            snaps = await self.history.recent_books(symbol, self.books_limit)
+            series[symbol] = build_book_series(snaps, self.exchange_index)
+        latest_ts = {s: float(b.ts[-1]) for s, b in series.items() if b.ts.size}
+
+        # Не префикс очереди: отстающий символ не задерживает созревшие сигналы остальных
+        now = time.time()
+        mature = [item for item in pending if self._is_mature(item, now, latest_ts)]
+        if not mature:
+            return 0
+
+        by_symbol: Dict[str, List[Dict[str, Any]]] = {}
+        for item in mature:
+            by_symbol.setdefault(item["signal"]["symbol"], []).append(item)
+
+        outcomes: List[SignalOutcome] = []
+        # Строки признаков (FEATURE_COLUMNS) и метки для обучения
+        rows: List[np.ndarray] = []
+        labels: List[int] = []
+        for symbol, items in by_symbol.items():
+            known = [it for it in items
+                     if it["signal"]["buy_exchange"] in self.exchange_index
+                     and it["signal"]["sell_exchange"] in self.exchange_index]
+            if not known:
+                continue
+            sigs = [it["signal"] for it in known]
+            survival, profit = evaluate_routes(
+                series[symbol],
+                t0=np.array([to_epoch(s["created_at"]) for s in sigs]),
+                buy_idx=np.array([self.exchange_index[s["buy_exchange"]] for s in sigs]),
+                sell_idx=np.array([self.exchange_index[s["sell_exchange"]] for s in sigs]),
+                horizons=self.horizons,
+                volume_usd=np.array([s["volume_usd"] for s in sigs], dtype=float),
+                fee_rate=np.array([s["fee_rate"] for s in sigs], dtype=float),
+                slippage_rate=np.array([s["slippage_rate"] for s in sigs], dtype=float),
+                max_gap_sec=self.cfg.outcome_max_gap_sec,
+            )
+
+            label_profit = profit[:, self.label_pos]
+            for n, (item, sig) in enumerate(zip(known, sigs)):
+                label = None if np.isnan(label_profit[n]) else int(label_profit[n] > 0)
+                outcomes.append(
+                    SignalOutcome(
+                        symbol=symbol,
+                        buy_exchange=sig["buy_exchange"],
+                        sell_exchange=sig["sell_exchange"],
+                        signal_created_at=sig["created_at"],
+                        entry_net_profit=sig["net_profit"],
+                        survival_sec=None if np.isnan(survival[n]) else float(survival[n]),
+                        profit_at={
+                            horizon_key(h): None if np.isnan(v) else float(v)
+                            for h, v in zip(self.horizons, profit[n])
+                        },
+                        label=label,
+                    )
+                )
+                # Признаки старой схемы в обучение не идут
+                if label is not None and item.get("features") and is_current_schema(item):
+                    rows.append(features_row(item["features"]))
+                    labels.append(label)
+
+        await self.history.append_outcomes(outcomes)
+        await self.history.append_labeled_features([(features_to_dict(row), label) for row, label in zip(rows, labels)])
+        if self.feature_store.cfg.enabled and rows:
+            await asyncio.to_thread(self.feature_store.append_matrix, np.vstack(rows), np.array(labels), FEATURE_COLUMNS)
+        await self.history.drop_pending_outcomes([item["signal"]["id"] for item in mature])
+        log.debug("Evaluated %d signal outcomes (%d labeled)", len(outcomes), len(labels))
+        return len(mature)
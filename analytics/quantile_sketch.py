@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+
+class KLLSketch:
+    """
+    Потоковый квантильный скетч KLL (Karnin–Lang–Liberty).
+
+    Память O(k), вставка амортизированно O(1), запрос квантиля не зависит от
+    числа наблюдений. Компакция детерминирована (чередование чётных/нечётных),
+    поэтому одинаковый поток даёт одинаковый результат.
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.n = 0
+        self.levels: List[List[float]] = [[]]
+        self._offset = 0
+        self._size = 0
+        self._max_size = self._capacity(0)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(self.k * (2.0 / 3.0) ** depth))
+
+    def _recount(self):
+        self._size = sum(len(level) for level in self.levels)
+        self._max_size = sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def update(self, value: float):
+        self.levels[0].append(float(value))
+        self.n += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def _compress(self):
+        for h in range(len(self.levels)):
+            if len(self.levels[h]) >= self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append([])
+                items = sorted(self.levels[h])
+                # При нечётной длине один элемент остаётся на текущем уровне
+                keep = [items.pop()] if len(items) % 2 else []
+                self.levels[h + 1].extend(items[self._offset::2])
+                self._offset ^= 1
+                self.levels[h] = keep
+                self._recount()
+                if self._size < self._max_size:
+                    break
+
+    def merge(self, other: "KLLSketch"):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.n += other.n
+        self._recount()
+        while self._size >= self._max_size:
+            self._compress()
+
+    def quantile(self, q: float) -> float | None:
+        weighted = sorted(
+            (value, 1 << h) for h, items in enumerate(self.levels) for value in items
+        )
+        if not weighted:
+            return None
+        total = sum(w for _, w in weighted)
+        target = q * total
+        acc = 0
+        for value, weight in weighted:
+            acc += weight
+            if acc >= target:
+                return value
+        return weighted[-1][0]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"k": self.k, "n": self.n, "levels": self.levels, "offset": self._offset}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KLLSketch":
+        sketch = cls(data.get("k", 200))
+        sketch.n = data.get("n", 0)
+        sketch.levels = [list(level) for level in data.get("levels", [[]])] or [[]]
+        sketch._offset = data.get("offset", 0)
+        sketch._recount()
+        return sketch
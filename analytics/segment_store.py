@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from analytics.features import to_epoch
+
+log = logging.getLogger("analytics.segment_store")
+
+# Разреженный индекс: одна запись на сжатый блок
+INDEX_DTYPE = np.dtype(
+    [("first_ts", "<f8"), ("last_ts", "<f8"), ("offset", "<u8"), ("length", "<u4"), ("count", "<u4")]
+)
+
+
+class _Segment:
+    """
+    Сегмент потока: seg-<start>.dat (сжатые zlib-блоки JSON-строк), .idx (INDEX_DTYPE
+    на блок) и .meta (JSON: границы по времени, postings символ -> номера блоков,
+    флаги sealed/compacted). Порядок записи dat -> idx -> meta: читатель по индексу
+    никогда не видит недописанный блок.
+    """
+
+    def __init__(self, base: str):
+        self.base = base
+        self.meta_path = base + ".meta"
+        self.meta: Dict[str, Any] = {}
+
+    @property
+    def dat(self) -> str:
+        return self.base + ".dat"
+
+    @property
+    def idx(self) -> str:
+        return self.base + ".idx"
+
+    def load_meta(self) -> "_Segment":
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        return self
+
+    def write_meta(self):
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp, self.meta_path)
+
+    def index(self) -> np.ndarray:
+        if not os.path.exists(self.idx):
+            return np.empty(0, dtype=INDEX_DTYPE)
+        size = os.path.getsize(self.idx) // INDEX_DTYPE.itemsize
+        if size == 0:
+            return np.empty(0, dtype=INDEX_DTYPE)
+        return np.memmap(self.idx, dtype=INDEX_DTYPE, mode="r", shape=(size,))
+
+
+def _encode_block(records: List[Dict[str, Any]]) -> bytes:
+    return zlib.compress("\n".join(json.dumps(r, separators=(",", ":")) for r in records).encode("utf-8"), 6)
+
+
+def _decode_block(data) -> List[Dict[str, Any]]:
+    return [json.loads(line) for line in zlib.decompress(data).decode("utf-8").split("\n")]
+
+
+class SegmentStore:
+    """
+    Append-only история одного потока (signals, spreads) на диске.
+
+    Записи буферизуются и сбрасываются сжатыми блоками (block_records или
+    flush_interval_sec). Сегмент ротируется по времени/размеру. Запрос диапазона
+    бинарным поиском по индексу выбирает блоки, postings отсекают блоки без символа,
+    данные читаются через mmap. Фоновое обслуживание: retention и компакция
+    закрытых сегментов в крупные блоки.
+
+    Писатель у потока один (движок, который его производит); читателей — сколько угодно.
+    """
+
+    def __init__(self, root: str, stream: str, cfg):
+        self.cfg = cfg
+        self.dir = os.path.join(root, stream)
+        self.stream = stream
+        self._active: Optional[_Segment] = None
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_ts: List[float] = []
+        self._buffer_since = 0.0
+        self._ts_field = cfg.disk_ts_fields.get(stream, "created_at")
+
+    # ------------------------
+    # Запись
+    # ------------------------
+    def append(self, record: Dict[str, Any], ts: Optional[float] = None) -> bool:
+        """Буферизует запись; True — буфер пора сбросить (drain + write)."""
+        if not self._buffer:
+            self._buffer_since = time.monotonic()
+        self._buffer.append(record)
+        self._buffer_ts.append(to_epoch(record[self._ts_field]) if ts is None else ts)
+        return self.due()
+
+    def due(self) -> bool:
+        return bool(self._buffer) and (
+            len(self._buffer) >= self.cfg.disk_block_records
+            or time.monotonic() - self._buffer_since >= self.cfg.disk_flush_interval_sec
+        )
+
+    def drain(self) -> tuple[List[Dict[str, Any]], List[float]]:
+        """Забирает буфер целиком (дешево, можно вызывать из event loop)."""
+        records, stamps = self._buffer, self._buffer_ts
+        self._buffer, self._buffer_ts = [], []
+        return records, stamps
+
+    def write(self, records: List[Dict[str, Any]], stamps: List[float]):
+        """Пишет блок на диск (блокирующий вызов — из asyncio через to_thread)."""
+        if not records:
+            return
+        seg = self._writable_segment(stamps[0])
+        self._write_block(seg, records, stamps)
+        seg.write_meta()
+
+    def flush(self):
+        self.write(*self.drain())
+
+    def _write_block(self, seg: _Segment, records: List[Dict[str, Any]], stamps: List[float]):
+        blob = _encode_block(records)
+        with open(seg.dat, "ab") as f:
+            offset = f.tell()
+            f.write(blob)
+        entry = np.array(
+            [(min(stamps), max(stamps), offset, len(blob), len(records))], dtype=INDEX_DTYPE
+        )
+        with open(seg.idx, "ab") as f:
+            f.write(entry.tobytes())
+
+        meta = seg.meta
+        block_id = meta["blocks"]
+        for symbol in {r.get("symbol") for r in records if r.get("symbol")}:
+            meta["postings"].setdefault(symbol, []).append(block_id)
+        meta["blocks"] = block_id + 1
+        meta["records"] += len(records)
+        meta["bytes"] = offset + len(blob)
+        meta["first_ts"] = min(meta["first_ts"] or stamps[0], min(stamps))
+        meta["last_ts"] = max(meta["last_ts"] or stamps[0], max(stamps))
+
+    def _writable_segment(self, ts: float) -> _Segment:
+        seg = self._active
+        if seg is None:
+            # После рестарта незакрытый сегмент предыдущего писателя закрывается
+            for old in self.segments():
+                if not old.meta.get("sealed"):
+                    old.meta["sealed"] = True
+                    old.write_meta()
+        elif (
+            ts - seg.meta["created_ts"] >= self.cfg.disk_segment_sec
+            or seg.meta["bytes"] >= self.cfg.disk_segment_bytes
+        ):
+            seg.meta["sealed"] = True
+            seg.write_meta()
+            seg = None
+
+        if seg is None:
+            os.makedirs(self.dir, exist_ok=True)
+            seg = _Segment(os.path.join(self.dir, f"seg-{ts:017.6f}"))
+            seg.meta = {
+                "created_ts": ts,
+                "first_ts": None,
+                "last_ts": None,
+                "blocks": 0,
+                "records": 0,
+                "bytes": 0,
+                "postings": {},
+                "sealed": False,
+                "compacted": False,
+            }
+            self._active = seg
+        return seg
+
+    # ------------------------
+    # Чтение
+    # ------------------------
+    def _scan(self) -> List[_Segment]:
+        """Все сегменты с meta на диске, включая исходники, уже замененные компактной копией."""
+        if not os.path.isdir(self.dir):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.dir)):
+            if name.startswith("seg-") and name.endswith(".meta"):
+                try:
+                    result.append(_Segment(os.path.join(self.dir, name[: -len(".meta")])).load_meta())
+                except (OSError, ValueError) as exc:
+                    log.warning("Skipping unreadable segment meta %s: %s", name, exc)
+        return result
+
+    @staticmethod
+    def _replaced(segments: List[_Segment]) -> set:
+        return {s.meta.get("replaces") for s in segments if s.meta.get("replaces")}
+
+    def segments(self) -> List[_Segment]:
+        """Сегменты потока по возрастанию времени начала."""
+        result = self._scan()
+        # Компактная копия уже опубликована, а исходник еще не удален — берем копию
+        replaced = self._replaced(result)
+        return [s for s in result if os.path.basename(s.base) not in replaced]
+
+    def watermark(self) -> float:
+        """Время самой новой записи на диске (-inf, если архив пуст)."""
+        stamps = [s.meta["last_ts"] for s in self.segments() if s.meta["last_ts"] is not None]
+        return max(stamps, default=float("-inf"))
+
+    def _blocks(self, seg: _Segment, start_ts: float, end_ts: float, symbol: Optional[str]) -> np.ndarray:
+        index = seg.index()
+        if index.size == 0:
+            return np.empty(0, dtype=np.int64)
+        # Блоки пишутся по времени: first_ts не убывает, last_ts ограничен сверху
+        hi = int(np.searchsorted(index["first_ts"], end_ts, side="right"))
+        candidates = np.arange(hi)
+        candidates = candidates[index["last_ts"][:hi] >= start_ts]
+        if symbol is not None:
+            posted = np.asarray(seg.meta["postings"].get(symbol, []), dtype=np.int64)
+            # Блоки, дописанные после последнего meta, проверяются без postings
+            unindexed = candidates[candidates >= seg.meta["blocks"]]
+            candidates = np.union1d(np.intersect1d(candidates, posted), unindexed)
+        return candidates
+
+    def iter_range(
+        self,
+        start_ts: float,
+        end_ts: float,
+        symbol: Optional[str] = None,
+        newest_first: bool = False,
+    ) -> Iterator[tuple[float, Dict[str, Any]]]:
+        """(ts, record) в диапазоне [start_ts, end_ts], блоками через mmap."""
+        segments = [
+            s for s in self.segments()
+            if s.meta["first_ts"] is not None and s.meta["last_ts"] >= start_ts and s.meta["first_ts"] <= end_ts
+        ]
+        if newest_first:
+            segments.reverse()
+        ts_field = self._ts_field
+
+        for seg in segments:
+            blocks = self._blocks(seg, start_ts, end_ts, symbol)
+            if blocks.size == 0:
+                continue
+            index = seg.index()
+            try:
+                f = open(seg.dat, "rb")
+            except FileNotFoundError:
+                # Сегмент удалили (retention/компакция) между листингом и чтением
+                continue
+            with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for b in blocks[::-1] if newest_first else blocks:
+                    entry = index[b]
+                    records = _decode_block(data[entry["offset"] : entry["offset"] + entry["length"]])
+                    if newest_first:
+                        records.reverse()
+                    for record in records:
+                        if symbol is not None and record.get("symbol") != symbol:
+                            continue
+                        ts = to_epoch(record[ts_field])
+                        if start_ts <= ts <= end_ts:
+                            yield ts, record
+
+    def query(
+        self,
+        start_ts: float,
+        end_ts: float,
+        symbol: Optional[str] = None,
+        limit: Optional[int] = None,
+        newest_first: bool = False,
+    ) -> List[Dict[str, Any]]:
+        result = []
+        for _, record in self.iter_range(start_ts, end_ts, symbol, newest_first):
+            result.append(record)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    # ------------------------
+    # Обслуживание
+    # ------------------------
+    def enforce_retention(self, now: Optional[float] = None) -> int:
+        """
+        Удаляет сегменты старше disk_retention_sec и исходники, уже замененные
+        компактной копией (остаются, если компакция упала до удаления или файл
+        был занят). Неудавшееся удаление повторяется на следующем проходе.
+        """
+        cutoff = (time.time() if now is None else now) - self.cfg.disk_retention_sec
+        segments = self._scan()
+        replaced = self._replaced(segments)
+        dropped = 0
+        for seg in segments:
+            expired = seg.meta.get("sealed") and seg.meta["last_ts"] is not None and seg.meta["last_ts"] < cutoff
+            if (expired or os.path.basename(seg.base) in replaced) and _remove_segment(seg):
+                dropped += 1
+        return dropped
+
+    def compact(self) -> int:
+        """
+        Переписывает закрытые сегменты крупными блоками (лучше сжатие, меньше индекс).
+        Копия публикуется отдельным сегментом с пометкой replaces (читатели сразу
+        переключаются на неё), после чего файлы исходника удаляются.
+        """
+        compacted = 0
+        ts_field = self._ts_field
+        for seg in self.segments():
+            if not seg.meta.get("sealed") or seg.meta.get("compacted") or seg.meta["blocks"] == 0:
+                continue
+            index = seg.index()
+            with open(seg.dat, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                records = [r for e in index for r in _decode_block(data[e["offset"] : e["offset"] + e["length"]])]
+            records.sort(key=lambda r: to_epoch(r[ts_field]))
+
+            new = _Segment(seg.base + "c")
+            new.meta = {
+                **seg.meta,
+                "blocks": 0,
+                "records": 0,
+                "bytes": 0,
+                "postings": {},
+                "first_ts": None,
+                "last_ts": None,
+                "compacted": True,
+                "replaces": os.path.basename(seg.base),
+            }
+            for path in (new.dat, new.idx):
+                if os.path.exists(path):
+                    os.remove(path)
+            step = self.cfg.disk_compact_block_records
+            for lo in range(0, len(records), step):
+                chunk = records[lo : lo + step]
+                self._write_block(new, chunk, [to_epoch(r[ts_field]) for r in chunk])
+            new.write_meta()
+            # Если исходник еще занят читателем, его удалит следующий enforce_retention
+            _remove_segment(seg)
+            compacted += 1
+        return compacted
+
+
+def _remove_segment(seg: _Segment) -> bool:
+    """
+    Удаляет файлы сегмента; False — файл занят (на Windows mmap читателя API не дает
+    удалить файл). meta удаляется последним: пока она есть, сегмент виден обслуживанию
+    и удаление повторяется; читатели пропускают сегмент без .dat.
+    """
+    for path in (seg.dat, seg.idx, seg.meta_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as exc:
+            log.info("Segment file %s is in use, removal deferred: %s", path, exc)
+            return False
+    return True
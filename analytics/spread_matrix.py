@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+import numpy as np
+
+from analytics.features import to_epoch
+from core.signal_math import route_metrics
+from state.models import NormalizedBook
+from state.npz_codec import pack_snapshot, unpack_snapshot
+
+
+class SpreadMatrix(NamedTuple):
+    """
+    Снимок рынка за тик: строки — символы, колонки — маршруты buy>sell.
+
+    spread_bps, net_profit  — (S, P) float32, NaN если у маршрута нет одной из книг
+    book_age_sec            — (S, P) float32, возраст старшей из двух книг маршрута
+    """
+
+    ts: float
+    symbols: List[str]
+    exchanges: List[str]
+    pairs: List[str]
+    spread_bps: np.ndarray
+    net_profit: np.ndarray
+    book_age_sec: np.ndarray
+
+
+def build_spread_matrix(
+    books_by_symbol: Dict[str, Dict[str, NormalizedBook]],
+    symbols: Sequence[str],
+    exchanges: Sequence[str],
+    volume_usd: float,
+    fee_rate: float,
+    slippage_rate: float,
+    now: float,
+) -> SpreadMatrix:
+    """Все маршруты всех символов одной векторной операцией по матрицам ask/bid (S, E)."""
+    S, E = len(symbols), len(exchanges)
+    ex_index = {ex: j for j, ex in enumerate(exchanges)}
+    asks = np.full((S, E), np.nan)
+    bids = np.full((S, E), np.nan)
+    ages = np.full((S, E), np.nan)
+    for i, symbol in enumerate(symbols):
+        for ex, book in books_by_symbol.get(symbol, {}).items():
+            j = ex_index.get(ex)
+            if j is None:
+                continue
+            asks[i, j] = book.ask
+            bids[i, j] = book.bid
+            ages[i, j] = now - to_epoch(book.updated_at)
+
+    buy, sell = np.nonzero(~np.eye(E, dtype=bool))
+    pairs = [f"{exchanges[b]}>{exchanges[s]}" for b, s in zip(buy, sell)]
+    with np.errstate(invalid="ignore"):
+        _, spread_bps, net_profit, _ = route_metrics(asks[:, buy], bids[:, sell], volume_usd, fee_rate, slippage_rate)
+    missing = np.isnan(asks[:, buy]) | np.isnan(bids[:, sell])
+    spread_bps = np.where(missing, np.nan, spread_bps)
+    net_profit = np.where(missing, np.nan, net_profit)
+    book_age = np.maximum(ages[:, buy], ages[:, sell])
+
+    return SpreadMatrix(
+        ts=now,
+        symbols=list(symbols),
+        exchanges=list(exchanges),
+        pairs=pairs,
+        spread_bps=spread_bps.astype(np.float32),
+        net_profit=net_profit.astype(np.float32),
+        book_age_sec=book_age.astype(np.float32),
+    )
+
+
+def pack_matrix(matrix: SpreadMatrix) -> bytes:
+    """Компактная бинарная форма (npz: JSON-оси + float32-массивы)."""
+    meta = {"ts": matrix.ts, "symbols": matrix.symbols, "exchanges": matrix.exchanges, "pairs": matrix.pairs}
+    arrays = {"spread_bps": matrix.spread_bps, "net_profit": matrix.net_profit, "book_age_sec": matrix.book_age_sec}
+    return pack_snapshot(meta, arrays)
+
+
+def unpack_matrix(blob: bytes) -> SpreadMatrix:
+    meta, arrays = unpack_snapshot(blob)
+    return SpreadMatrix(
+        ts=meta["ts"],
+        symbols=meta["symbols"],
+        exchanges=meta["exchanges"],
+        pairs=meta["pairs"],
+        spread_bps=arrays["spread_bps"],
+        net_profit=arrays["net_profit"],
+        book_age_sec=arrays["book_age_sec"],
+    )
+
+
+def matrix_to_json(matrix: SpreadMatrix) -> Dict[str, Any]:
+    """JSON-форма для клиентов без npz: NaN -> null."""
+
+    def rows(a: np.ndarray):
+        return [[None if np.isnan(v) else round(float(v), 4) for v in row] for row in a]
+
+    return {
+        "ts": matrix.ts,
+        "symbols": matrix.symbols,
+        "exchanges": matrix.exchanges,
+        "pairs": matrix.pairs,
+        "spread_bps": rows(matrix.spread_bps),
+        "net_profit": rows(matrix.net_profit),
+        "book_age_sec": rows(matrix.book_age_sec),
+    }
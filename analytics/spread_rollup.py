@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import logging
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+from state.redis_state import RedisState
+
+log = logging.getLogger("analytics.spread_rollup")
+
+# Одна запись бакета — 28 байт
+ROLLUP_DTYPE = np.dtype(
+    [
+        ("ts", "<u4"),
+        ("open", "<f4"),
+        ("high", "<f4"),
+        ("low", "<f4"),
+        ("close", "<f4"),
+        ("mean", "<f4"),
+        ("count", "<u4"),
+    ]
+)
+
+# resolution -> (ширина бакета, ширина чанка-ключа) в секундах
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "1s": (1, 3600),
+    "1m": (60, 86400),
+    "1h": (3600, 30 * 86400),
+}
+
+
+def _chunk_key(resolution: str, symbol: str, route: str, chunk_start: int) -> str:
+    return f"history:rollup:{resolution}:{symbol}:{route}:{chunk_start}"
+
+
+def _open_key(resolution: str, symbol: str, route: str) -> str:
+    return f"history:rollup:{resolution}:{symbol}:{route}:open"
+
+
+class _Bucket:
+    __slots__ = ("start", "open", "high", "low", "close", "total", "count")
+
+    def __init__(self, start: int, value: float):
+        self.start = start
+        self.open = self.high = self.low = self.close = self.total = value
+        self.count = 1
+
+    def add(self, value: float):
+        self.high = max(self.high, value)
+        self.low = min(self.low, value)
+        self.close = value
+        self.total += value
+        self.count += 1
+
+    def pack(self) -> bytes:
+        rec = np.array(
+            [(self.start, self.open, self.high, self.low, self.close, self.total / self.count, self.count)],
+            dtype=ROLLUP_DTYPE,
+        )
+        return rec.tobytes()
+
+
+class SpreadRollup:
+    """
+    Агрегирует снимки спреда (bps) по символу и маршруту в бакеты 1s/1m/1h (OHLC + mean + count).
+    Stats engine кормит его каждым снимком стаканов коллектора (history:books), поэтому
+    1s-бакеты заполняются с периодом опроса бирж, а не тика статистики.
+
+    Закрытые бакеты дописываются (APPEND) упакованными записями в чанки
+    `history:rollup:{res}:{symbol}:{buy}>{sell}:{chunk_start}`; у каждого чанка TTL
+    по retention своего разрешения, поэтому память ограничена. Текущий открытый
+    бакет лежит в `...:{buy}>{sell}:open` (query видит незакрытый час/минуту), а
+    между рестартами переживает через warm-start снимок (to_state/restore_state).
+    """
+
+    def __init__(self, redis: RedisState, cfg):
+        self.client = redis.binary
+        self.retention = cfg.history.rollup_retention_sec
+        self._open: Dict[Tuple[str, str, str], _Bucket] = {}
+        self._closed: List[Tuple[str, str, str, _Bucket]] = []
+        # Открытые бакеты, изменившиеся с прошлого flush
+        self._dirty: Set[Tuple[str, str, str]] = set()
+
+    def add(self, symbol: str, route: str, ts: float, spread_bps: float):
+        for resolution, (width, _) in RESOLUTIONS.items():
+            start = int(ts) // width * width
+            key = (resolution, symbol, route)
+            bucket = self._open.get(key)
+            if bucket is None or start > bucket.start:
+                if bucket is not None:
+                    self._closed.append((resolution, symbol, route, bucket))
+                self._open[key] = _Bucket(start, spread_bps)
+            elif start == bucket.start:
+                bucket.add(spread_bps)
+            else:
+                continue
+            self._dirty.add(key)
+
+    async def flush(self):
+        """Сбрасывает закрытые и обновляет изменившиеся открытые бакеты одним pipeline."""
+        if not self._closed and not self._dirty:
+            return
+
+        closed, self._closed = self._closed, []
+        dirty, self._dirty = self._dirty, set()
+        pipe = self.client.pipeline(transaction=False)
+        for resolution, symbol, route, bucket in closed:
+            chunk_width = RESOLUTIONS[resolution][1]
+            chunk_start = bucket.start // chunk_width * chunk_width
+            key = _chunk_key(resolution, symbol, route, chunk_start)
+            pipe.append(key, bucket.pack())
+            pipe.expire(key, self.retention[resolution] + chunk_width)
+        for key in dirty:
+            width = RESOLUTIONS[key[0]][0]
+            pipe.set(_open_key(*key), self._open[key].pack(), ex=2 * width + 60)
+        try:
+            await pipe.execute()
+        except Exception:
+            # Бакеты остаются в очереди до следующего flush
+            self._closed = closed + self._closed
+            self._dirty |= dirty
+            raise
+
+    def to_state(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        """Открытые и еще не сброшенные закрытые бакеты для warm-start снимка."""
+        items = [(key, bucket, False) for key, bucket in self._open.items()]
+        items += [((res, symbol, route), bucket, True) for res, symbol, route, bucket in self._closed]
+        meta = {"buckets": [[*key, closed] for key, _, closed in items]}
+        arrays = {
+            "start": np.array([b.start for _, b, _ in items], dtype=np.int64),
+            "ohlc": np.array([(b.open, b.high, b.low, b.close) for _, b, _ in items], dtype=np.float64).reshape(-1, 4),
+            "total": np.array([b.total for _, b, _ in items], dtype=np.float64),
+            "count": np.array([b.count for _, b, _ in items], dtype=np.int64),
+        }
+        return meta, arrays
+
+    def restore_state(self, meta: Dict, arrays: Dict[str, np.ndarray]) -> bool:
+        for i, (resolution, symbol, route, closed) in enumerate(meta.get("buckets", [])):
+            if resolution not in RESOLUTIONS:
+                continue
+            bucket = _Bucket(int(arrays["start"][i]), 0.0)
+            bucket.open, bucket.high, bucket.low, bucket.close = (float(v) for v in arrays["ohlc"][i])
+            bucket.total, bucket.count = float(arrays["total"][i]), int(arrays["count"][i])
+            if closed:
+                self._closed.append((resolution, symbol, route, bucket))
+            else:
+                self._open[(resolution, symbol, route)] = bucket
+                self._dirty.add((resolution, symbol, route))
+        return True
+
+    async def query(
+        self, symbol: str, route: str, resolution: str, start_ts: float, end_ts: float
+    ) -> np.ndarray:
+        """Бакеты в [start_ts, end_ts) как структурированный массив ROLLUP_DTYPE (с открытым)."""
+        chunk_width = RESOLUTIONS[resolution][1]
+        first = int(start_ts) // chunk_width * chunk_width
+        keys = [
+            _chunk_key(resolution, symbol, route, c)
+            for c in range(first, int(end_ts) + 1, chunk_width)
+        ]
+        if not keys:
+            return np.empty(0, dtype=ROLLUP_DTYPE)
+
+        *blobs, open_blob = await self.client.mget(keys + [_open_key(resolution, symbol, route)])
+        parts = [np.frombuffer(b, dtype=ROLLUP_DTYPE) for b in blobs if b]
+        if open_blob:
+            current = np.frombuffer(open_blob, dtype=ROLLUP_DTYPE)
+            # Открытый бакет новее всех закрытых (после закрытия он уже в чанке)
+            if not parts or current["ts"][0] > parts[-1]["ts"][-1]:
+                parts.append(current)
+        if not parts:
+            return np.empty(0, dtype=ROLLUP_DTYPE)
+
+        data = np.concatenate(parts) if len(parts) > 1 else parts[0]
+        lo = np.searchsorted(data["ts"], start_ts, side="left")
+        hi = np.searchsorted(data["ts"], end_ts, side="left")
+        return data[lo:hi]
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import math
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Окна реализованной волатильности (секунды)
+WINDOWS_SEC: Dict[str, float] = {"1m": 60.0, "15m": 900.0, "1h": 3600.0}
+
+
+class _SymbolVolatility:
+    """
+    Кольцевой буфер лог-доходностей mid-цены одного символа.
+
+    Для каждого окна хранится начало окна в буфере и сумма квадратов доходностей
+    (точный вариант), плюс EWMA-дисперсия на секунду. Обновление — амортизированно O(1).
+    """
+
+    __slots__ = ("capacity", "ts", "ret", "seq", "last_mid", "last_ts", "start", "sum_sq", "ewma_var")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity)
+        self.ret = np.zeros(capacity)
+        self.seq = 0  # абсолютный номер следующей записи
+        self.last_mid: float | None = None
+        self.last_ts: float | None = None
+        self.start = {name: 0 for name in WINDOWS_SEC}
+        self.sum_sq = {name: 0.0 for name in WINDOWS_SEC}
+        self.ewma_var = {name: 0.0 for name in WINDOWS_SEC}
+
+    def _evict(self, name: str, until_seq: int, cutoff_ts: float):
+        start, sum_sq = self.start[name], self.sum_sq[name]
+        cap = self.capacity
+        while start < until_seq and (start <= self.seq - cap or self.ts[start % cap] <= cutoff_ts):
+            r = self.ret[start % cap]
+            sum_sq -= r * r
+            start += 1
+        self.start[name] = start
+        self.sum_sq[name] = max(sum_sq, 0.0)
+
+    def update(self, ts: float, mid: float):
+        if mid <= 0:
+            return
+        if self.last_mid is None or ts <= self.last_ts:
+            self.last_mid, self.last_ts = mid, ts
+            return
+
+        r = math.log(mid / self.last_mid)
+        dt = ts - self.last_ts
+        self.last_mid, self.last_ts = mid, ts
+
+        # Освобождаем слот, который сейчас будет перезаписан
+        for name, window in WINDOWS_SEC.items():
+            self._evict(name, self.seq, ts - window)
+
+        pos = self.seq % self.capacity
+        self.ts[pos] = ts
+        self.ret[pos] = r
+        self.seq += 1
+
+        r2 = r * r
+        for name, window in WINDOWS_SEC.items():
+            self.sum_sq[name] += r2
+            alpha = 1.0 - math.exp(-dt / window)
+            self.ewma_var[name] += alpha * (r2 / dt - self.ewma_var[name])
+
+    def realized(self, name: str) -> float:
+        return math.sqrt(self.sum_sq[name])
+
+    def ewma(self, name: str) -> float:
+        return math.sqrt(self.ewma_var[name] * WINDOWS_SEC[name])
+
+
+class VolatilityEstimator:
+    """Потоковая реализованная волатильность 1m/15m/1h по символам (mode: "window" | "ewma")."""
+
+    def __init__(self, mode: str = "window", capacity: int = 4096):
+        if mode not in ("window", "ewma"):
+            raise ValueError(f"Unknown volatility mode: {mode}")
+        self.mode = mode
+        self.capacity = capacity
+        self._symbols: Dict[str, _SymbolVolatility] = {}
+
+    def update(self, symbol: str, ts: float, mid: float):
+        state = self._symbols.get(symbol)
+        if state is None:
+            state = self._symbols[symbol] = _SymbolVolatility(self.capacity)
+        state.update(ts, mid)
+
+    def warm_up(self, symbol: str, points: Iterable[Tuple[float, float]]):
+        """Восстанавливает состояние из истории (ts, mid) после рестарта."""
+        for ts, mid in sorted(points):
+            self.update(symbol, ts, mid)
+
+    def get(self, symbol: str) -> Dict[str, float]:
+        state = self._symbols.get(symbol)
+        if state is None:
+            return {name: 0.0 for name in WINDOWS_SEC}
+        calc = state.ewma if self.mode == "ewma" else state.realized
+        return {name: calc(name) for name in WINDOWS_SEC}
+
+    # ------------------------
+    # Warm-start
+    # ------------------------
+    def to_state(self) -> Tuple[Dict, Dict[str, np.ndarray]]:
+        """Состояние для снимка: метаданные по символам + кольцевые буферы."""
+        meta = {"mode": self.mode, "capacity": self.capacity, "symbols": []}
+        arrays: Dict[str, np.ndarray] = {}
+        for i, (symbol, st) in enumerate(self._symbols.items()):
+            meta["symbols"].append(
+                {
+                    "symbol": symbol,
+                    "seq": st.seq,
+                    "last_mid": st.last_mid,
+                    "last_ts": st.last_ts,
+                    "start": st.start,
+                    "sum_sq": st.sum_sq,
+                    "ewma_var": st.ewma_var,
+                }
+            )
+            arrays[f"ts_{i}"] = st.ts
+            arrays[f"ret_{i}"] = st.ret
+        return meta, arrays
+
+    def restore_state(self, meta: Dict, arrays: Dict[str, np.ndarray]) -> bool:
+        if meta.get("capacity") != self.capacity:
+            return False
+        for i, item in enumerate(meta.get("symbols", [])):
+            st = _SymbolVolatility(self.capacity)
+            st.ts = arrays[f"ts_{i}"].astype(float)
+            st.ret = arrays[f"ret_{i}"].astype(float)
+            st.seq = item["seq"]
+            st.last_mid, st.last_ts = item["last_mid"], item["last_ts"]
+            st.start, st.sum_sq, st.ewma_var = dict(item["start"]), dict(item["sum_sq"]), dict(item["ewma_var"])
+            self._symbols[item["symbol"]] = st
+        return True
+
+    def last_ts(self, symbol: str) -> Optional[float]:
+        state = self._symbols.get(symbol)
+        return state.last_ts if state else None
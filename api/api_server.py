@@ -1,10 +1,18 @@
 import json
+import logging
+import time
+from typing import Optional
+
 from fastapi import FastAPI, Request, Query
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 
+from analytics.history_export import export_stream
+from analytics.history_store import HistoryStore, decode_cursor
+from analytics.spread_matrix import matrix_to_json, unpack_matrix
+from api.response_cache import ResponseCache
 from config import CONFIG
-from state.redis_state import RedisState
+from state.redis_state import RedisState, _encode
 from stream.streamhub import get_stream_router
 
 
@@ -20,31 +28,89 @@ def create_app(cfg: CONFIG.__class__):
     )
 
     redis = RedisState(cfg.redis)
+    history = HistoryStore(redis, cfg)
 
     # Добавляем роутер для стримов
     app.include_router(get_stream_router(redis, cfg))
 
+    # Горячие эндпоинты отдаются из кэша готовых байтов (см. api/response_cache.py):
+    # загрузчики вызываются только при смене версии состояния в Redis
+    cache = ResponseCache(redis, cfg)
+
+    def _json(obj) -> bytes:
+        return json.dumps(_encode(obj)).encode("utf-8")
+
+    async def _load_status():
+        stat = await redis.get_system_status()
+        return _json(stat) if stat else None
+
+    async def _load_market():
+        market = await redis.get_market_stats()
+        return _json(list(market.values())) if market else None
+
+    async def _load_signals(limit: int):
+        return _json(await redis.get_signals(limit=limit))
+
+    async def _load_top(limit: int, min_profit_bps: Optional[float]):
+        return _json(await redis.get_top_signals(limit=limit, min_profit_bps=min_profit_bps))
+
+    async def _load_matrix_json():
+        blob = await redis.get_spread_matrix()
+        return json.dumps(matrix_to_json(unpack_matrix(blob))).encode("utf-8") if blob else None
+
+    cache.register("system_status", _load_status, missing="No system status")
+    cache.register("market_stats", _load_market, missing="No market stats")
+    cache.register("signals", _load_signals)
+    cache.register("top", _load_top)
+    cache.register("spread_matrix", redis.get_spread_matrix, media_type="application/octet-stream", missing="No spread matrix")
+    cache.register("spread_matrix_json", _load_matrix_json, missing="No spread matrix", version="spread_matrix")
+
     # ------------------------- STATUS -------------------------\
     @app.get("/api/status")
-    async def api_status():
-        stat = await redis.get_system_status()
-        # Pydantic-модели по умолчанию могут быть возвращены напрямую FastAPI
-        return JSONResponse(stat)
+    async def api_status(request: Request):
+        return await cache.response(request, "system_status")
 
     # ------------------------- MARKET -------------------------\
     @app.get("/api/market")
-    async def api_market():
-        market = await redis.get_market_stats()
-        if not market:
-            return JSONResponse({"detail": "No market stats"}, status_code=404)
-        return JSONResponse(market)
+    async def api_market(request: Request):
+        return await cache.response(request, "market_stats")
+
+    @app.get("/api/market/matrix")
+    async def api_market_matrix(request: Request, format: str = Query(default="npz", pattern="^(npz|json)$")):
+        """Снимок символ x маршрут (spread_bps, net_profit, book_age_sec) последнего тика stats engine."""
+        return await cache.response(request, "spread_matrix_json" if format == "json" else "spread_matrix")
 
     # ------------------------- SIGNALS ------------------------\
-    # ИСПРАВЛЕНИЕ: Добавлен параметр limit для получения ограниченного количества сигналов.
     @app.get("/api/signals")
-    async def api_signals(limit: int = Query(default=100, ge=1, le=1000)):
-        signals = await redis.get_signals(limit=limit)
-        return JSONResponse(signals)
+    async def api_signals(
+        request: Request,
+        limit: int = Query(default=100, ge=1, le=1000),
+        since_id: Optional[int] = Query(default=None, ge=0),
+        before_id: Optional[int] = Query(default=None, ge=1),
+        symbol: Optional[str] = None,
+        min_profit_bps: Optional[float] = None,
+        buy_exchange: Optional[str] = None,
+        sell_exchange: Optional[str] = None,
+    ):
+        """
+        От новых к старым. since_id — только сигналы новее (следующий курсор — max id
+        ответа), before_id — страница старше; фильтры применяются на сервере.
+        """
+        cursor = (since_id, before_id, symbol, min_profit_bps, buy_exchange, sell_exchange)
+        if all(v is None for v in cursor):
+            return await cache.response(request, "signals", limit)
+        # Курсорные запросы у каждого клиента свои — мимо кэша, прямо по индексу id
+        signals = await redis.get_signals(limit, *cursor)
+        return JSONResponse(_encode(signals))
+
+    # ------------------------- TOP ----------------------------\
+    @app.get("/api/top")
+    async def api_top(
+        request: Request,
+        limit: int = Query(default=20, ge=1, le=500),
+        min_profit_bps: Optional[float] = None,
+    ):
+        return await cache.response(request, "top", limit, min_profit_bps)
 
     # ------------------------- SIGNAL STATS --------------------\
     @app.get("/api/stats/signals")
@@ -52,10 +118,90 @@ def create_app(cfg: CONFIG.__class__):
         stats = await redis.get_signal_stats()
         if not stats:
             return JSONResponse({"detail": "No signal stats"}, status_code=404)
-        return JSONResponse(stats)
+        return JSONResponse(stats.model_dump(mode="json"))
+
+    # ------------------------- METRICS ------------------------\
+    @app.get("/api/metrics/loop")
+    async def api_loop_lag():
+        lag = await redis.get_loop_lag()
+        if not lag:
+            return JSONResponse({"detail": "No loop lag metrics"}, status_code=404)
+        return JSONResponse(lag.model_dump(mode="json"))
 
     # ------------------------- HISTORICAL DATA --------------------\
-    # Здесь можно добавить эндпоинты для получения истории из HistoryStore
+    # Диапазон [start, end] в epoch-секундах (по умолчанию — последние сутки), от новых
+    # к старым; next_cursor передается обратно как cursor, None — данных больше нет.
+    def _range(start: Optional[float], end: Optional[float]) -> tuple[float, float]:
+        end = time.time() if end is None else end
+        return (end - 86400.0 if start is None else start), end
+
+    def _page(items, next_cursor):
+        return JSONResponse({"items": items, "count": len(items), "next_cursor": next_cursor})
+
+    @app.get("/api/history/signals")
+    async def api_history_signals(
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        symbol: Optional[str] = None,
+        buy_exchange: Optional[str] = None,
+        sell_exchange: Optional[str] = None,
+        min_profit: Optional[float] = None,
+        limit: int = Query(default=100, ge=1, le=1000),
+        cursor: Optional[str] = None,
+    ):
+        start, end = _range(start, end)
+        try:
+            items, next_cursor = await history.query_signals(
+                start, end, symbol, buy_exchange, sell_exchange, min_profit, limit, cursor
+            )
+        except ValueError:
+            return JSONResponse({"detail": "Invalid cursor"}, status_code=400)
+        return _page(items, next_cursor)
+
+    @app.get("/api/history/spreads")
+    async def api_history_spreads(
+        symbol: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        buy_exchange: Optional[str] = None,
+        sell_exchange: Optional[str] = None,
+        min_spread_bps: Optional[float] = None,
+        limit: int = Query(default=100, ge=1, le=1000),
+        cursor: Optional[str] = None,
+    ):
+        start, end = _range(start, end)
+        try:
+            items, next_cursor = await history.query_spreads(
+                symbol, start, end, buy_exchange, sell_exchange, min_spread_bps, limit, cursor
+            )
+        except ValueError:
+            return JSONResponse({"detail": "Invalid cursor"}, status_code=400)
+        return _page(items, next_cursor)
+
+    @app.get("/api/history/export")
+    async def api_history_export(
+        stream: str = Query(pattern="^(signals|spreads)$"),
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        symbol: Optional[str] = None,
+        format: str = Query(default="ndjson", pattern="^(ndjson|npz)$"),
+        cursor: Optional[str] = None,
+        chunk_size: int = Query(default=5000, ge=100, le=50000),
+    ):
+        """Потоковая выгрузка диапазона чанками; курсор продолжения — в каждом чанке."""
+        if stream == "spreads" and not symbol:
+            return JSONResponse({"detail": "symbol is required for spreads"}, status_code=400)
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError:
+                return JSONResponse({"detail": "Invalid cursor"}, status_code=400)
+        start, end = _range(start, end)
+        media_type = "application/x-ndjson" if format == "ndjson" else "application/octet-stream"
+        return StreamingResponse(
+            export_stream(history, stream, start, end, symbol, cursor, format, chunk_size),
+            media_type=media_type,
+        )
 
     # ВРЕМЕННО УДАЛЕН. Функционал стрима перенесен в streamhub.py
     # ------------------------- LIVE STREAM --------------------
@@ -63,4 +209,10 @@ def create_app(cfg: CONFIG.__class__):
     # async def api_stream(request: Request):
     #    ...
 
-    return app
\ No newline at end of file
+    return app
+
+
+def app_factory():
+    """Точка входа воркеров run_api.py: каждый процесс строит свое приложение из CONFIG."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    return create_app(CONFIG)
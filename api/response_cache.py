@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from state.redis_state import RedisState
+
+log = logging.getLogger("api.response_cache")
+
+# loader(*params) -> готовое тело ответа или None (нет данных -> 404)
+Loader = Callable[..., Awaitable[Optional[bytes]]]
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    candidates = {c.strip().removeprefix("W/") for c in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class CachedResponse(NamedTuple):
+    body: Optional[bytes]
+    etag: str
+    media_type: str
+    loaded_at: float
+
+
+class ResponseCache:
+    """
+    Кэш готовых байтов ответа на (источник, параметры).
+
+    Писатели увеличивают state:version:{источник} при каждой записи; фоновая задача
+    раз в cache_refresh_sec читает все версии одним MGET и перезагружает записи
+    изменившихся источников (и все записи старше cache_max_age_sec). Запрос к
+    закэшированному эндпоинту не обращается к Redis и ничего не сериализует;
+    If-None-Match с текущим ETag отвечается 304.
+    """
+
+    def __init__(self, redis: RedisState, cfg):
+        self.redis = redis
+        self.cfg = cfg.api
+        self._sources: Dict[str, Tuple[Loader, str, str, str]] = {}
+        self._entries: "OrderedDict[Tuple[str, tuple], CachedResponse]" = OrderedDict()
+        self._versions: Dict[str, Optional[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def register(
+        self,
+        source: str,
+        loader: Loader,
+        media_type: str = "application/json",
+        missing: str = "No data",
+        version: Optional[str] = None,
+    ):
+        """version — имя счетчика состояния (по умолчанию совпадает с источником)."""
+        self._sources[source] = (loader, media_type, missing, version or source)
+
+    async def response(self, request: Request, source: str, *params) -> Response:
+        entry = await self.get(source, *params)
+        if entry.body is None:
+            _, _, missing, _ = self._sources[source]
+            return Response(f'{{"detail": "{missing}"}}', status_code=404, media_type="application/json")
+        headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type=entry.media_type, headers=headers)
+
+    async def get(self, source: str, *params) -> CachedResponse:
+        self._ensure_refresher()
+        key = (source, params)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = await self._load(source, params)
+            self._entries[key] = entry
+            while len(self._entries) > self.cfg.cache_max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def _load(self, source: str, params: tuple) -> CachedResponse:
+        loader, media_type, _, _ = self._sources[source]
+        body = await loader(*params)
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"' if body is not None else '"none"'
+        return CachedResponse(body, etag, media_type, time.monotonic())
+
+    def _ensure_refresher(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop(), name="API_Response_Cache")
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.cfg.cache_refresh_sec)
+            try:
+                await self._refresh()
+            except Exception as exc:
+                log.error("Response cache refresh error: %s", exc)
+
+    async def _refresh(self):
+        names = sorted({version for _, _, _, version in self._sources.values()})
+        versions = await self.redis.get_versions(names)
+        changed = {
+            source
+            for source, (_, _, _, version) in self._sources.items()
+            if versions[version] != self._versions.get(version)
+        }
+        self._versions = versions
+
+        deadline = time.monotonic() - self.cfg.cache_max_age_sec
+        stale = [k for k, e in self._entries.items() if k[0] in changed or e.loaded_at < deadline]
+        if not stale:
+            return
+        fresh = await asyncio.gather(*(self._load(s, p) for s, p in stale), return_exceptions=True)
+        for key, entry in zip(stale, fresh):
+            if isinstance(entry, Exception):
+                log.warning("Response cache reload failed for %s: %s", key, entry)
+            elif key in self._entries:
+                self._entries[key] = entry
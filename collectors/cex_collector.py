@@ -4,6 +4,7 @@ import asyncio
 import logging
 from typing import List, Tuple
 
+from analytics.history_store import HistoryStore
 from config import CONFIG, Config
 from state.redis_state import RedisState
 from state.models import NormalizedBook
@@ -47,7 +48,7 @@ async def _fetch_books_for_symbol(
     return collected_books
 
 
-async def _cycle(redis: RedisState, cfg: Config) -> None:
+async def _cycle(redis: RedisState, cfg: Config, history: HistoryStore) -> None:
     """
     Основной цикл CEX-коллектора.
     Получает данные для всех символов со всех бирж и сохраняет их в Redis.
@@ -77,6 +78,8 @@ async def _cycle(redis: RedisState, cfg: Config) -> None:
         books_dict = {ex: book for ex, book in fetched_books}
         if books_dict:
             await redis.set_books(symbol, books_dict)
+            # Снимок для оценки исходов сигналов (eval engine)
+            await history.append_books(symbol, books_dict)
             logger.debug(f"Saved {len(books_dict)} books for {symbol}")
 
     # Записываем текущее время обновления
@@ -97,9 +100,11 @@ async def run_cex_collector(redis: RedisState, cfg: Config = CONFIG) -> None:
         cfg.collector.cex_exchanges,
     )
     
+    history = HistoryStore(redis, cfg)
+
     while True:
         try:
-            await _cycle(redis, cfg)
+            await _cycle(redis, cfg, history)
         except asyncio.CancelledError:
             logger.warning("CEX collector stopped by cancellation.")
             break
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import Dict, List
 
 
 # ----------------------------------------------------
@@ -18,8 +18,19 @@ class APIConfig(BaseModel):
     host: str = "127.0.0.1"
     port: int = 8000
     debug: bool = False
-    # НОВОЕ: Интервал обновления статуса для SSE-стрима
-    status_stream_interval_sec: float = Field(default=1.0, description="Interval for system status SSE stream.")
+    # Отдельный тир API (run_api.py): процессы uvicorn, общаются с движками только через Redis
+    workers: int = 2
+    # SSE-стримы: один upstream-опрос версий на все топики, fan-out по очередям клиентов
+    stream_poll_sec: float = Field(default=0.25, description="Upstream poll interval of the SSE broadcast hub.")
+    stream_client_queue: int = 16 # кадров в очереди клиента; при переполнении старые выбрасываются
+    stream_heartbeat_sec: float = 15.0
+    stream_live_signals: int = 500 # окно сигналов дельта-потока /stream/live
+    stream_live_replay: int = 1024 # событий в кольце для дочитывания после переподключения
+    stream_live_mid_bps: float = 1.0 # market-строка дельта-потока переотправляется, когда mid сдвинулся сильнее
+    # Кэш готовых ответов горячих эндпоинтов (обновляется по версиям состояния в Redis)
+    cache_refresh_sec: float = 0.25 # период опроса версий (один MGET)
+    cache_max_age_sec: float = 10.0 # перезагрузка даже без смены версии
+    cache_max_entries: int = 256
 
 
 # ----------------------------------------------------
@@ -43,12 +54,22 @@ class EngineConfig(BaseModel):
     cycle_stats_sec: float = 3.0
 
     min_spread_usd: float = 0.50
+    min_spread_bps: float = 5.0
+    min_net_profit_usd: float = 0.0
     min_volume_usd: float = 100.0
     
     # НОВОЕ: Объемы и ставки для расчета профита
     volume_calc_usd: float = Field(default=500.0, description="Volume used for profit calculation.")
     default_fee_rate: float = Field(default=0.00075, description="Default maker/taker fee rate (e.g., 0.075%).")
     default_slippage_rate: float = Field(default=0.0001, description="Default slippage percentage for a trade.")
+    # Лидерборд текущих возможностей (маршрут выпадает, если не обновлялся top_ttl_sec)
+    top_ttl_sec: float = 30.0
+    top_max_size: int = 500
+    # Порог high-value сигналов для уведомлений и LLM-сводки
+    notify_min_profit_bps: float = 20.0
+    # Процессов движков в run_engine.py (независимо от api.workers): сервисы
+    # раскладываются по процессам round-robin, каждый сервис — ровно в одном
+    processes: int = 1
 
 
 # ----------------------------------------------------
@@ -58,6 +79,11 @@ class EvalConfig(BaseModel):
     cycle_sec: float = 5.0
     # НОВОЕ: Максимальное количество сигналов для расчета статистики
     signals_eval_limit: int = Field(default=500, description="Max number of recent signals to use for evaluation stats.")
+    # Оценка исходов сигналов по последующим снимкам стаканов
+    outcome_horizons_sec: List[float] = Field(default=[1.0, 5.0, 30.0], description="Horizons at which remaining profit is measured.")
+    outcome_label_horizon_sec: float = Field(default=5.0, description="Horizon whose remaining profit defines the ML label.")
+    outcome_batch_size: int = Field(default=5000, description="Max pending signals evaluated per cycle.")
+    outcome_max_gap_sec: float = Field(default=3.0, description="Max age of a book snapshot to be used at a horizon.")
 
 
 # ----------------------------------------------------
@@ -65,6 +91,11 @@ class EvalConfig(BaseModel):
 # ----------------------------------------------------
 class StatsConfig(BaseModel):
     max_market_stats: int = 50
+    # Волатильность: "window" — точная по окну, "ewma" — экспоненциальная
+    volatility_mode: str = "window"
+    # Обновление на каждый снимок стаканов коллектора: буфер должен вмещать 1h доходностей
+    # (3600 при collector.cycle_sec=1.0), с запасом на более частый опрос
+    volatility_capacity: int = Field(default=8192, description="Ring buffer size (returns) per symbol.")
 
 
 # ----------------------------------------------------
@@ -75,6 +106,24 @@ class MLConfig(BaseModel):
     train_interval_sec: float = 300.0
     history_window: int = 2000
     min_score: float = 0.6
+    # Обучение логистической модели (стандартизированные признаки)
+    learning_rate: float = 0.1
+    max_epochs: int = 300
+    l2: float = 1e-3
+    batch_size: int = 0 # 0 -> full-batch
+    early_stopping_patience: int = 3
+    # Режим: "batch" — периодическое переобучение, "online" — partial_fit на новых записях
+    mode: str = "batch"
+    online_poll_sec: float = 2.0
+    online_batch_size: int = 64
+    online_learning_rate: float = 0.05
+    online_lr_decay: float = 1e-3
+    checkpoint_interval_sec: float = 30.0
+    # Реестр моделей: горячая подмена по pub/sub, указатель сверяется раз в N секунд
+    model_check_interval_sec: float = 5.0
+    registry_keep_versions: int = 20
+    # Обучение и кластеризация выполняются в отдельном пуле процессов
+    process_pool_workers: int = 2
 
 
 # ----------------------------------------------------
@@ -82,19 +131,71 @@ class MLConfig(BaseModel):
 # ----------------------------------------------------
 class ClusteringConfig(BaseModel):
     enabled: bool = False
+    # "kmeans" | "dbscan" (eps/min_samples в стандартизированной шкале признаков)
+    method: str = "kmeans"
     min_samples: int = 5
     eps: float = 0.4
+    grid_dims: int = 3 # размерность сетки GridIndex (соседних ячеек: 3^grid_dims)
+    update_interval_sec: float = 60.0
+    history_window: int = 10000
+    # k-means (k-means++ seeding, останов по сдвигу центроидов)
+    k: int = 8
+    max_iter: int = 100
+    tol: float = 1e-4
+    batch_size: int = 1024 # mini-batch для окон больше minibatch_threshold
+    minibatch_threshold: int = 20000
 
 
 # ----------------------------------------------------
 # HISTORY STORE
 # ----------------------------------------------------
 class HistoryConfig(BaseModel):
-    enable: bool = True
+    enabled: bool = True
     signals_max_len: int = 5000
-    spreads_max_len: int = 100
+    spreads_max_len: int = 1200 # ~1 час при cycle_stats_sec=3.0 (прогрев волатильности)
+    store_spreads: bool = True
     features_max_len: int = 10000
+    books_max_len: int = 600 # ~10 минут снимков стаканов при cycle_sec=1.0
+    pending_outcomes_max_len: int = 20000
+    outcomes_max_len: int = 10000
     ttl_sec: int | None = None # TTL for history records
+    # Роллапы спредов 1s/1m/1h: хранение (секунды) для каждого разрешения
+    rollup_enabled: bool = True
+    rollup_retention_sec: Dict[str, int] = Field(
+        default={"1s": 86400, "1m": 30 * 86400, "1h": 365 * 86400},
+        description="Retention per rollup resolution.",
+    )
+    # /api/history/*: максимум просмотренных записей диапазона за запрос
+    query_max_scan: int = 5000
+    # Append-only архив сигналов и спредов на диске (сегменты + индекс по времени);
+    # источник /api/history/* и выгрузки, без него доступно только окно горячих списков
+    disk_enabled: bool = True
+    disk_path: str = "data/history"
+    disk_block_records: int = 512 # записей в сжатом блоке при записи
+    disk_flush_interval_sec: float = 5.0 # неполный блок сбрасывается не реже
+    disk_segment_sec: float = 86400.0 # новый сегмент не реже раза в сутки
+    disk_segment_bytes: int = 256 << 20
+    disk_retention_sec: float = 180 * 86400.0
+    disk_compact_block_records: int = 8192 # размер блока после компакции
+    disk_maintenance_interval_sec: float = 600.0
+    disk_ts_fields: Dict[str, str] = Field(
+        default={"signals": "created_at", "spreads": "updated_at"},
+        description="Timestamp field of each on-disk stream.",
+    )
+
+
+# ----------------------------------------------------
+# FEATURE STORE (колоночные memmap-сегменты для обучения ML)
+# ----------------------------------------------------
+class FeatureStoreConfig(BaseModel):
+    enabled: bool = False
+    path: str = "data/feature_store"
+    segment_rows: int = 1 << 20 # ёмкость сегмента (файлы разреженные)
+    segment_sec: float = 86400.0 # новый сегмент не реже раза в сутки
+    retention_sec: float = 7 * 86400.0
+    # Окно обучения SignalFilter, когда хранилище включено
+    train_window_sec: float = 7 * 86400.0
+    train_max_rows: int = 1_000_000
 
 
 # ----------------------------------------------------\
@@ -125,7 +226,39 @@ class LLMConfig(BaseModel):
 class TunerConfig(BaseModel):
     enabled: bool = False
     update_interval_sec: float = 300.0
-    history_window: int = 5000 # Use 5000 signals for snapshot calculation
+    history_window: int = 5000 # Max signals ingested per pass (cold start / catch-up)
+    # Квантильные скетчи (KLL) по символу и маршруту
+    ingest_interval_sec: float = 2.0
+    sketch_k: int = 200
+    sketch_window_sec: float = 3600.0 # скетчи ротируются: запрос видит 1–2 окна
+    min_scope_samples: int = 50 # меньше наблюдений -> используется уровень выше
+    # Режим: "sketch" — квантили потока сигналов, "backtest" — перебор сетки порогов по истории
+    mode: str = "sketch"
+    backtest_lookback_sec: float = 86400.0 # реплей 1s-роллапов спредов
+    backtest_workers: int = 4
+    backtest_min_signals: int = 20
+    grid_min_spread_bps: List[float] = Field(default=[float(x) for x in range(0, 52, 2)])
+    grid_min_net_profit_usd: List[float] = Field(default=[round(0.1 * x, 2) for x in range(-5, 21)])
+    grid_min_volume_usd: List[float] = Field(default=[100.0, 500.0])
+    grid_ml_min_score: List[float] = Field(default=[round(0.1 * x, 1) for x in range(0, 10)])
+
+
+# ----------------------------------------------------
+# WARM START (снимки in-memory состояния для быстрого рестарта)
+# ----------------------------------------------------
+class WarmStartConfig(BaseModel):
+    enabled: bool = True
+    checkpoint_interval_sec: float = 30.0
+    max_age_sec: float = 3600.0 # более старые снимки игнорируются
+
+
+# ----------------------------------------------------
+# MONITOR
+# ----------------------------------------------------
+class MonitorConfig(BaseModel):
+    loop_lag_interval_sec: float = 0.1
+    loop_lag_report_sec: float = 10.0
+    loop_lag_warn_ms: float = 250.0
 
 
 # ----------------------------------------------------\
@@ -141,9 +274,12 @@ class Config(BaseModel):
     ml: MLConfig = MLConfig()
     clustering: ClusteringConfig = ClusteringConfig()
     history: HistoryConfig = HistoryConfig()
+    feature_store: FeatureStoreConfig = FeatureStoreConfig()
     telegram: TelegramConfig = TelegramConfig()
     llm: LLMConfig = LLMConfig()
     tuner: TunerConfig = TunerConfig()
+    monitor: MonitorConfig = MonitorConfig()
+    warm_start: WarmStartConfig = WarmStartConfig()
 
 
 CONFIG = Config()
\ No newline at end of file
@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from analytics.features import FEATURE_COLUMNS, align_columns, route_feature_matrix, to_epoch
+from analytics.history_store import HistoryStore, RangeReader
+from analytics.spread_rollup import SpreadRollup
+from core.signal_math import route_metrics
+from ml.model_registry import ModelRegistry
+from ml.signal_filter import SimpleLogisticModel
+from state.models import ParamSnapshot
+from state.redis_state import RedisState
+
+log = logging.getLogger("core.backtest")
+
+# Колонки кандидата в сетке
+CANDIDATE_COLUMNS = ("min_spread_bps", "min_net_profit_usd", "min_volume_usd", "ml_min_score")
+
+
+class ReplayRows(NamedTuple):
+    spread_bps: np.ndarray
+    net_profit: np.ndarray
+    volume_usd: np.ndarray
+    ml_score: np.ndarray
+    realized: np.ndarray  # чистая прибыль того же маршрута через label-горизонт
+
+
+class MarketSeries(NamedTuple):
+    """Снимки рынка символа, записанные stats engine (history:spreads), по возрастанию времени."""
+
+    ts: np.ndarray
+    mid: np.ndarray
+    volatility_1h: np.ndarray  # NaN — запись старше поля volatility_1h
+
+
+def _forward_fill(values: np.ndarray, max_gap: int) -> np.ndarray:
+    """Протягивает последнее значение вдоль оси времени не дальше max_gap шагов."""
+    n = values.shape[-1]
+    pos = np.arange(n)
+    last = np.where(~np.isnan(values), pos, -1)
+    last = np.maximum.accumulate(last, axis=-1)
+    filled = np.take_along_axis(values, np.clip(last, 0, None), axis=-1)
+    filled[(last < 0) | (pos - last > max_gap)] = np.nan
+    return filled
+
+
+def build_symbol_replay(
+    symbol: str,
+    routes: Dict[str, np.ndarray],
+    start_ts: int,
+    end_ts: int,
+    cfg,
+) -> tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Плотная секундная сетка по маршрутам символа из 1s-роллапов и выбор лучшего
+    маршрута в каждый момент цикла core engine (как _pick_best_books: max спред).
+
+    Возвращает (route_names, t_index, route_idx, spread_bps, realized_spread_bps).
+    """
+    names = sorted(routes)
+    n_steps = end_ts - start_ts
+    grid = np.full((len(names), n_steps), np.nan)
+    for r, name in enumerate(names):
+        data = routes[name]
+        idx = data["ts"].astype(np.int64) - start_ts
+        ok = (idx >= 0) & (idx < n_steps)
+        grid[r, idx[ok]] = data["close"][ok]
+    # 1s-бакеты пишутся на каждый снимок коллектора: протягиваем только дрожание его
+    # периода (опрос + cycle_sec), а не многосекундные провалы данных
+    grid = _forward_fill(grid, max(1, math.ceil(2 * cfg.collector.cycle_sec)))
+
+    step = max(1, int(round(cfg.engine.cycle_core_sec)))
+    horizon = int(round(cfg.eval.outcome_label_horizon_sec))
+    t_index = np.arange(0, n_steps - horizon, step)
+    sampled = grid[:, t_index]
+    has_any = ~np.all(np.isnan(sampled), axis=0)
+    t_index, sampled = t_index[has_any], sampled[:, has_any]
+
+    route_idx = np.nanargmax(sampled, axis=0)
+    spread_bps = sampled[route_idx, np.arange(t_index.size)]
+    realized_bps = grid[route_idx, t_index + horizon]
+    return names, t_index, route_idx, spread_bps, realized_bps
+
+
+def market_series(records: List[Dict]) -> MarketSeries:
+    ts = np.array([to_epoch(r["updated_at"]) for r in records], dtype=float)
+    mid = np.array([r.get("mid") if r.get("mid") is not None else np.nan for r in records], dtype=float)
+    vol = np.array([r.get("volatility_1h") if r.get("volatility_1h") is not None else np.nan for r in records], dtype=float)
+    order = np.argsort(ts, kind="stable")
+    return MarketSeries(ts[order], mid[order], vol[order])
+
+
+def sample_market(
+    market: MarketSeries, start_ts: int, n_steps: int, t_index: np.ndarray, cfg
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    mid и volatility_1h на шагах реплея: последний снимок stats engine не старше
+    двух его тиков (как MarketStats, которые видел core engine), иначе NaN.
+    """
+    grid = np.full((2, n_steps), np.nan)
+    idx = np.floor(market.ts - start_ts).astype(np.int64)
+    ok = (idx >= 0) & (idx < n_steps)
+    grid[0, idx[ok]] = market.mid[ok]
+    grid[1, idx[ok]] = market.volatility_1h[ok]
+    grid = _forward_fill(grid, max(1, math.ceil(2 * cfg.engine.cycle_stats_sec)))
+    return grid[0, t_index], grid[1, t_index]
+
+
+def _net_from_bps(spread_bps: np.ndarray, cfg) -> np.ndarray:
+    """Цены с mid=1 и заданным спредом дают ту же математику, что и реальные стаканы."""
+    half = spread_bps / 20_000
+    _, _, net, _ = route_metrics(
+        1.0 - half,
+        1.0 + half,
+        cfg.engine.volume_calc_usd,
+        cfg.engine.default_fee_rate,
+        cfg.engine.default_slippage_rate,
+    )
+    return net
+
+
+def _has_model(model: Optional[SimpleLogisticModel]) -> bool:
+    return model is not None and bool(model.weights)
+
+
+def _score_rows(
+    model: Optional[SimpleLogisticModel],
+    symbol: str,
+    route_names,
+    route_idx,
+    t_index,
+    start_ts,
+    spread_bps,
+    net,
+    market_mid,
+    market_vol,
+    cfg,
+) -> np.ndarray:
+    """
+    Скоры модели для строк реплея по реальным ценам: mid рынка и спред маршрута дают
+    цены ask/bid, volatility_1h — записанная stats engine. NaN без модели или без
+    записанного рынка: такие строки не проходят ни один порог ml_min_score.
+    """
+    if not _has_model(model):
+        return np.full(spread_bps.size, np.nan)
+
+    half = spread_bps / 20_000
+    X = route_feature_matrix(
+        symbol,
+        route_names,
+        route_idx,
+        start_ts + t_index.astype(float),
+        market_mid * (1.0 - half),
+        market_mid * (1.0 + half),
+        net,
+        cfg.engine.volume_calc_usd,
+        market_mid,
+        market_vol,
+    )
+    scores = model.predict_proba_matrix(align_columns(X, FEATURE_COLUMNS, model.feature_order))
+    scores[np.isnan(market_mid) | np.isnan(market_vol)] = np.nan
+    return scores
+
+
+def _replay_symbol(
+    symbol: str,
+    routes: Dict[str, np.ndarray],
+    market: Optional[MarketSeries],
+    start_ts: int,
+    end_ts: int,
+    model,
+    cfg,
+) -> ReplayRows:
+    """Реплей и скоринг одного символа (чистый NumPy — выполняется вне event loop)."""
+    names, t_index, route_idx, spread_bps, realized_bps = build_symbol_replay(symbol, routes, start_ts, end_ts, cfg)
+    net = _net_from_bps(spread_bps, cfg)
+    realized = _net_from_bps(realized_bps, cfg)
+    if market is not None:
+        market_mid, market_vol = sample_market(market, start_ts, end_ts - start_ts, t_index, cfg)
+    else:
+        market_mid = market_vol = np.full(t_index.size, np.nan)
+    scores = _score_rows(
+        model, symbol, names, route_idx, t_index, start_ts, spread_bps, net, market_mid, market_vol, cfg
+    )
+    ok = ~np.isnan(realized)
+    return ReplayRows(
+        spread_bps=spread_bps[ok],
+        net_profit=net[ok],
+        volume_usd=np.full(int(ok.sum()), cfg.engine.volume_calc_usd),
+        ml_score=scores[ok],
+        realized=realized[ok],
+    )
+
+
+def candidate_grid(cfg, with_ml: bool = True) -> np.ndarray:
+    """Сетка кандидатов; без модели колонка ml_min_score не перебирается (3 колонки)."""
+    t = cfg.tuner
+    axes = [t.grid_min_spread_bps, t.grid_min_net_profit_usd, t.grid_min_volume_usd]
+    if with_ml:
+        axes.append(t.grid_ml_min_score)
+    return np.array(list(itertools.product(*axes)), dtype=float).reshape(-1, len(axes))
+
+
+def evaluate_candidates(rows: ReplayRows, candidates: np.ndarray, block: int = 64) -> tuple[np.ndarray, np.ndarray]:
+    """Суммарная реализованная прибыль и число сигналов для каждого кандидата (блоками)."""
+    profit = np.empty(len(candidates))
+    count = np.empty(len(candidates), dtype=np.int64)
+    with_ml = candidates.shape[1] > 3
+    for lo in range(0, len(candidates), block):
+        c = candidates[lo : lo + block]
+        mask = (
+            (rows.spread_bps >= c[:, 0:1])
+            & (rows.net_profit >= c[:, 1:2])
+            & (rows.volume_usd >= c[:, 2:3])
+        )
+        if with_ml:
+            mask &= rows.ml_score >= c[:, 3:4]
+        profit[lo : lo + block] = mask @ rows.realized
+        count[lo : lo + block] = mask.sum(axis=1)
+    return profit, count
+
+
+# --- Процессный пул: строки реплея передаются в воркер один раз ---
+_WORKER_ROWS: Optional[ReplayRows] = None
+
+
+def _init_worker(rows: ReplayRows):
+    global _WORKER_ROWS
+    _WORKER_ROWS = rows
+
+
+def _evaluate_chunk(candidates: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    return evaluate_candidates(_WORKER_ROWS, candidates)
+
+
+def _read_all(reader: RangeReader, page: int = 10_000) -> List[Dict]:
+    records: List[Dict] = []
+    while True:
+        items, cursor = reader.take(page)
+        records.extend(items)
+        if cursor is None:
+            return records
+
+
+async def _load_market(history: HistoryStore, symbol: str, start_ts: int, end_ts: int) -> MarketSeries:
+    reader = await history.open_range("spreads", start_ts, end_ts, symbol)
+    try:
+        return market_series(await asyncio.to_thread(_read_all, reader))
+    finally:
+        reader.close()
+
+
+async def load_replay(redis: RedisState, cfg, model: Optional[SimpleLogisticModel]) -> Optional[ReplayRows]:
+    rollup = SpreadRollup(redis, cfg)
+    history = HistoryStore(redis, cfg)
+    end_ts = int(time.time())
+    start_ts = end_ts - int(cfg.tuner.backtest_lookback_sec)
+    exchanges = cfg.collector.cex_exchanges
+
+    parts: List[ReplayRows] = []
+    for symbol in cfg.collector.symbols:
+        routes = {}
+        for buy_ex, sell_ex in itertools.permutations(exchanges, 2):
+            name = f"{buy_ex}>{sell_ex}"
+            data = await rollup.query(symbol, name, "1s", start_ts, end_ts)
+            if data.size:
+                routes[name] = data
+        if not routes:
+            continue
+        # Признаки модели — по записанным MarketStats (mid, volatility_1h), как в live
+        market = await _load_market(history, symbol, start_ts, end_ts) if _has_model(model) else None
+        # Сетка, реплей и скоринг — в потоке: event loop общий с движками и API
+        parts.append(
+            await asyncio.to_thread(_replay_symbol, symbol, routes, market, start_ts, end_ts, model, cfg)
+        )
+
+    if not parts:
+        return None
+    return ReplayRows(*(np.concatenate(cols) for cols in zip(*parts)))
+
+
+async def run_backtest(redis: RedisState, cfg) -> Optional[ParamSnapshot]:
+    """Прогоняет сетку порогов по истории в пуле процессов и возвращает лучший набор."""
+    _, blob = await ModelRegistry(redis, "signal_filter").load_active()
+    model = SimpleLogisticModel.from_bytes(blob) if blob else None
+
+    rows = await load_replay(redis, cfg, model)
+    if rows is None or rows.realized.size == 0:
+        log.info("Backtest skipped: no replayable spread history")
+        return None
+
+    # Без модели (или записанного рынка) скоров нет: ml_min_score не подбирается и не
+    # публикуется, иначе порог 0.0 из сетки отключил бы ML-фильтр core engine
+    scored = int(np.isfinite(rows.ml_score).sum())
+    candidates = candidate_grid(cfg, with_ml=scored >= cfg.tuner.backtest_min_signals)
+    workers = max(1, cfg.tuner.backtest_workers)
+    chunks = np.array_split(candidates, workers * 4)
+    started = time.time()
+
+    loop = asyncio.get_running_loop()
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rows,))
+    try:
+        results = await asyncio.gather(
+            *[loop.run_in_executor(pool, _evaluate_chunk, chunk) for chunk in chunks if len(chunk)]
+        )
+    finally:
+        # Не ждем остановки воркеров: выход из with блокировал бы общий event loop
+        pool.shutdown(wait=False, cancel_futures=True)
+    profit = np.concatenate([r[0] for r in results])
+    count = np.concatenate([r[1] for r in results])
+
+    profit[count < cfg.tuner.backtest_min_signals] = -np.inf
+    best = int(np.argmax(profit))
+    if not np.isfinite(profit[best]):
+        log.info("Backtest found no candidate with >= %d signals", cfg.tuner.backtest_min_signals)
+        return None
+
+    params = dict(zip(CANDIDATE_COLUMNS, candidates[best]))
+    log.info(
+        "Backtest: %d candidates x %d rows in %.1fs, best %s -> %.2f USD over %d signals",
+        len(candidates),
+        rows.realized.size,
+        time.time() - started,
+        params,
+        profit[best],
+        count[best],
+    )
+    return ParamSnapshot(
+        min_spread_bps=params["min_spread_bps"],
+        min_net_profit_usd=params["min_net_profit_usd"],
+        min_volume_usd=params["min_volume_usd"],
+        ml_min_score=params.get("ml_min_score"),
+        updated_at=datetime.utcnow(),
+    )
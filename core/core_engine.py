@@ -3,8 +3,11 @@ import logging
 from datetime import datetime
 from typing import Optional
 
-from analytics.features import build_signal_features
+import numpy as np
+
+from analytics.features import FEATURE_COLUMNS, N_FEATURES, fill_signal_features
 from analytics.history_store import HistoryStore
+from core.signal_math import route_metrics
 from ml.signal_clustering import SignalClusterer
 from ml.signal_filter import SignalFilter
 from state.models import CoreSignal, NormalizedBook
@@ -21,17 +24,39 @@ async def run_core_engine(redis: RedisState, cfg):
     signal_filter = SignalFilter(cfg, redis)
     clusterer = SignalClusterer(cfg, redis)
 
+    # Модель из реестра до первого цикла: сигналы сразу скорятся
+    await signal_filter.warm_start()
+
     # background workers
     asyncio.create_task(signal_filter.training_loop(history))
     asyncio.create_task(clusterer.training_loop(history))
-
-    while True:
+    asyncio.create_task(signal_filter.watch_registry())
+
+    # Буфер признаков: не больше одного кандидата на символ за цикл
+    feature_buf = np.empty((len(cfg.collector.symbols), N_FEATURES))
+
+    try:
+        migrated = await redis.migrate_legacy_signals()
+        if migrated:
+            log.info("Migrated %d signals from the legacy state:signals list", migrated)
+    except Exception as exc:
+        log.warning("Legacy signals migration failed: %s", exc)
+
+    try:
+        while True:
+            try:
+                await _cycle(redis, cfg, history, signal_filter, clusterer, feature_buf)
+                await history.flush_disk()
+            except Exception as e:
+                log.error(f"Core engine error: {e}")
+
+            await asyncio.sleep(interval)
+    finally:
+        # Неполные блоки архива иначе теряются при остановке
         try:
-            await _cycle(redis, cfg, history, signal_filter, clusterer)
-        except Exception as e:
-            log.error(f"Core engine error: {e}")
-
-        await asyncio.sleep(interval)
+            await history.flush_disk(force=True)
+        except Exception as exc:
+            log.warning("Core engine shutdown flush failed: %s", exc)
 
 
 def _pick_best_books(books: dict[str, NormalizedBook]) -> Optional[tuple[NormalizedBook, NormalizedBook]]:
@@ -60,18 +85,19 @@ async def _cycle(
     history: HistoryStore,
     signal_filter: SignalFilter,
     clusterer: SignalClusterer,
+    feature_buf: np.ndarray,
 ):
     market_stats = await redis.get_market_stats()
     exchange_stats = await redis.get_exchange_stats()
     param_snap = await redis.get_param_snapshot()
 
-    # Берем параметры из тюнера, если он включен, иначе из конфига
-    effective_min_spread = param_snap.min_spread_bps if param_snap else cfg.engine.min_spread_bps
-    effective_min_net = param_snap.min_net_profit_usd if param_snap else cfg.engine.min_net_profit_usd
-    effective_min_vol = param_snap.min_volume_usd if param_snap else cfg.engine.min_volume_usd
-
+    # Книги читаются напрямую, а не из state:spread_matrix: матрица публикуется раз в
+    # cycle_stats_sec (до 3 с старше книг) и не содержит цен, а сигналы строятся
+    # по текущим ценам ask/bid — это латентно-критичный путь.
+    all_books = await redis.get_all_books(cfg.collector.symbols)
+    candidates: list[CoreSignal] = []
     for symbol in cfg.collector.symbols:
-        books = await redis.get_books(symbol)
+        books = all_books[symbol]
         best_pair = _pick_best_books(books)
 
         if not best_pair:
@@ -80,33 +106,27 @@ async def _cycle(
         best_ask, best_bid = best_pair
 
         # --- РАСЧЕТ ПАРАМЕТРОВ СИГНАЛА ---
-        spread = best_bid.bid - best_ask.ask
-        base_mid = (best_ask.ask + best_bid.bid) / 2.0
-        spread_bps = (spread / base_mid) * 10_000 if base_mid else 0.0
-
-        # НОВОЕ: Расчет чистой прибыли
         volume_calc_usd = cfg.engine.volume_calc_usd
         fee_rate = cfg.engine.default_fee_rate
         slippage_rate = cfg.engine.default_slippage_rate
 
-        # Количество базовой валюты (например, BTC) для объема volume_calc_usd
-        quantity_base = volume_calc_usd / base_mid
-
-        # Валовая прибыль в USD
-        gross_profit = spread * quantity_base
-
-        # Общие комиссии (покупка + продажа)
-        total_fees_usd = 2 * volume_calc_usd * fee_rate
-
-        # Оценка проскальзывания (в USD)
-        total_slippage_usd = volume_calc_usd * slippage_rate
-
-        # Чистая прибыль
-        net_profit = gross_profit - total_fees_usd - total_slippage_usd
-        net_profit_bps = (net_profit / volume_calc_usd) * 10_000 if volume_calc_usd else 0.0
+        spread, spread_bps, net_profit, net_profit_bps = route_metrics(
+            best_ask.ask, best_bid.bid, volume_calc_usd, fee_rate, slippage_rate
+        )
         volume_usd = volume_calc_usd # Используем объем для фильтрации/отчета
 
         # --- ФИЛЬТРАЦИЯ ---
+        # Берем пороги тюнера для маршрута/символа, если он включен, иначе из конфига
+        if param_snap:
+            params = param_snap.for_route(symbol, best_ask.exchange, best_bid.exchange)
+            effective_min_spread = params.min_spread_bps
+            effective_min_net = params.min_net_profit_usd
+            effective_min_vol = params.min_volume_usd
+        else:
+            effective_min_spread = cfg.engine.min_spread_bps
+            effective_min_net = cfg.engine.min_net_profit_usd
+            effective_min_vol = cfg.engine.min_volume_usd
+
         if spread_bps < effective_min_spread:
             continue
         if net_profit < effective_min_net:
@@ -131,26 +151,39 @@ async def _cycle(
             net_profit_bps=net_profit_bps,
             created_at=datetime.utcnow(),
         )
-
-        # ML Score and Clustering (already exists)
-        features = build_signal_features(sig, market_stats, exchange_stats)
-        ml_score = await signal_filter.score(features)
+        fill_signal_features(feature_buf[len(candidates)], sig, market_stats, exchange_stats)
+        candidates.append(sig)
+
+    if not candidates:
+        await redis.update_top_signals([], cfg.engine.top_ttl_sec, cfg.engine.top_max_size)
+        return
+
+    # --- ML: все кандидаты цикла одной матрицей ---
+    X = feature_buf[: len(candidates)]
+    scores = await signal_filter.score_batch(X, FEATURE_COLUMNS)
+    cluster_ids = clusterer.predict_batch(X, FEATURE_COLUMNS)
+    min_score = param_snap.ml_min_score if param_snap and param_snap.ml_min_score is not None else cfg.ml.min_score
+
+    emitted: list[CoreSignal] = []
+    for i, sig in enumerate(candidates):
+        ml_score = float(scores[i]) if scores is not None else None
         sig.ml_score = ml_score
+        sig.cluster_id = int(cluster_ids[i]) if cluster_ids is not None else None
 
-        cluster_id = clusterer.predict(features)
-        sig.cluster_id = cluster_id
-
-        if ml_score is not None and ml_score < cfg.ml.min_score:
+        if ml_score is not None and ml_score < min_score:
             continue
 
+        emitted.append(sig)
         await redis.push_signal(sig)
         await history.append_signal(sig)
-        # Сохраняем фичи для обучения: label=1 (прибыльный), label=0 (убыточный)
-        await history.append_features(features, label=1 if net_profit > 0 else 0)
+        # Фичи попадут в обучение после оценки исхода (eval engine проставит label)
+        await history.append_pending_outcome(sig, X[i].tolist())
         log.debug(
             "New signal %s -> %.2f USD (S:%.2f BPS, ML:%.2f)",
             sig.symbol,
             sig.net_profit,
             sig.spread_bps,
             sig.ml_score or 0.0,
-        )
\ No newline at end of file
+        )
+
+    await redis.update_top_signals(emitted, cfg.engine.top_ttl_sec, cfg.engine.top_max_size)
@@ -2,6 +2,8 @@ import asyncio
 import logging
 from datetime import datetime
 
+from analytics.history_store import HistoryStore
+from analytics.outcomes import OutcomeEvaluator
 from state.redis_state import RedisState
 from state.models import SignalStats
 
@@ -11,10 +13,21 @@ log = logging.getLogger("core.eval_engine")
 async def run_eval_engine(redis, cfg):
     interval = cfg.eval.cycle_sec
     log.info("Eval engine started")
+    history = HistoryStore(redis, cfg)
+    outcomes = OutcomeEvaluator(history, cfg)
+    try:
+        migrated = await history.migrate_legacy_pending()
+        if migrated:
+            log.info("Migrated %d pending outcomes from the legacy list", migrated)
+    except Exception as exc:
+        log.warning("Legacy pending outcomes migration failed: %s", exc)
 
     while True:
         try:
             await _cycle(redis)
+            # Разбираем очередь исходов пачками, пока есть созревшие сигналы
+            while await outcomes.run_batch() >= cfg.eval.outcome_batch_size:
+                pass
 
         except Exception as e:
             log.error(f"Eval engine error: {e}")
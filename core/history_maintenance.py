@@ -0,0 +1,42 @@
+import asyncio
+import logging
+
+from analytics.history_store import HistoryStore
+from analytics.segment_store import SegmentStore
+from state.redis_state import RedisState
+
+log = logging.getLogger("core.history_maintenance")
+
+
+async def run_history_maintenance(redis: RedisState, cfg):
+    """
+    Обслуживание дискового архива истории: компакция закрытых сегментов и
+    удаление сегментов старше disk_retention_sec. Писатели (core/stats engine)
+    трогают только активный сегмент, поэтому работа идет параллельно с записью.
+    """
+    hcfg = cfg.history
+    try:
+        dropped = await HistoryStore(redis, cfg).drop_legacy_indexes()
+        if dropped:
+            log.info("Dropped %d legacy history index keys from Redis", dropped)
+    except Exception as exc:
+        log.warning("Legacy history index cleanup failed: %s", exc)
+
+    if not hcfg.disk_enabled:
+        log.info("On-disk history disabled, maintenance not started")
+        return
+
+    stores = [SegmentStore(hcfg.disk_path, stream, hcfg) for stream in ("signals", "spreads")]
+    log.info("History maintenance started (%s)", hcfg.disk_path)
+
+    while True:
+        for store in stores:
+            try:
+                dropped = await asyncio.to_thread(store.enforce_retention)
+                compacted = await asyncio.to_thread(store.compact)
+                if dropped or compacted:
+                    log.info("History '%s': compacted=%d dropped=%d", store.stream, compacted, dropped)
+            except Exception as exc:
+                log.error("History maintenance error (%s): %s", store.stream, exc)
+
+        await asyncio.sleep(hcfg.disk_maintenance_interval_sec)
@@ -0,0 +1,49 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from state.models import LoopLagStats
+from state.redis_state import RedisState
+
+log = logging.getLogger("core.loop_monitor")
+
+
+async def run_loop_monitor(redis: RedisState, cfg):
+    """
+    Измеряет задержку event loop: насколько позже запланированного просыпается
+    asyncio.sleep(interval). Долгие синхронные участки (обучение, кластеризация)
+    напрямую видны как рост max/p99.
+    """
+    interval = cfg.monitor.loop_lag_interval_sec
+    report_every = cfg.monitor.loop_lag_report_sec
+    log.info("Loop lag monitor started")
+
+    samples: list[float] = []
+    window_start = time.monotonic()
+
+    while True:
+        before = time.monotonic()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.monotonic() - before - interval) * 1000)
+
+        if time.monotonic() - window_start < report_every:
+            continue
+
+        samples.sort()
+        stats = LoopLagStats(
+            avg_ms=sum(samples) / len(samples),
+            p99_ms=samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+            max_ms=samples[-1],
+            samples=len(samples),
+            updated_at=datetime.utcnow(),
+        )
+        samples = []
+        window_start = time.monotonic()
+
+        try:
+            await redis.set_loop_lag(stats)
+        except Exception as exc:
+            log.error("Loop lag monitor error: %s", exc)
+        if stats.max_ms >= cfg.monitor.loop_lag_warn_ms:
+            log.warning("Event loop lag: max=%.1fms p99=%.1fms", stats.max_ms, stats.p99_ms)
@@ -1,49 +1,178 @@
 import asyncio
+import json
 import logging
-import statistics
+import time
 from datetime import datetime
-from typing import List
+from typing import Any, Dict, Optional
 
 from analytics.history_store import HistoryStore
-from state.models import CoreSignal, ParamSnapshot
+from analytics.quantile_sketch import KLLSketch
+from core.backtest import run_backtest
+from state.models import ParamSnapshot, ScopeParams
 
 log = logging.getLogger("core.param_tuner")
 
+SKETCH_STORE_KEY = "state:tuner:sketches"
+METRICS = ("net_profit", "spread_bps", "volume_usd")
 
-def _extract_signals(raw: List[dict]) -> List[CoreSignal]:
-    result = []
-    for item in raw:
-        try:
-            result.append(CoreSignal(**item))
-        except Exception as exc:
-            log.debug("Skipping invalid historical signal: %s", exc)
-    return result
 
+def _scopes(signal: Dict[str, Any]) -> tuple[str, str, str]:
+    symbol = signal["symbol"]
+    return (
+        "global",
+        f"symbol:{symbol}",
+        f"route:{symbol}:{signal['buy_exchange']}>{signal['sell_exchange']}",
+    )
+
+
+class TunerSketches:
+    """
+    KLL-скетчи (net_profit, spread_bps, volume_usd) по глобальному, символьному и
+    маршрутному scope. Два поколения (current/previous) дают скользящее окно:
+    снимок строится из их слияния, стоимость не зависит от объема истории.
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.current: Dict[str, Dict[str, KLLSketch]] = {}
+        self.previous: Dict[str, Dict[str, KLLSketch]] = {}
+        self.rotated_at = time.time()
+        # id последнего учтенного сигнала (монотонный, state:signals:seq)
+        self.last_id: Optional[int] = None
+
+    def observe(self, signal: Dict[str, Any]):
+        values = {
+            "net_profit": signal["net_profit"],
+            "spread_bps": signal.get("spread_bps") or 0.0,
+            "volume_usd": signal["volume_usd"],
+        }
+        for scope in _scopes(signal):
+            sketches = self.current.get(scope)
+            if sketches is None:
+                sketches = self.current[scope] = {m: KLLSketch(self.k) for m in METRICS}
+            for metric, value in values.items():
+                sketches[metric].update(value)
+
+    def rotate(self):
+        self.previous, self.current = self.current, {}
+        self.rotated_at = time.time()
+
+    def _merged(self, scope: str) -> Optional[Dict[str, KLLSketch]]:
+        parts = [gen[scope] for gen in (self.previous, self.current) if scope in gen]
+        if not parts:
+            return None
+        merged = {m: KLLSketch(self.k) for m in METRICS}
+        for part in parts:
+            for metric in METRICS:
+                merged[metric].merge(part[metric])
+        return merged
+
+    def scope_params(self, scope: str, cfg) -> Optional[ScopeParams]:
+        sketches = self._merged(scope)
+        if sketches is None or sketches["net_profit"].n < cfg.tuner.min_scope_samples:
+            return None
+        return ScopeParams(
+            min_net_profit_usd=max(cfg.engine.min_net_profit_usd, sketches["net_profit"].quantile(0.75)),
+            min_spread_bps=max(cfg.engine.min_spread_bps, sketches["spread_bps"].quantile(0.5)),
+            min_volume_usd=max(cfg.engine.min_volume_usd, sketches["volume_usd"].quantile(0.5)),
+        )
+
+    def snapshot(self, cfg) -> ParamSnapshot:
+        glob = self.scope_params("global", cfg) or ScopeParams(
+            min_net_profit_usd=cfg.engine.min_net_profit_usd,
+            min_spread_bps=cfg.engine.min_spread_bps,
+            min_volume_usd=cfg.engine.min_volume_usd,
+        )
+        per_symbol: Dict[str, ScopeParams] = {}
+        per_route: Dict[str, ScopeParams] = {}
+        for scope in set(self.previous) | set(self.current):
+            kind, _, name = scope.partition(":")
+            if kind == "global":
+                continue
+            params = self.scope_params(scope, cfg)
+            if params is None:
+                continue
+            (per_symbol if kind == "symbol" else per_route)[name] = params
 
-def _compute_snapshot(signals: List[CoreSignal], defaults) -> ParamSnapshot:
-    if not signals:
         return ParamSnapshot(
-            min_net_profit_usd=defaults.engine.min_net_profit_usd,
-            min_spread_bps=defaults.engine.min_spread_bps,
-            min_volume_usd=defaults.engine.min_volume_usd,
+            min_net_profit_usd=glob.min_net_profit_usd,
+            min_spread_bps=glob.min_spread_bps,
+            min_volume_usd=glob.min_volume_usd,
+            per_symbol=per_symbol,
+            per_route=per_route,
             updated_at=datetime.utcnow(),
         )
 
-    net_profits = [s.net_profit for s in signals]
-    spreads = [s.spread_bps or 0 for s in signals]
-    volumes = [s.volume_usd for s in signals]
+    def to_dict(self) -> Dict[str, Any]:
+        def dump(gen):
+            return {scope: {m: s.to_dict() for m, s in sk.items()} for scope, sk in gen.items()}
 
-    median_profit = statistics.median(net_profits)
-    p75_profit = statistics.quantiles(net_profits, n=4)[2] if len(net_profits) >= 4 else median_profit
-    median_spread = statistics.median(spreads) if spreads else defaults.engine.min_spread_bps
-    median_volume = statistics.median(volumes) if volumes else defaults.engine.min_volume_usd
+        return {
+            "k": self.k,
+            "current": dump(self.current),
+            "previous": dump(self.previous),
+            "rotated_at": self.rotated_at,
+            "last_id": self.last_id,
+        }
 
-    return ParamSnapshot(
-        min_net_profit_usd=max(defaults.engine.min_net_profit_usd, p75_profit),
-        min_spread_bps=max(defaults.engine.min_spread_bps, median_spread),
-        min_volume_usd=max(defaults.engine.min_volume_usd, median_volume),
-        updated_at=datetime.utcnow(),
-    )
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TunerSketches":
+        def load(gen):
+            return {scope: {m: KLLSketch.from_dict(s) for m, s in sk.items()} for scope, sk in gen.items()}
+
+        sketches = cls(data.get("k", 200))
+        sketches.current = load(data.get("current", {}))
+        sketches.previous = load(data.get("previous", {}))
+        sketches.rotated_at = data.get("rotated_at", time.time())
+        sketches.last_id = data.get("last_id")
+        return sketches
+
+
+async def _load_sketches(redis, cfg, history: HistoryStore) -> TunerSketches:
+    raw = await redis.client.get(SKETCH_STORE_KEY)
+    if raw:
+        try:
+            sketches = TunerSketches.from_dict(json.loads(raw))
+            if sketches.last_id is None and (sketches.current or sketches.previous):
+                # Снимок со старым watermark по времени: уже учтенное не добавляем повторно
+                head = await history.recent_signals(1)
+                sketches.last_id = head[0].get("id") if head else None
+            return sketches
+        except Exception as exc:
+            log.warning("Stored tuner sketches are invalid, starting empty: %s", exc)
+    return TunerSketches(cfg.tuner.sketch_k)
+
+
+async def _save_sketches(redis, sketches: TunerSketches):
+    # Скетчи и last_id одним значением: после рестарта ничего не теряется и не дублируется
+    await redis.client.set(SKETCH_STORE_KEY, json.dumps(sketches.to_dict()))
+
+
+async def _ingest(sketches: TunerSketches, history: HistoryStore, cfg) -> int:
+    """Добавляет в скетчи только сигналы с id больше last_id."""
+    new = await history.signals_after(sketches.last_id, cfg.tuner.history_window)
+    for item in reversed(new):
+        try:
+            sketches.observe(item)
+        except (KeyError, TypeError) as exc:
+            log.debug("Skipping invalid historical signal: %s", exc)
+    ids = [item["id"] for item in new if item.get("id") is not None]
+    if ids:
+        sketches.last_id = max(ids)
+    return len(new)
+
+
+async def _run_backtest_mode(redis, cfg):
+    interval = cfg.tuner.update_interval_sec
+    while True:
+        try:
+            snap = await run_backtest(redis, cfg)
+            if snap:
+                await redis.set_param_snapshot(snap)
+        except Exception as exc:
+            log.error("Param tuner backtest error: %s", exc)
+
+        await asyncio.sleep(interval)
 
 
 async def run_param_tuner(redis, cfg):
@@ -51,23 +180,52 @@ async def run_param_tuner(redis, cfg):
         log.info("Param tuner disabled")
         return
 
+    if cfg.tuner.mode == "backtest":
+        log.info("Param tuner started (backtest mode)")
+        await _run_backtest_mode(redis, cfg)
+        return
+
     history = HistoryStore(redis, cfg)
-    interval = cfg.tuner.update_interval_sec
+    sketches = await _load_sketches(redis, cfg, history)
+    last_publish = 0.0
+    # Checkpoint скетчей — на cadence warm start, а не раз в update_interval_sec
+    last_checkpoint = time.monotonic()
+    dirty = False
 
     log.info("Param tuner started")
-    while True:
-        try:
-            raw_signals = await history.recent_signals(cfg.tuner.history_window)
-            signals = _extract_signals(raw_signals)
-            snap = _compute_snapshot(signals, cfg)
-            await redis.set_param_snapshot(snap)
-            log.debug(
-                "Tuner snapshot updated: profit>=%.4f spread>=%.4f vol>=%.2f",
-                snap.min_net_profit_usd,
-                snap.min_spread_bps,
-                snap.min_volume_usd,
-            )
-        except Exception as exc:
-            log.error("Param tuner error: %s", exc)
+    try:
+        while True:
+            try:
+                dirty |= await _ingest(sketches, history, cfg) > 0
 
-        await asyncio.sleep(interval)
+                now = time.time()
+                if now - sketches.rotated_at >= cfg.tuner.sketch_window_sec:
+                    sketches.rotate()
+                    dirty = True
+
+                if dirty and time.monotonic() - last_checkpoint >= cfg.warm_start.checkpoint_interval_sec:
+                    await _save_sketches(redis, sketches)
+                    last_checkpoint, dirty = time.monotonic(), False
+
+                if now - last_publish >= cfg.tuner.update_interval_sec:
+                    snap = sketches.snapshot(cfg)
+                    await redis.set_param_snapshot(snap)
+                    last_publish = now
+                    log.debug(
+                        "Tuner snapshot updated: profit>=%.4f spread>=%.4f vol>=%.2f (%d symbols, %d routes)",
+                        snap.min_net_profit_usd,
+                        snap.min_spread_bps,
+                        snap.min_volume_usd,
+                        len(snap.per_symbol),
+                        len(snap.per_route),
+                    )
+            except Exception as exc:
+                log.error("Param tuner error: %s", exc)
+
+            await asyncio.sleep(cfg.tuner.ingest_interval_sec)
+    finally:
+        if dirty:
+            try:
+                await _save_sketches(redis, sketches)
+            except Exception as exc:
+                log.warning("Tuner sketch checkpoint on shutdown failed: %s", exc)
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from typing import NamedTuple
+
+import numpy as np
+
+
+class RouteMetrics(NamedTuple):
+    spread: float | np.ndarray
+    spread_bps: float | np.ndarray
+    net_profit: float | np.ndarray
+    net_profit_bps: float | np.ndarray
+
+
+def _safe_div(num, den):
+    """Деление с нулём вместо inf/nan; работает и для скаляров, и для массивов."""
+    if isinstance(num, np.ndarray) or isinstance(den, np.ndarray):
+        num, den = np.broadcast_arrays(np.asarray(num, dtype=float), np.asarray(den, dtype=float))
+        out = np.zeros(num.shape)
+        np.divide(num, den, out=out, where=den != 0)
+        return out
+    return num / den if den else 0.0
+
+
+def route_metrics(buy_ask, sell_bid, volume_usd, fee_rate, slippage_rate) -> RouteMetrics:
+    """
+    Чистая детерминированная математика сигнала для маршрута buy@ask -> sell@bid.
+    Принимает скаляры или numpy-массивы (с broadcasting), формулы одни и те же
+    для core engine, оценки исходов и бэктеста.
+    """
+    spread = sell_bid - buy_ask
+    base_mid = (buy_ask + sell_bid) / 2.0
+    spread_bps = _safe_div(spread, base_mid) * 10_000
+
+    # Количество базовой валюты для объема volume_usd
+    quantity_base = _safe_div(volume_usd, base_mid)
+    gross_profit = spread * quantity_base
+
+    # Комиссии (покупка + продажа) и проскальзывание
+    total_fees_usd = 2 * volume_usd * fee_rate
+    total_slippage_usd = volume_usd * slippage_rate
+
+    net_profit = gross_profit - total_fees_usd - total_slippage_usd
+    net_profit_bps = _safe_div(net_profit, volume_usd) * 10_000
+
+    return RouteMetrics(spread, spread_bps, net_profit, net_profit_bps)
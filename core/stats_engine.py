@@ -1,10 +1,19 @@
 import asyncio
 import logging
+import time
 from datetime import datetime
-from typing import List, Dict
+from typing import Dict, List, Optional
+
+import numpy as np
 
 from analytics.history_store import HistoryStore
+from analytics.features import to_epoch
+from analytics.spread_matrix import build_spread_matrix, pack_matrix
+from analytics.spread_rollup import SpreadRollup
+from analytics.volatility import WINDOWS_SEC, VolatilityEstimator
+from core.signal_math import route_metrics
 from state.redis_state import RedisState
+from state.warm_start import WarmStartStore
 from state.models import MarketStats, ExchangeStats, SystemStatus, NormalizedBook
 
 log = logging.getLogger("core.stats_engine")
@@ -15,19 +24,96 @@ async def run_stats_engine(redis: RedisState, cfg):
 
     interval = cfg.engine.cycle_stats_sec
     history = HistoryStore(redis, cfg)
+    warm = WarmStartStore(redis, cfg)
+    volatility = VolatilityEstimator(cfg.stats.volatility_mode, cfg.stats.volatility_capacity)
+    if cfg.stats.volatility_capacity * cfg.collector.cycle_sec < WINDOWS_SEC["1h"]:
+        log.warning(
+            "stats.volatility_capacity=%d holds less than 1h of book updates (collector.cycle_sec=%.2f)",
+            cfg.stats.volatility_capacity,
+            cfg.collector.cycle_sec,
+        )
+    await _warm_up_volatility(volatility, cfg, history, warm)
+    # Время последнего учтенного снимка стаканов по символам
+    fed_ts: Dict[str, float] = {s: volatility.last_ts(s) or time.time() for s in cfg.collector.symbols}
+    rollup = SpreadRollup(redis, cfg) if cfg.history.rollup_enabled else None
+    if rollup:
+        # Незакрытые бакеты (до часа данных 1h) переживают рестарт через снимок
+        snapshot = await warm.load("rollup")
+        if snapshot and rollup.restore_state(*snapshot):
+            log.info("Rollup buckets restored from warm-start snapshot")
+
+    try:
+        while True:
+            try:
+                await _cycle(redis, cfg, history, volatility, rollup, fed_ts)
+                await history.flush_disk()
+                if warm.due("volatility"):
+                    await warm.save("volatility", *volatility.to_state())
+                if rollup and warm.due("rollup"):
+                    await warm.save("rollup", *rollup.to_state())
+            except Exception as e:
+                log.error(f"Stats engine error: {e}")
+
+            await asyncio.sleep(interval)
+    finally:
+        try:
+            await history.flush_disk(force=True)
+            if rollup:
+                await warm.save("rollup", *rollup.to_state())
+        except Exception as exc:
+            log.warning("Stats engine shutdown checkpoint failed: %s", exc)
 
-    while True:
+
+async def _warm_up_volatility(volatility: VolatilityEstimator, cfg, history: HistoryStore, warm: WarmStartStore):
+    """
+    Восстанавливает кольцевые буферы волатильности: из warm-start снимка, если он
+    свежий, затем догоняет по снимкам спредов, которых в нем еще нет.
+    """
+    snapshot = await warm.load("volatility")
+    if snapshot and volatility.restore_state(*snapshot):
+        log.info("Volatility state restored from warm-start snapshot")
+
+    for symbol in cfg.collector.symbols:
         try:
-            await _cycle(redis, cfg, history)
-        except Exception as e:
-            log.error(f"Stats engine error: {e}")
+            snaps = await history.recent_spreads(symbol, cfg.history.spreads_max_len)
+            since = volatility.last_ts(symbol) or float("-inf")
+            points = [
+                (ts, s.get("mid") or (s["best_bid"] + s["best_ask"]) / 2)
+                for s in snaps
+                if (ts := to_epoch(s["updated_at"])) > since
+            ]
+            volatility.warm_up(symbol, points)
+        except Exception as exc:
+            log.warning("Volatility warm-up failed for %s: %s", symbol, exc)
 
-        await asyncio.sleep(interval)
 
+async def _cycle(
+    redis: RedisState,
+    cfg,
+    history: HistoryStore,
+    volatility: VolatilityEstimator,
+    rollup: Optional[SpreadRollup],
+    fed_ts: Dict[str, float],
+):
+    # Книги читаются один раз за тик; матрица маршрутов — снимок для API и аналитики
+    symbols = cfg.collector.symbols
+    all_books = await redis.get_all_books(symbols)
+    matrix = build_spread_matrix(
+        all_books,
+        symbols,
+        _matrix_exchanges(cfg, all_books),
+        cfg.engine.volume_calc_usd,
+        cfg.engine.default_fee_rate,
+        cfg.engine.default_slippage_rate,
+        time.time(),
+    )
+    await redis.set_spread_matrix(pack_matrix(matrix))
 
-async def _cycle(redis: RedisState, cfg, history: HistoryStore):
-    market = await _calc_market_stats(redis, cfg, history)
-    exch = await _calc_exchange_stats(redis, cfg)
+    updates = await _book_updates(cfg, history, all_books, fed_ts)
+    market = await _calc_market_stats(cfg, all_books, updates, history, volatility, rollup)
+    exch = _calc_exchange_stats(cfg, all_books)
+    if rollup:
+        await rollup.flush()
 
     await redis.set_market_stats(market)
     await redis.set_exchange_stats(exch)
@@ -46,10 +132,75 @@ async def _cycle(redis: RedisState, cfg, history: HistoryStore):
     await redis.set_system_status(sys)
 
 
-async def _calc_market_stats(redis: RedisState, cfg, history: HistoryStore) -> List[MarketStats]:
+def _matrix_exchanges(cfg, all_books: Dict[str, Dict[str, NormalizedBook]]) -> List[str]:
+    """Биржи из конфига (стабильный порядок колонок) + встреченные в книгах (DEX и т.п.)."""
+    seen = {ex for books in all_books.values() for ex in books}
+    configured = list(cfg.collector.cex_exchanges)
+    return configured + sorted(seen - set(configured))
+
+
+async def _book_updates(
+    cfg,
+    history: HistoryStore,
+    all_books: Dict[str, Dict[str, NormalizedBook]],
+    fed_ts: Dict[str, float],
+) -> Dict[str, List[Dict]]:
+    """
+    Снимки стаканов, пришедшие от коллектора с прошлого тика (history:books, от старых
+    к новым): волатильность считается по каждому обновлению книг, а не раз в тик.
+    Без истории — один снимок из текущих книг.
+    """
+    if not cfg.history.enabled:
+        now = time.time()
+        return {
+            symbol: [{"ts": now, "books": {ex: [b.bid, b.ask] for ex, b in books.items()}}]
+            for symbol, books in all_books.items()
+            if books
+        }
+
+    updates: Dict[str, List[Dict]] = {}
+    for symbol in cfg.collector.symbols:
+        snaps = await history.books_since(symbol, fed_ts.get(symbol, 0.0))
+        if snaps:
+            updates[symbol] = snaps
+            fed_ts[symbol] = snaps[-1]["ts"]
+    return updates
+
+
+def _snapshot_mid(snap: Dict) -> Optional[float]:
+    mids = [(bid + ask) / 2 for bid, ask in snap["books"].values()]
+    return sum(mids) / len(mids) if mids else None
+
+
+def _feed_rollup(rollup: SpreadRollup, cfg, symbol: str, snap: Dict):
+    """Спред (bps) каждого маршрута buy@ask -> sell@bid из снимка стаканов коллектора."""
+    names = list(snap["books"])
+    if len(names) < 2:
+        return
+    quotes = np.array([snap["books"][ex] for ex in names], dtype=float)  # (E, 2): bid, ask
+    buy, sell = np.nonzero(~np.eye(len(names), dtype=bool))
+    _, spread_bps, _, _ = route_metrics(
+        quotes[buy, 1],
+        quotes[sell, 0],
+        cfg.engine.volume_calc_usd,
+        cfg.engine.default_fee_rate,
+        cfg.engine.default_slippage_rate,
+    )
+    for b, s, value in zip(buy, sell, spread_bps.tolist()):
+        rollup.add(symbol, f"{names[b]}>{names[s]}", snap["ts"], value)
+
+
+async def _calc_market_stats(
+    cfg,
+    all_books: Dict[str, Dict[str, NormalizedBook]],
+    updates: Dict[str, List[Dict]],
+    history: HistoryStore,
+    volatility: VolatilityEstimator,
+    rollup: Optional[SpreadRollup] = None,
+) -> List[MarketStats]:
     result = []
     for symbol in cfg.collector.symbols:
-        books: Dict[str, NormalizedBook] = await redis.get_books(symbol)
+        books = all_books.get(symbol)
         if not books:
             continue
 
@@ -58,7 +209,15 @@ async def _calc_market_stats(redis: RedisState, cfg, history: HistoryStore) -> L
             continue
 
         mid = sum(mids) / len(mids)
+        # Волатильность и 1s/1m/1h роллапы — по каждому обновлению книг, а не раз в тик
+        for snap in updates.get(symbol, ()):
+            snap_mid = _snapshot_mid(snap)
+            if snap_mid:
+                volatility.update(symbol, snap["ts"], snap_mid)
+            if rollup:
+                _feed_rollup(rollup, cfg, symbol, snap)
 
+        vol = volatility.get(symbol)
         try:
             best_ask = min(books.values(), key=lambda b: b.ask)
             best_bid = max(books.values(), key=lambda b: b.bid)
@@ -73,6 +232,11 @@ async def _calc_market_stats(redis: RedisState, cfg, history: HistoryStore) -> L
                     "spread_bps": spread_bps,
                     "best_bid": best_bid.bid,
                     "best_ask": best_ask.ask,
+                    "buy_exchange": best_ask.exchange,
+                    "sell_exchange": best_bid.exchange,
+                    "mid": mid,
+                    # Признак ML как его видел core engine — для реплея бэктеста
+                    "volatility_1h": vol["1h"],
                     "updated_at": datetime.utcnow(),
                 },
             )
@@ -83,7 +247,9 @@ async def _calc_market_stats(redis: RedisState, cfg, history: HistoryStore) -> L
             MarketStats(
                 symbol=symbol,
                 last_mid=mid,
-                volatility_1h=0.0,
+                volatility_1m=vol["1m"],
+                volatility_15m=vol["15m"],
+                volatility_1h=vol["1h"],
                 updated_at=datetime.utcnow(),
             )
         )
@@ -91,9 +257,9 @@ async def _calc_market_stats(redis: RedisState, cfg, history: HistoryStore) -> L
     return result
 
 
-async def _calc_exchange_stats(redis: RedisState, cfg) -> List[ExchangeStats]:
+def _calc_exchange_stats(cfg, all_books: Dict[str, Dict[str, NormalizedBook]]) -> List[ExchangeStats]:
     now = datetime.utcnow()
-    reference_books: Dict[str, NormalizedBook] = await redis.get_books(cfg.collector.symbols[0]) if cfg.collector.symbols else {}
+    reference_books: Dict[str, NormalizedBook] = all_books.get(cfg.collector.symbols[0], {}) if cfg.collector.symbols else {}
     
     all_exchanges = cfg.collector.cex_exchanges 
     
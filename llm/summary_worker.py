@@ -33,19 +33,13 @@ class LLMSummaryWorker:
     async def _load_context(self) -> Optional[str]:
         """Собирает данные из Redis и форматирует их в строку контекста для LLM."""
         
-        # 1. Сигналы (фильтруем по порогу high-value)
-        all_signals: List[CoreSignal] = await self._redis.get_signals()
-        
-        high_value_signals = sorted(
-            [
-                s for s in all_signals 
-                if s.net_profit_bps is not None and s.net_profit_bps >= self._engine_cfg.notify_min_profit_bps
-            ], 
-            key=lambda s: s.created_at, 
-            reverse=True
-        )[:self._max_signals_in_context]
-        
-        signal_context = "Recent High-Value Signals (Max 20):\n"
+        # 1. Сигналы: лучшие актуальные маршруты выше порога high-value (из лидерборда)
+        high_value_signals: List[CoreSignal] = await self._redis.get_top_signals(
+            limit=self._max_signals_in_context,
+            min_profit_bps=self._engine_cfg.notify_min_profit_bps,
+        )
+
+        signal_context = f"Top Current High-Value Opportunities (Max {self._max_signals_in_context}):\n"
         if high_value_signals:
             for s in high_value_signals:
                 signal_context += (
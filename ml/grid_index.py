@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import itertools
+from typing import Iterator, Tuple
+
+import numpy as np
+
+
+class GridIndex:
+    """
+    Пространственный индекс для поиска соседей в радиусе eps.
+
+    Точки проецируются на первые `dims` главных компонент (ортонормированная
+    проекция не увеличивает расстояния), проекция хешируется в сетку с шагом eps.
+    Кандидаты берутся только из соседних ячеек (3^dims), затем отсекаются по
+    точному расстоянию в полном пространстве.
+    """
+
+    def __init__(self, points: np.ndarray, eps: float, dims: int = 3):
+        self.points = points
+        self.eps = eps
+        self.sq_norms = np.einsum("ij,ij->i", points, points)
+        centered = points - points.mean(axis=0) if len(points) else points
+        dims = max(1, min(dims, points.shape[1]))
+        if len(points) > 1:
+            _, _, vt = np.linalg.svd(centered[: min(len(points), 20000)], full_matrices=False)
+            self.components = vt[:dims].T
+        else:
+            self.components = np.eye(points.shape[1])[:, :dims]
+        dims = self.components.shape[1]
+        # Ключ ячейки упаковывается в int64: по 62 // dims бит на координату
+        self._bits = 62 // dims
+
+        keys = self._keys(self._cells(points))
+        self.order = np.argsort(keys, kind="stable")
+        self.cell_keys, self.cell_start, self.cell_count = np.unique(
+            keys[self.order], return_index=True, return_counts=True
+        )
+        self.offsets = np.array(list(itertools.product((-1, 0, 1), repeat=dims)), dtype=np.int64)
+
+    def _cells(self, X: np.ndarray) -> np.ndarray:
+        return np.floor((X @ self.components) / self.eps).astype(np.int64)
+
+    def _keys(self, cells: np.ndarray) -> np.ndarray:
+        shift = np.int64(1 << (self._bits - 1))
+        keys = np.zeros(len(cells), dtype=np.int64)
+        for col in range(cells.shape[1]):
+            keys = (keys << self._bits) + (np.clip(cells[:, col], -shift, shift - 1) + shift)
+        return keys
+
+    def query_pairs(
+        self, queries: np.ndarray, max_pairs: int = 1 << 20
+    ) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Пары (индекс запроса, индекс точки, квадрат расстояния) в радиусе eps, пачками
+        по ~max_pairs. Запросы группируются по ячейкам, расстояния между парой ячеек
+        считаются одним матричным произведением.
+        """
+        if len(self.cell_keys) == 0 or len(queries) == 0:
+            return
+        eps2 = self.eps * self.eps
+        q_cells = self._cells(queries)
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        q_keys = self._keys(q_cells)
+        q_order = np.argsort(q_keys, kind="stable")
+        _, q_start, q_count = np.unique(q_keys[q_order], return_index=True, return_counts=True)
+
+        buf_q, buf_p, buf_d, buffered = [], [], [], 0
+        for start, count in zip(q_start, q_count):
+            qi = q_order[start : start + count]
+            q = queries[qi]
+            keys = self._keys(q_cells[qi[0]] + self.offsets)
+            pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+            for p in pos[self.cell_keys[pos] == keys]:
+                pj = self.order[self.cell_start[p] : self.cell_start[p] + self.cell_count[p]]
+                pts, p_norms = self.points[pj].T, self.sq_norms[pj]
+                # Плотные ячейки режутся по строкам, чтобы блок расстояний оставался <= max_pairs
+                step = max(1, max_pairs // len(pj))
+                for lo in range(0, len(qi), step):
+                    block = slice(lo, lo + step)
+                    d2 = q_norms[qi[block]][:, None] + p_norms[None, :] - 2.0 * (q[block] @ pts)
+                    rows, cols = np.nonzero(d2 <= eps2)
+                    if rows.size == 0:
+                        continue
+                    buf_q.append(qi[block][rows])
+                    buf_p.append(pj[cols])
+                    buf_d.append(np.maximum(d2[rows, cols], 0.0))
+                    buffered += rows.size
+                    if buffered >= max_pairs:
+                        yield np.concatenate(buf_q), np.concatenate(buf_p), np.concatenate(buf_d)
+                        buf_q, buf_p, buf_d, buffered = [], [], [], 0
+        if buffered:
+            yield np.concatenate(buf_q), np.concatenate(buf_p), np.concatenate(buf_d)
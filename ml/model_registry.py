@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from state.redis_state import RedisState
+
+log = logging.getLogger("ml.model_registry")
+
+
+class ModelRegistry:
+    """
+    Реестр версий модели в Redis. Формат blob определяет владелец модели
+    (для SignalFilter — SimpleLogisticModel.to_bytes / from_bytes).
+
+    state:ml:registry:{name}:v:{version}  — бинарный blob модели
+    state:ml:registry:{name}:versions     — ZSET известных версий (score = version)
+    state:ml:registry:{name}:meta         — HASH version -> JSON метаданных
+    state:ml:registry:{name}:active       — указатель на активную версию
+    state:ml:registry:{name}:seq          — счетчик версий
+    state:ml:registry:{name}:events       — pub/sub канал: номер новой активной версии
+
+    Публикация и смена активной версии выполняются в MULTI/EXEC: читатель видит
+    указатель только на уже записанный blob.
+    """
+
+    def __init__(self, redis: RedisState, name: str = "signal_filter", keep_versions: int = 20):
+        self.redis = redis
+        self.name = name
+        self.keep_versions = keep_versions
+        self.prefix = f"state:ml:registry:{name}"
+        self.channel = f"{self.prefix}:events"
+
+    def _blob_key(self, version: int) -> str:
+        return f"{self.prefix}:v:{version}"
+
+    async def publish(self, blob: bytes, meta: Optional[Dict] = None, activate: bool = True) -> int:
+        """Сохраняет модель новой версией и (по умолчанию) делает её активной."""
+        version = int(await self.redis.client.incr(f"{self.prefix}:seq"))
+        info = {"created_at": time.time(), **(meta or {})}
+
+        pipe = self.redis.binary.pipeline(transaction=True)
+        pipe.set(self._blob_key(version), blob)
+        pipe.zadd(f"{self.prefix}:versions", {version: version})
+        pipe.hset(f"{self.prefix}:meta", version, json.dumps(info))
+        if activate:
+            pipe.set(f"{self.prefix}:active", version)
+            pipe.publish(self.channel, version)
+        await pipe.execute()
+        await self._prune()
+        return version
+
+    async def _prune(self):
+        """Удаляет старые версии сверх keep_versions (активная не удаляется никогда)."""
+        versions_key = f"{self.prefix}:versions"
+        stale = await self.redis.client.zrange(versions_key, 0, -(self.keep_versions + 1))
+        if not stale:
+            return
+        active = await self.active_version()
+        stale = [int(v) for v in stale if int(v) != active]
+        if not stale:
+            return
+        pipe = self.redis.client.pipeline(transaction=True)
+        pipe.delete(*[self._blob_key(v) for v in stale])
+        pipe.zrem(versions_key, *stale)
+        pipe.hdel(f"{self.prefix}:meta", *stale)
+        await pipe.execute()
+
+    async def active_version(self) -> Optional[int]:
+        raw = await self.redis.client.get(f"{self.prefix}:active")
+        return int(raw) if raw else None
+
+    async def load(self, version: int) -> Optional[bytes]:
+        return await self.redis.binary.get(self._blob_key(version))
+
+    async def load_active(self) -> Tuple[Optional[int], Optional[bytes]]:
+        version = await self.active_version()
+        if version is None:
+            return None, None
+        return version, await self.load(version)
+
+    async def versions(self) -> List[Tuple[int, Dict]]:
+        raw_versions = await self.redis.client.zrange(f"{self.prefix}:versions", 0, -1)
+        meta = await self.redis.client.hgetall(f"{self.prefix}:meta")
+        return [(int(v), json.loads(meta.get(v, "{}"))) for v in raw_versions]
+
+    async def activate(self, version: int):
+        """Переключает указатель на существующую версию и уведомляет подписчиков."""
+        if not await self.redis.binary.exists(self._blob_key(version)):
+            raise KeyError(f"Model version {version} not found in registry '{self.name}'")
+        pipe = self.redis.client.pipeline(transaction=True)
+        pipe.set(f"{self.prefix}:active", version)
+        pipe.publish(self.channel, version)
+        await pipe.execute()
+        log.info("Registry '%s': active version -> %d", self.name, version)
+
+    async def rollback(self) -> int:
+        """Активирует предыдущую (по номеру) версию относительно текущей активной."""
+        active = await self.active_version()
+        older = [v for v, _ in await self.versions() if active is None or v < active]
+        if not older:
+            raise KeyError(f"No version older than {active} in registry '{self.name}'")
+        await self.activate(older[-1])
+        return older[-1]
+
+    async def watch(self, on_change: Callable[[int], Awaitable[None]]):
+        """Слушает канал событий и вызывает on_change(version) на каждую смену активной версии."""
+        pubsub = self.redis.client.pubsub()
+        await pubsub.subscribe(self.channel)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    await on_change(int(message["data"]))
+                except Exception as exc:
+                    log.error("Registry '%s' watcher error: %s", self.name, exc)
+        finally:
+            await pubsub.unsubscribe(self.channel)
+            await pubsub.aclose()
+
+
+async def _cli(args):
+    from config import CONFIG
+
+    registry = ModelRegistry(RedisState(CONFIG.redis), args.name, CONFIG.ml.registry_keep_versions)
+    if args.command == "list":
+        active = await registry.active_version()
+        for version, meta in await registry.versions():
+            mark = "*" if version == active else " "
+            print(f"{mark} {version:>6}  {json.dumps(meta)}")
+    elif args.command == "activate":
+        await registry.activate(args.version)
+        print(f"active version: {args.version}")
+    elif args.command == "rollback":
+        print(f"active version: {await registry.rollback()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model registry (list / activate / rollback)")
+    parser.add_argument("--name", default="signal_filter")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    activate = sub.add_parser("activate")
+    activate.add_argument("version", type=int)
+    sub.add_parser("rollback")
+    asyncio.run(_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,320 @@
 import asyncio
 import logging
-import math
-import random
-from typing import Dict, List, Optional
+from typing import List, NamedTuple, Optional
 
+import numpy as np
+
+from analytics.features import align_columns, is_current_schema
 from analytics.history_store import HistoryStore
+from ml.grid_index import GridIndex
+from ml.worker_pool import run_job
 from state.models import ClusterState, SignalCluster
+from state.warm_start import WarmStartStore
 
 log = logging.getLogger("ml.signal_clustering")
 
 
-def _euclidean(a: List[float], b: List[float]) -> float:
-    return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
+def _sq_distances(X: np.ndarray, C: np.ndarray) -> np.ndarray:
+    """Квадраты евклидовых расстояний (n, k) через ||x||² - 2x·c + ||c||²."""
+    d = (X * X).sum(axis=1)[:, None] - 2.0 * (X @ C.T) + (C * C).sum(axis=1)[None, :]
+    return np.maximum(d, 0.0)
+
+
+def _assign(X: np.ndarray, C: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    """Ближайший центроид для каждой строки (по чанкам, чтобы ограничить память)."""
+    labels = np.empty(len(X), dtype=np.int64)
+    for lo in range(0, len(X), chunk):
+        labels[lo : lo + chunk] = _sq_distances(X[lo : lo + chunk], C).argmin(axis=1)
+    return labels
+
+
+def _kmeans_plus_plus(X: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = np.empty((k, X.shape[1]))
+    centroids[0] = X[rng.integers(len(X))]
+    closest = _sq_distances(X, centroids[:1])[:, 0]
+    for i in range(1, k):
+        total = closest.sum()
+        idx = rng.choice(len(X), p=closest / total) if total > 0 else rng.integers(len(X))
+        centroids[i] = X[idx]
+        closest = np.minimum(closest, _sq_distances(X, centroids[i : i + 1])[:, 0])
+    return centroids
+
+
+def fit_kmeans(
+    X: np.ndarray,
+    k: int,
+    max_iter: int = 100,
+    tol: float = 1e-4,
+    batch_size: int = 0,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    k-means++ + Lloyd (полная выборка) или mini-batch k-means (Sculley), если
+    batch_size задан и меньше выборки. Останов — когда центроиды сдвигаются меньше tol.
+    """
+    rng = np.random.default_rng(seed)
+    seed_sample = X if batch_size <= 0 or len(X) <= batch_size * 10 else X[rng.choice(len(X), batch_size * 10, replace=False)]
+    centroids = _kmeans_plus_plus(seed_sample, k, rng)
+
+    if batch_size <= 0 or len(X) <= batch_size:
+        for _ in range(max_iter):
+            labels = _assign(X, centroids)
+            counts = np.bincount(labels, minlength=k)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, X)
+            new = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centroids)
+            shift = np.abs(new - centroids).max()
+            centroids = new
+            if shift < tol:
+                break
+        return centroids
+
+    counts = np.zeros(k)
+    for _ in range(max_iter):
+        batch = X[rng.choice(len(X), batch_size, replace=False)]
+        labels = _assign(batch, centroids)
+        old = centroids.copy()
+        batch_counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, batch)
+        counts += batch_counts
+        # Центроид сдвигается к среднему пачки с шагом batch_count / total_count
+        hit = batch_counts > 0
+        eta = batch_counts[hit] / counts[hit]
+        centroids[hit] = (1 - eta)[:, None] * centroids[hit] + eta[:, None] * (sums[hit] / batch_counts[hit][:, None])
+        if np.abs(centroids - old).max() < tol:
+            break
+    return centroids
+
+
+class KMeansResult(NamedTuple):
+    mean: np.ndarray
+    std: np.ndarray
+    centroids: np.ndarray  # в стандартизированной шкале
+    sizes: np.ndarray
+
+
+def cluster_job(X: np.ndarray, k: int, max_iter: int, tol: float, batch_size: int, seed: int = 0) -> KMeansResult:
+    """Задача процессного пула: стандартизация + k-means по матрице признаков."""
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    Xs = (X - mean) / std
+    centroids = fit_kmeans(Xs, k, max_iter=max_iter, tol=tol, batch_size=batch_size, seed=seed)
+    sizes = np.bincount(_assign(Xs, centroids), minlength=k)
+    return KMeansResult(mean, std, centroids, sizes)
+
+
+# --------------------------------------
+# DBSCAN (density-based) через GridIndex
+# --------------------------------------
+NOISE = -1
+
+
+def _nearest_core_label(index: GridIndex, core_labels: np.ndarray, Xs: np.ndarray) -> np.ndarray:
+    """Кластер ближайшей core-точки в радиусе eps, иначе NOISE."""
+    result = np.full(len(Xs), NOISE, dtype=np.int64)
+    best = np.full(len(Xs), np.inf)
+    for qi, pj, d2 in index.query_pairs(Xs):
+        order = np.argsort(-d2)  # ближайшие записываются последними и побеждают
+        qi, pj, d2 = qi[order], pj[order], d2[order]
+        better = d2 < best[qi]
+        best[qi[better]] = d2[better]
+        result[qi[better]] = core_labels[pj[better]]
+    return result
+
+
+def _connected_components(index: GridIndex) -> np.ndarray:
+    """
+    Компоненты связности графа eps-соседства точек индекса: проходы hooking
+    (минимальная метка по рёбрам) + pointer jumping до стабилизации. Рёбра
+    не материализуются целиком — каждый проход стримит пары из индекса.
+    """
+    labels = np.arange(len(index.points))
+    while True:
+        before = labels.copy()
+        for qi, pj, _ in index.query_pairs(index.points):
+            np.minimum.at(labels, qi, labels[pj])
+        while True:
+            jumped = labels[labels]
+            if np.array_equal(jumped, labels):
+                break
+            labels = jumped
+        if np.array_equal(labels, before):
+            return labels
+
+
+def dbscan(Xs: np.ndarray, eps: float, min_samples: int, grid_dims: int = 3) -> tuple[np.ndarray, np.ndarray]:
+    """Метки кластеров (NOISE для выбросов) и маска core-точек."""
+    n = len(Xs)
+    index = GridIndex(Xs, eps, grid_dims)
+    # Соседи считаются вместе с самой точкой, как в классическом DBSCAN
+    neighbours = np.zeros(n, dtype=np.int64)
+    for qi, _, _ in index.query_pairs(Xs):
+        neighbours += np.bincount(qi, minlength=n)
+    core = neighbours >= min_samples
+
+    labels = np.full(n, NOISE, dtype=np.int64)
+    if not core.any():
+        return labels, core
+
+    core_index = GridIndex(Xs[core], eps, grid_dims)
+    _, core_labels = np.unique(_connected_components(core_index), return_inverse=True)
+    labels[core] = core_labels
+    # Пограничные точки получают кластер ближайшего core-соседа
+    labels[~core] = _nearest_core_label(core_index, core_labels, Xs[~core])
+    return labels, core
+
+
+class DensityResult(NamedTuple):
+    mean: np.ndarray
+    std: np.ndarray
+    labels: np.ndarray
+    core: np.ndarray
+
+
+def density_job(X: np.ndarray, eps: float, min_samples: int, grid_dims: int) -> DensityResult:
+    """Задача процессного пула: стандартизация + DBSCAN."""
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    labels, core = dbscan((X - mean) / std, eps, min_samples, grid_dims)
+    return DensityResult(mean, std, labels, core)
+
 
+class DensityModel(NamedTuple):
+    feature_order: List[str]
+    mean: np.ndarray
+    std: np.ndarray
+    index: GridIndex  # по core-точкам
+    core_labels: np.ndarray
 
-def _vectorize(features: Dict[str, float], order: List[str]) -> List[float]:
-    return [float(features.get(k, 0.0)) for k in order]
+
+class ClusterModel(NamedTuple):
+    feature_order: List[str]
+    mean: np.ndarray
+    std: np.ndarray
+    centroids: np.ndarray
 
 
 class SignalClusterer:
     def __init__(self, cfg, redis):
         self.cfg = cfg
         self.redis = redis
-        self.feature_order: List[str] = []
-        self.centroids: List[List[float]] = []
+        self.model: Optional[ClusterModel] = None
+        self.warm = WarmStartStore(redis, cfg)
 
     async def training_loop(self, history: HistoryStore):
         if not self.cfg.clustering.enabled:
             return
+        await self.restore()
         interval = self.cfg.clustering.update_interval_sec
         while True:
             try:
                 await self.recompute(history)
+                await self.checkpoint()
             except Exception as exc:
                 log.error("Clustering error: %s", exc)
             await asyncio.sleep(interval)
 
     async def recompute(self, history: HistoryStore):
-        raw = await history.recent_features(self.cfg.clustering.history_window)
-        feature_list = [item.get("features") or {} for item in raw if item.get("features")]
+        cc = self.cfg.clustering
+        raw = await history.recent_features(cc.history_window)
+        feature_list = [item["features"] for item in raw if item.get("features") and is_current_schema(item)]
         if not feature_list:
             return
 
-        self.feature_order = sorted(feature_list[0].keys())
-        vectors = [_vectorize(f, self.feature_order) for f in feature_list]
-        k = min(self.cfg.clustering.k, len(vectors))
-        self.centroids = random.sample(vectors, k)
-
-        for _ in range(5):
-            assignments = [[] for _ in range(k)]
-            for vec in vectors:
-                idx = self._closest(vec)
-                assignments[idx].append(vec)
-            new_centroids = []
-            for group in assignments:
-                if not group:
-                    new_centroids.append(random.choice(vectors))
-                else:
-                    means = [sum(values) / len(values) for values in zip(*group)]
-                    new_centroids.append(means)
-            self.centroids = new_centroids
+        feature_order = sorted(feature_list[0].keys())
+        X = np.array([[float(f.get(k, 0.0)) for k in feature_order] for f in feature_list])
+        if cc.method == "dbscan":
+            state = await self._recompute_density(X, feature_order)
+        else:
+            state = await self._recompute_kmeans(X, feature_order)
+        await self.redis.set_cluster_state(state)
+
+    async def _recompute_kmeans(self, X: np.ndarray, feature_order: List[str]) -> ClusterState:
+        cc = self.cfg.clustering
+        k = min(cc.k, len(X))
+        batch_size = cc.batch_size if len(X) > cc.minibatch_threshold else 0
+        result = await run_job(
+            self.cfg.ml.process_pool_workers, cluster_job, X, k, cc.max_iter, cc.tol, batch_size
+        )
+
+        # Атомарная подмена: predict() видит согласованные порядок/скейлер/центроиды
+        self.model = ClusterModel(feature_order, result.mean, result.std, result.centroids)
+
+        raw_centroids = result.centroids * result.std + result.mean
+        clusters = [
+            SignalCluster(
+                cluster_id=idx,
+                size=int(size),
+                centroid={name: float(v) for name, v in zip(feature_order, centroid)},
+            )
+            for idx, (centroid, size) in enumerate(zip(raw_centroids, result.sizes))
+        ]
+        return ClusterState(clusters=clusters)
 
+    async def _recompute_density(self, X: np.ndarray, feature_order: List[str]) -> ClusterState:
+        cc = self.cfg.clustering
+        result = await run_job(
+            self.cfg.ml.process_pool_workers, density_job, X, cc.eps, cc.min_samples, cc.grid_dims
+        )
+
+        core_points = ((X - result.mean) / result.std)[result.core]
+        index = GridIndex(core_points, cc.eps, cc.grid_dims)
+        self.model = DensityModel(feature_order, result.mean, result.std, index, result.labels[result.core])
+
+        clustered = result.labels != NOISE
+        sizes = np.bincount(result.labels[clustered]) if clustered.any() else np.zeros(0, dtype=np.int64)
         clusters = []
-        for idx, centroid in enumerate(self.centroids):
+        for idx, size in enumerate(sizes):
+            centroid = X[result.labels == idx].mean(axis=0)
             clusters.append(
                 SignalCluster(
                     cluster_id=idx,
-                    size=len([v for v in vectors if self._closest(v) == idx]),
-                    centroid={k: v for k, v in zip(self.feature_order, centroid)},
+                    size=int(size),
+                    centroid={name: float(v) for name, v in zip(feature_order, centroid)},
                 )
             )
+        return ClusterState(clusters=clusters, noise=int((~clustered).sum()))
 
-        await self.redis.set_cluster_state(ClusterState(clusters=clusters))
+    async def checkpoint(self):
+        """Сохраняет текущую модель (скейлер + центроиды или core-точки) в warm-start снимок."""
+        model = self.model
+        if model is None:
+            return
+        if isinstance(model, DensityModel):
+            meta = {"kind": "dbscan", "feature_order": model.feature_order, "eps": model.index.eps}
+            arrays = {"mean": model.mean, "std": model.std, "core_points": model.index.points, "core_labels": model.core_labels}
+        else:
+            meta = {"kind": "kmeans", "feature_order": model.feature_order}
+            arrays = {"mean": model.mean, "std": model.std, "centroids": model.centroids}
+        await self.warm.save("clusterer", meta, arrays)
 
-    def _closest(self, vec: List[float]) -> int:
-        distances = [_euclidean(vec, c) for c in self.centroids]
-        return distances.index(min(distances)) if distances else 0
+    async def restore(self):
+        """Поднимает модель из warm-start снимка, чтобы predict работал до первого пересчета."""
+        snapshot = await self.warm.load("clusterer")
+        if snapshot is None:
+            return
+        meta, arrays = snapshot
+        if meta["kind"] == "dbscan":
+            index = GridIndex(arrays["core_points"], meta["eps"], self.cfg.clustering.grid_dims)
+            self.model = DensityModel(meta["feature_order"], arrays["mean"], arrays["std"], index, arrays["core_labels"])
+        else:
+            self.model = ClusterModel(meta["feature_order"], arrays["mean"], arrays["std"], arrays["centroids"])
+        log.info("Clusterer restored from warm-start snapshot (%s)", meta["kind"])
 
-    def predict(self, features: Dict[str, float]) -> Optional[int]:
-        if not self.centroids or not self.feature_order:
+    def predict_batch(self, X: np.ndarray, feature_order: Optional[List[str]] = None) -> Optional[np.ndarray]:
+        """
+        Кластеры для матрицы признаков; NOISE = -1. Без feature_order колонки
+        считаются уже упорядоченными как model.feature_order.
+        """
+        model = self.model
+        if model is None or len(X) == 0:
             return None
-        vec = _vectorize(features, self.feature_order)
-        return self._closest(vec)
+        if feature_order is not None:
+            X = align_columns(X, feature_order, model.feature_order)
+        Xs = (X - model.mean) / model.std
+        if isinstance(model, DensityModel):
+            return _nearest_core_label(model.index, model.core_labels, Xs)
+        return _assign(Xs, model.centroids)
@@ -1,63 +1,292 @@
 import asyncio
 import json
 import logging
-import math
+import struct
+import time
+from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
-log = logging.getLogger("ml.signal_filter")
+import numpy as np
 
-from analytics.features import label_from_profit
+from analytics.feature_store import FeatureStore
+from analytics.features import FEATURE_SCHEMA_VERSION, align_columns, is_current_schema
 from analytics.history_store import HistoryStore
+from ml.model_registry import ModelRegistry
+from ml.worker_pool import run_job
 from state.redis_state import RedisState
 
+log = logging.getLogger("ml.signal_filter")
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-np.clip(x, -500, 500)))
+
 
-def _sigmoid(x: float) -> float:
-    return 1 / (1 + math.exp(-x))
+def _log_loss(prob: np.ndarray, y: np.ndarray) -> float:
+    p = np.clip(prob, 1e-12, 1 - 1e-12)
+    return float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p)))
+
+
+def _newton_step(X: np.ndarray, y: np.ndarray, w: np.ndarray, b: float, l2: float) -> Tuple[np.ndarray, float]:
+    """Один full-batch шаг Ньютона (IRLS) для логистической регрессии с L2 (bias без штрафа)."""
+    n, d = X.shape
+    Xb = np.hstack([X, np.ones((n, 1))])
+    theta = np.append(w, b)
+    p = _sigmoid(Xb @ theta)
+    reg = np.full(d + 1, l2)
+    reg[-1] = 0.0
+    grad = Xb.T @ (p - y) / n + reg * theta
+    hess = (Xb.T * (p * (1 - p))) @ Xb / n + np.diag(reg) + 1e-9 * np.eye(d + 1)
+    theta = theta - np.linalg.solve(hess, grad)
+    return theta[:-1], float(theta[-1])
 
 
 class SimpleLogisticModel:
+    """
+    Логистическая регрессия на NumPy: стандартизация признаков, L2, early stopping по
+    hold-out; full-batch — шагами Ньютона, mini-batch — градиентным спуском.
+
+    Веса хранятся плотным массивом; в snapshot() они сворачиваются обратно в исходную
+    шкалу признаков, поэтому формат {"weights", "bias", "feature_order"} совместим
+    со старыми снимками.
+    """
+
     def __init__(self):
         self.weights: Dict[str, float] = {}
         self.bias: float = 0.0
         self.feature_order: List[str] = []
+        self.scaler_mean: Optional[np.ndarray] = None
+        self.scaler_std: Optional[np.ndarray] = None
+        self.seen: int = 0  # сколько примеров видела модель (вес текущего скейлера)
+        self.updates: int = 0  # число онлайн-шагов (для затухания learning rate)
+        self.schema_version: int = FEATURE_SCHEMA_VERSION
+        self._w = np.zeros(0)
 
-    def _vectorize(self, features: Dict[str, float]) -> List[float]:
-        if not self.feature_order:
-            self.feature_order = sorted(features.keys())
-        return [float(features.get(k, 0.0)) for k in self.feature_order]
+    def design_matrix(self, feature_dicts: List[Dict[str, float]]) -> np.ndarray:
+        if not self.feature_order and feature_dicts:
+            self.feature_order = sorted(feature_dicts[0].keys())
+        X = np.empty((len(feature_dicts), len(self.feature_order)))
+        for i, feats in enumerate(feature_dicts):
+            X[i] = [feats.get(k, 0.0) for k in self.feature_order]
+        return X
 
-    def fit(self, samples: List[Tuple[Dict[str, float], int]], lr: float = 0.01, epochs: int = 30):
+    def fit(
+        self,
+        samples: List[Tuple[Dict[str, float], int]],
+        lr: float = 0.1,
+        epochs: int = 300,
+        l2: float = 1e-3,
+        batch_size: int = 0,
+        patience: int = 3,
+        seed: int = 0,
+    ):
         if not samples:
             return
+        X = self.design_matrix([f for f, _ in samples])
+        y = np.fromiter((label for _, label in samples), dtype=float, count=len(samples))
+        self.fit_arrays(X, y, lr=lr, epochs=epochs, l2=l2, batch_size=batch_size, patience=patience, seed=seed)
+
+    def fit_arrays(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        lr: float = 0.1,
+        epochs: int = 300,
+        l2: float = 1e-3,
+        batch_size: int = 0,
+        patience: int = 3,
+        seed: int = 0,
+    ):
+        """Обучение на готовой матрице признаков (порядок колонок — feature_order)."""
+        n, d = X.shape
+        if n == 0:
+            return
+
+        mean = X.mean(axis=0, dtype=np.float64)
+        std = X.std(axis=0, dtype=np.float64)
+        std[std == 0] = 1.0
+        Xs = (X - mean) / std
+
+        # Детерминированный hold-out: каждый 5-й пример — валидация
+        val_mask = np.zeros(n, dtype=bool)
+        if n >= 20:
+            val_mask[::5] = True
+        X_tr, y_tr = Xs[~val_mask], y[~val_mask]
+        X_val, y_val = (Xs[val_mask], y[val_mask]) if val_mask.any() else (X_tr, y_tr)
+
+        rng = np.random.default_rng(seed)
+        w = np.zeros(d)
+        b = 0.0
+        best = (np.inf, w.copy(), b)
+        stale = 0
+        batch = batch_size or len(y_tr)
 
         for _ in range(epochs):
-            for feats, label in samples:
-                vec = self._vectorize(feats)
-                score = self.bias + sum(self.weights.get(k, 0.0) * v for k, v in zip(self.feature_order, vec))
-                prob = _sigmoid(score)
-
-                # Gradient descent step
-                error = label - prob
-                self.bias += lr * error
-                for k, v in zip(self.feature_order, vec):
-                    self.weights[k] = self.weights.get(k, 0.0) + lr * error * v
-
-    def predict_proba(self, features: Dict[str, float]) -> float:
-        vec = self._vectorize(features)
-        score = self.bias + sum(self.weights.get(k, 0.0) * v for k, v in zip(self.feature_order, vec))
-        return _sigmoid(score)
+            if batch >= len(y_tr):
+                w, b = _newton_step(X_tr, y_tr, w, b, l2)
+            else:
+                order = rng.permutation(len(y_tr))
+                for lo in range(0, len(order), batch):
+                    idx = order[lo : lo + batch]
+                    xb, yb = X_tr[idx], y_tr[idx]
+                    err = _sigmoid(xb @ w + b) - yb
+                    w -= lr * (xb.T @ err / len(idx) + l2 * w)
+                    b -= lr * float(err.mean())
+
+            val_loss = _log_loss(_sigmoid(X_val @ w + b), y_val)
+            if val_loss < best[0] - 1e-6:
+                best = (val_loss, w.copy(), b)
+                stale = 0
+            else:
+                stale += 1
+                if stale >= patience:
+                    break
+
+        _, w, b = best
+        self.scaler_mean, self.scaler_std = mean, std
+        self.seen, self.updates = n, 0
+        # Сворачиваем стандартизацию в веса исходной шкалы
+        self._w = w / std
+        self.bias = float(b - np.sum(w * mean / std))
+        self.weights = {k: float(v) for k, v in zip(self.feature_order, self._w)}
+
+    def partial_fit(self, X: np.ndarray, y: np.ndarray, lr: float = 0.05, lr_decay: float = 1e-3, l2: float = 1e-4):
+        """
+        Онлайн-шаг на новой пачке: обновляет скейлер (объединение моментов) и делает
+        SGD-шаг в стандартизированном пространстве с затухающим learning rate.
+        """
+        n, d = X.shape
+        if n == 0:
+            return
+        if self.scaler_mean is None or self.seen == 0:
+            self.scaler_mean = np.zeros(d)
+            self.scaler_std = np.ones(d)
+        if self._w.size != d:
+            self._w = np.array([float(self.weights.get(k, 0.0)) for k in self.feature_order]) if self.weights else np.zeros(d)
+
+        # Веса в стандартизированной шкале старого скейлера
+        ws = self._w * self.scaler_std
+        bs = self.bias + float(np.sum(self._w * self.scaler_mean))
+
+        # Объединяем моменты (Chan et al.) старой статистики и пачки
+        if self.seen == 0:
+            mean, var = X.mean(axis=0), X.var(axis=0)
+        else:
+            total = self.seen + n
+            delta = X.mean(axis=0) - self.scaler_mean
+            mean = self.scaler_mean + delta * n / total
+            m2 = self.scaler_std ** 2 * self.seen + X.var(axis=0) * n + delta ** 2 * self.seen * n / total
+            var = m2 / total
+        std = np.sqrt(var)
+        std[std == 0] = 1.0
+        self.scaler_mean, self.scaler_std = mean, std
+        self.seen += n
+
+        Xs = (X - mean) / std
+        step = lr / (1.0 + lr_decay * self.updates)
+        err = _sigmoid(Xs @ ws + bs) - y
+        ws = ws - step * (Xs.T @ err / n + l2 * ws)
+        bs = bs - step * float(err.mean())
+        self.updates += 1
+
+        self._w = ws / std
+        self.bias = float(bs - np.sum(ws * mean / std))
+        self.weights = {k: float(v) for k, v in zip(self.feature_order, self._w)}
+
+    def predict_proba_matrix(self, X: np.ndarray) -> np.ndarray:
+        return _sigmoid(X @ self._w + self.bias)
 
     def snapshot(self) -> Dict[str, Any]:
-        return {
+        snap: Dict[str, Any] = {
             "weights": self.weights,
             "bias": self.bias,
             "feature_order": self.feature_order,
+            "schema_version": self.schema_version,
         }
+        if self.scaler_mean is not None:
+            snap["scaler_mean"] = self.scaler_mean.tolist()
+            snap["scaler_std"] = self.scaler_std.tolist()
+            snap["seen"] = self.seen
+            snap["updates"] = self.updates
+        return snap
 
     def load_snapshot(self, snap: Dict[str, Any]):
         self.weights = snap.get("weights", {})
         self.bias = snap.get("bias", 0.0)
         self.feature_order = snap.get("feature_order", [])
+        self.schema_version = int(snap.get("schema_version", 1))
+        self._w = np.array([float(self.weights.get(k, 0.0)) for k in self.feature_order])
+        if "scaler_mean" in snap:
+            self.scaler_mean = np.asarray(snap["scaler_mean"], dtype=float)
+            self.scaler_std = np.asarray(snap["scaler_std"], dtype=float)
+            self.seen = int(snap.get("seen", 0))
+            self.updates = int(snap.get("updates", 0))
+
+
+    # --- Бинарный формат для реестра моделей ---
+    # <заголовок><имена признаков utf-8 через \n><паддинг до 8><w[d]>[<mean[d]><std[d]>]
+    _HEADER = struct.Struct("<4sHHHBxQQdI")
+    _MAGIC = b"SLMB"
+    _FORMAT_VERSION = 1
+
+    def to_bytes(self) -> bytes:
+        d = len(self.feature_order)
+        w = np.asarray(self._w, dtype="<f8") if self._w.size == d else np.array(
+            [float(self.weights.get(k, 0.0)) for k in self.feature_order], dtype="<f8"
+        )
+        names = "\n".join(self.feature_order).encode("utf-8")
+        has_scaler = self.scaler_mean is not None
+        header = self._HEADER.pack(
+            self._MAGIC, self._FORMAT_VERSION, self.schema_version, d, int(has_scaler),
+            self.seen, self.updates, self.bias, len(names),
+        )
+        pad = b"\0" * (-(len(header) + len(names)) % 8)
+        parts = [header, names, pad, w.tobytes()]
+        if has_scaler:
+            parts += [np.asarray(self.scaler_mean, dtype="<f8").tobytes(), np.asarray(self.scaler_std, dtype="<f8").tobytes()]
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SimpleLogisticModel":
+        magic, fmt, schema_version, d, has_scaler, seen, updates, bias, names_len = cls._HEADER.unpack_from(data)
+        if magic != cls._MAGIC or fmt != cls._FORMAT_VERSION:
+            raise ValueError(f"Unsupported model blob (magic={magic!r}, format={fmt})")
+        offset = cls._HEADER.size
+        names = data[offset : offset + names_len].decode("utf-8")
+        offset += names_len
+        offset += -offset % 8
+        arrays = np.frombuffer(data, dtype="<f8", count=d * (3 if has_scaler else 1), offset=offset)
+
+        model = cls()
+        model.feature_order = names.split("\n") if d else []
+        model.schema_version, model.seen, model.updates, model.bias = schema_version, seen, updates, bias
+        model._w = arrays[:d].copy()
+        if has_scaler:
+            model.scaler_mean, model.scaler_std = arrays[d : 2 * d].copy(), arrays[2 * d :].copy()
+        model.weights = dict(zip(model.feature_order, model._w.tolist()))
+        return model
+
+
+def train_job(X: np.ndarray, y: np.ndarray, feature_order: List[str], params: Dict[str, Any]) -> Dict[str, Any]:
+    """Задача процессного пула: массивы на вход, snapshot модели на выход."""
+    model = SimpleLogisticModel()
+    model.feature_order = list(feature_order)
+    model.fit_arrays(X, y, **params)
+    return model.snapshot()
+
+
+def train_store_job(cfg, since_ts: float, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Задача процессного пула: обучение прямо по memmap-окну колоночного хранилища
+    (данные не сериализуются между процессами).
+    """
+    window = FeatureStore(cfg).load(since_ts, cfg.feature_store.train_max_rows)
+    if window is None or len(window.y) == 0:
+        return None
+    model = SimpleLogisticModel()
+    model.feature_order = list(window.columns)
+    model.fit_arrays(window.X, window.y.astype(float), **params)
+    return model.snapshot()
 
 
 class SignalFilter:
@@ -66,13 +295,24 @@ class SignalFilter:
         self.redis = redis
         self.model = SimpleLogisticModel()
         self._last_error_logged = False
-        self._store_key = "state:ml:signal_filter"
+        # Предупреждение о схеме признаков — отдельно от ошибок инференса
+        self._schema_warned = False
+        self.registry = ModelRegistry(redis, "signal_filter", cfg.ml.registry_keep_versions)
+        # Старый формат хранения (JSON); читается один раз для миграции в реестр
+        self._legacy_key = "state:ml:signal_filter"
+        # Активная версия реестра в памяти и время последней сверки указателя
+        self.version: Optional[int] = None
+        self._version_checked = 0.0
 
     async def training_loop(self, history: HistoryStore):
-        if not self.cfg.ml.enable: 
+        if not self.cfg.ml.enabled:
             return
         
-        interval = self.cfg.ml.update_interval_sec
+        if self.cfg.ml.mode == "online":
+            await self.online_loop(history)
+            return
+
+        interval = self.cfg.ml.train_interval_sec
         log.info("Signal filter training loop started")
 
         while True:
@@ -83,7 +323,29 @@ class SignalFilter:
             
             await asyncio.sleep(interval)
             
+    def _train_params(self) -> Dict[str, Any]:
+        ml = self.cfg.ml
+        return {
+            "lr": ml.learning_rate,
+            "epochs": ml.max_epochs,
+            "l2": ml.l2,
+            "batch_size": ml.batch_size,
+            "patience": ml.early_stopping_patience,
+        }
+
+    async def _install(self, snap: Dict[str, Any]):
+        model = SimpleLogisticModel()
+        model.load_snapshot(snap)
+        # Атомарная подмена: score() всегда видит либо старую, либо новую модель целиком
+        self.model = model
+        self._schema_warned = False
+        await self._save_model()
+
     async def re_train(self, history: HistoryStore):
+        if self.cfg.feature_store.enabled:
+            await self._re_train_from_store()
+            return
+
         raw_features = await history.recent_features(self.cfg.ml.history_window)
         samples = []
 
@@ -94,35 +356,173 @@ class SignalFilter:
             for item in raw_features:
                 feats = item.get("features") or {}
                 label = item.get("label")
-                if feats and label is not None:
+                if feats and label is not None and is_current_schema(item):
                     samples.append((feats, int(label)))
 
         if not samples:
             log.debug("Signal filter skipped training due to empty samples")
             return
 
-        self.model = SimpleLogisticModel()
-        self.model.fit(samples)
-        await self.redis.client.set(
-            "state:ml:signal_filter", json.dumps(self.model.snapshot())
+        builder = SimpleLogisticModel()
+        X = builder.design_matrix([f for f, _ in samples])
+        y = np.fromiter((label for _, label in samples), dtype=float, count=len(samples))
+        snap = await run_job(
+            self.cfg.ml.process_pool_workers, train_job, X, y, builder.feature_order, self._train_params()
         )
+        await self._install(snap)
         log.debug("Signal filter trained on %d samples", len(samples))
 
-    async def score(self, features: Dict[str, float]) -> Optional[float]:
-        if not self.cfg.ml.enable:
+    async def _re_train_from_store(self):
+        since_ts = time.time() - self.cfg.feature_store.train_window_sec
+        snap = await run_job(
+            self.cfg.ml.process_pool_workers, train_store_job, self.cfg, since_ts, self._train_params()
+        )
+        if snap is None:
+            log.debug("Signal filter skipped training: feature store window is empty")
+            return
+        await self._install(snap)
+        log.debug("Signal filter trained from feature store")
+
+    async def online_loop(self, history: HistoryStore):
+        """
+        Онлайн-обучение: новые размеченные записи признаков сразу идут в partial_fit
+        мини-пачками; модель периодически сохраняется в Redis.
+        """
+        ml = self.cfg.ml
+        log.info("Signal filter online learning started")
+
+        await self._refresh_model(force=True)
+        if not self.model.weights:
+            await self.re_train(history)
+        watermark = datetime.utcnow()
+        last_checkpoint = time.monotonic()
+
+        while True:
+            try:
+                records = await history.features_since(watermark, ml.history_window)
+                if records:
+                    watermark = datetime.fromisoformat(records[0]["created_at"])
+                    samples = [
+                        (r["features"], int(r["label"]))
+                        for r in reversed(records)
+                        if r.get("features") and r.get("label") is not None and is_current_schema(r)
+                    ]
+                    if samples:
+                        self._online_update(samples)
+
+                if time.monotonic() - last_checkpoint >= ml.checkpoint_interval_sec and self.model.weights:
+                    await self._save_model()
+                    last_checkpoint = time.monotonic()
+            except Exception as exc:
+                log.error("Signal filter online learning error: %s", exc)
+
+            await asyncio.sleep(ml.online_poll_sec)
+
+    async def _save_model(self):
+        """Публикует модель новой активной версией реестра (подписчики получат уведомление)."""
+        model = self.model
+        self.version = await self.registry.publish(
+            model.to_bytes(),
+            {"schema_version": model.schema_version, "seen": model.seen, "mode": self.cfg.ml.mode},
+        )
+        self._version_checked = time.monotonic()
+
+    async def _swap_to(self, version: int) -> bool:
+        """Загружает версию из реестра и атомарно подменяет модель."""
+        blob = await self.registry.load(version)
+        if blob is None:
+            return False
+        self.model, self.version = SimpleLogisticModel.from_bytes(blob), version
+        self._schema_warned = False
+        log.info("Signal filter switched to model version %d", version)
+        return True
+
+    async def _refresh_model(self, force: bool = False):
+        """
+        Страховка к pub/sub: сверяет активную версию реестра не чаще
+        model_check_interval_sec (в том числе пока модели нет) и подгружает
+        модель только при её смене.
+        """
+        now = time.monotonic()
+        if not force and now - self._version_checked < self.cfg.ml.model_check_interval_sec:
+            return
+        self._version_checked = now
+        version = await self.registry.active_version()
+        if version is None:
+            await self._migrate_legacy()
+            return
+        if version != self.version:
+            await self._swap_to(version)
+
+    async def _migrate_legacy(self):
+        """Переносит JSON-снимок старого формата в реестр первой версией."""
+        raw = await self.redis.client.get(self._legacy_key)
+        if not raw:
+            return
+        model = SimpleLogisticModel()
+        model.load_snapshot(json.loads(raw))
+        self.model = model
+        await self._save_model()
+        log.info("Migrated legacy signal filter snapshot to registry version %d", self.version)
+
+    async def warm_start(self):
+        """Загружает активную версию из реестра при старте, до первого цикла скоринга."""
+        if not self.cfg.ml.enabled:
+            return
+        try:
+            await self._refresh_model(force=True)
+        except Exception as exc:
+            log.warning("Signal filter warm start failed: %s", exc)
+
+    async def watch_registry(self):
+        """Фоновая задача: горячая подмена модели по событию смены активной версии."""
+        if not self.cfg.ml.enabled:
+            return
+
+        async def on_change(version: int):
+            if version != self.version:
+                await self._swap_to(version)
+
+        while True:
+            try:
+                await self.registry.watch(on_change)
+            except Exception as exc:
+                log.error("Signal filter registry watch error: %s", exc)
+            await asyncio.sleep(self.cfg.ml.model_check_interval_sec)
+
+    async def score_batch(self, X: np.ndarray, feature_order: List[str]) -> Optional[np.ndarray]:
+        """Вероятности для всех кандидатов цикла одним матричным умножением."""
+        if not self.cfg.ml.enabled or len(X) == 0:
             return None
         try:
-            if not self.model.weights:
-                snap_raw = await self.redis.client.get("state:ml:signal_filter")
-                if isinstance(snap_raw, str):
-                    try:
-                        snap = json.loads(snap_raw)
-                        self.model.load_snapshot(snap)
-                    except Exception:
-                        pass
-            return self.model.predict_proba(features)
+            await self._refresh_model()
+            model = self.model
+            if not model.weights:
+                return None
+            if model.schema_version != FEATURE_SCHEMA_VERSION and not self._schema_warned:
+                log.warning(
+                    "Signal filter model uses feature schema v%d (current v%d) until next retrain",
+                    model.schema_version,
+                    FEATURE_SCHEMA_VERSION,
+                )
+                self._schema_warned = True
+            return model.predict_proba_matrix(align_columns(X, feature_order, model.feature_order))
         except Exception as exc:
             if not self._last_error_logged:
-                log.error("Signal filter inference failed: %s", exc)
+                log.error("Signal filter batch inference failed: %s", exc)
                 self._last_error_logged = True
-            return None
\ No newline at end of file
+            return None
+
+    def _online_update(self, samples: List[Tuple[Dict[str, float], int]]):
+        ml = self.cfg.ml
+        X = self.model.design_matrix([f for f, _ in samples])
+        y = np.fromiter((label for _, label in samples), dtype=float, count=len(samples))
+        for lo in range(0, len(y), ml.online_batch_size):
+            self.model.partial_fit(
+                X[lo : lo + ml.online_batch_size],
+                y[lo : lo + ml.online_batch_size],
+                lr=ml.online_learning_rate,
+                lr_decay=ml.online_lr_decay,
+                l2=ml.l2,
+            )
+        log.debug("Signal filter online update on %d samples", len(y))
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+log = logging.getLogger("ml.worker_pool")
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool(workers: int) -> ProcessPoolExecutor:
+    """Общий пул процессов для CPU-задач ML (обучение, кластеризация)."""
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=max(1, workers))
+        log.info("ML process pool started with %d workers", max(1, workers))
+    return _POOL
+
+
+def shutdown_process_pool():
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
+
+
+async def run_job(workers: int, fn: Callable[..., Any], *args) -> Any:
+    """
+    Запускает задачу в пуле, не блокируя event loop; логирует длительность.
+    `fn` должна быть top-level функцией модуля (импортируется в дочернем процессе).
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    result = await loop.run_in_executor(get_process_pool(workers), fn, *args)
+    log.debug("%s finished in %.1f ms", fn.__name__, (time.perf_counter() - started) * 1000)
+    return result
+
@@ -9,6 +9,7 @@ import aiohttp
 
 from config import Config
 from state.redis_state import RedisState
+from state.warm_start import WarmStartStore
 from state.models import CoreSignal, SystemStatus, LLMSummary 
 # NOTE: Для работы требуются методы get_system_status, get_signals, get_llm_summary в RedisState
 
@@ -34,6 +35,8 @@ class TelegramNotifier:
         self._last_system_status: Optional[SystemStatus] = None
         self._last_llm_summary_ts: datetime = datetime.min
         self._last_signal_ts: datetime = datetime.min
+        # Дебаунс и курсоры переживают рестарт (иначе повторная рассылка старых сигналов)
+        self._warm = WarmStartStore(redis, cfg)
         
         if self._cfg.token:
             self.BASE_URL = f"https://api.telegram.org/bot{self._cfg.token}/"
@@ -79,6 +82,26 @@ class TelegramNotifier:
         return True
 
 
+    async def _restore_state(self):
+        snapshot = await self._warm.load("notifier")
+        if snapshot is None:
+            return
+        meta, _ = snapshot
+        self._debounce_cache = {k: datetime.fromisoformat(v) for k, v in meta.get("debounce", {}).items()}
+        self._last_signal_ts = datetime.fromisoformat(meta.get("last_signal_ts", datetime.min.isoformat()))
+        self._last_llm_summary_ts = datetime.fromisoformat(meta.get("last_llm_summary_ts", datetime.min.isoformat()))
+        log.info("Telegram notifier state restored (%d debounce keys)", len(self._debounce_cache))
+
+    async def _checkpoint_state(self):
+        await self._warm.save(
+            "notifier",
+            {
+                "debounce": {k: v.isoformat() for k, v in self._debounce_cache.items()},
+                "last_signal_ts": self._last_signal_ts.isoformat(),
+                "last_llm_summary_ts": self._last_llm_summary_ts.isoformat(),
+            },
+        )
+
     async def _check_critical_status(self, current_status: SystemStatus):
         """Проверяет критические состояния (Redis/CEX) и отправляет в Admin Chat."""
         
@@ -138,7 +161,11 @@ class TelegramNotifier:
 
     async def _check_high_value_signals(self):
         """Проверяет новые высокодоходные сигналы и отправляет их (Rule 3)."""
-        signals: list[CoreSignal] = await self._redis.get_signals()
+        # Только актуальные маршруты выше порога — из лидерборда, без выборки всего списка
+        signals: list[CoreSignal] = await self._redis.get_top_signals(
+            limit=self._engine_cfg.top_max_size,
+            min_profit_bps=self._engine_cfg.notify_min_profit_bps,
+        )
         
         new_high_value_signals: list[CoreSignal] = []
         max_ts = self._last_signal_ts
@@ -189,6 +216,7 @@ class TelegramNotifier:
             return
 
         log.info("Telegram notifier started.")
+        await self._restore_state()
         
         # Периоды проверки (используем меньшее значение для частого опроса)
         check_interval = min(self._engine_cfg.cycle_core_sec, 5.0) # 1.5s или 5s
@@ -206,6 +234,9 @@ class TelegramNotifier:
                 # 3. Проверка LLM-сводок (не чаще, чем worker их генерирует)
                 await self._check_llm_summary() # Вызов внутри проверит time delta
 
+                if self._warm.due("notifier"):
+                    await self._checkpoint_state()
+
             except asyncio.CancelledError:
                 log.warning("Telegram notifier stopped by cancellation.")
                 break
@@ -18,6 +18,9 @@ from core.core_engine import run_core_engine
 from core.eval_engine import run_eval_engine
 from core.stats_engine import run_stats_engine
 from core.param_tuner import run_param_tuner
+from core.loop_monitor import run_loop_monitor
+from core.history_maintenance import run_history_maintenance
+from ml.worker_pool import shutdown_process_pool
 
 # Импорты внешних сервисов
 from api.api_server import create_app
@@ -25,7 +28,13 @@ from notifier.telegram_notifier import TelegramNotifier
 from llm.summary_worker import LLMSummaryWorker
 # ---
 
-async def main():
+async def main(with_api: bool = True, group: int = 0, groups: int = 1):
+    """
+    Все сервисы в одном процессе. with_api=False — только движки (run_engine.py),
+    API тогда работает отдельным многопроцессным тиром (run_api.py).
+    group/groups — доля сервисов этого процесса, когда движки разнесены по
+    engine.processes процессам (i-й сервис списка достается процессу i % groups).
+    """
     # Настройка логгирования
     logging.basicConfig(
         level=logging.INFO,
@@ -33,7 +42,7 @@ async def main():
     )
     log = logging.getLogger("MASTER")
     
-    log.info("Starting Crypto Intel Premium v9.x")
+    log.info("Starting Crypto Intel Premium v9.x (engine process %d/%d)", group + 1, groups)
 
     # -----------------------------------------
     #  Redis connection
@@ -50,39 +59,55 @@ async def main():
     #  API server
     # -----------------------------------------
     # Настраиваем Uvicorn сервер для работы с нашим FastAPI приложением
-    app = create_app(CONFIG)
-    api_server = uvicorn.Server(
-        uvicorn.Config(
-            app,
-            host=CONFIG.api.host,
-            port=CONFIG.api.port,
-            log_level="info",
+    api_server = None
+    if with_api:
+        app = create_app(CONFIG)
+        api_server = uvicorn.Server(
+            uvicorn.Config(
+                app,
+                host=CONFIG.api.host,
+                port=CONFIG.api.port,
+                log_level="info",
+            )
         )
-    )
 
     # -----------------------------------------
     #  Parallel pipeline (All Engines & Workers)
     # -----------------------------------------
-    tasks = [
+    # Сервисы общаются только через Redis и дисковый архив, поэтому их можно
+    # разносить по процессам; каждый пишет свои ключи и должен быть один
+    services = [
         # COLLECTORS (Сбор данных)
-        asyncio.create_task(run_cex_collector(redis, CONFIG), name="CEX_Collector"),
-        asyncio.create_task(run_dex_collector(redis, CONFIG), name="DEX_Collector"),
-        
+        ("CEX_Collector", lambda: run_cex_collector(redis, CONFIG)),
+        ("DEX_Collector", lambda: run_dex_collector(redis, CONFIG)),
+
         # CORE ENGINES (Обработка, расчет)
-        asyncio.create_task(run_core_engine(redis, CONFIG), name="Core_Engine"),
-        
+        ("Core_Engine", lambda: run_core_engine(redis, CONFIG)),
+
         # UTILITY ENGINES (Статистика, ML, Тюнинг)
-        asyncio.create_task(run_eval_engine(redis, CONFIG), name="Eval_Engine"),
-        asyncio.create_task(run_stats_engine(redis, CONFIG), name="Stats_Engine"),
-        asyncio.create_task(run_param_tuner(redis, CONFIG), name="Param_Tuner"),
-        
-        # LLM & NOTIFICATIONS (Внешние сервисы)
-        asyncio.create_task(llm_worker.run(), name="LLM_Worker"),
-        asyncio.create_task(notifier.run(), name="Telegram_Notifier"),
+        ("Eval_Engine", lambda: run_eval_engine(redis, CONFIG)),
+        ("Stats_Engine", lambda: run_stats_engine(redis, CONFIG)),
+        ("Param_Tuner", lambda: run_param_tuner(redis, CONFIG)),
+        ("Loop_Monitor", lambda: run_loop_monitor(redis, CONFIG)),
+        ("History_Maintenance", lambda: run_history_maintenance(redis, CONFIG)),
 
-        # API (UI, клиенты)
-        asyncio.create_task(api_server.serve(), name="API_Server"),
+        # LLM & NOTIFICATIONS (Внешние сервисы)
+        ("LLM_Worker", llm_worker.run),
+        ("Telegram_Notifier", notifier.run),
+    ]
+    tasks = [
+        asyncio.create_task(factory(), name=name)
+        for i, (name, factory) in enumerate(services)
+        if i % groups == group
     ]
+    if not tasks:
+        log.warning("No services left for engine process %d (engine.processes > %d)", group + 1, len(services))
+        return
+    log.info("Services in this process: %s", ", ".join(t.get_name() for t in tasks))
+
+    # API (UI, клиенты) — в этом же event loop только в одиночном режиме
+    if api_server is not None:
+        tasks.append(asyncio.create_task(api_server.serve(), name="API_Server"))
     
     # -----------------------------------------
     #  Main Loop: Wait for all tasks
@@ -99,6 +124,7 @@ async def main():
         for task in tasks:
             task.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
+        shutdown_process_pool()
         log.info("All services stopped.")
 
 
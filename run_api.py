@@ -0,0 +1,21 @@
+# run_api.py
+
+import uvicorn
+
+from config import CONFIG
+
+# Отдельный тир API: api.workers процессов uvicorn, независимых от движков.
+# Воркеры ничего не пишут: общее состояние — из Redis, /api/history/* и экспорт —
+# из дискового архива history.disk_path (тот же том, что у движков) плюс еще не
+# сброшенный хвост горячих списков Redis. У каждого воркера свои кэш ответов и
+# broadcast-хаб. Движки — run_engine.py.
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "api.api_server:app_factory",
+        factory=True,
+        host=CONFIG.api.host,
+        port=CONFIG.api.port,
+        workers=max(1, CONFIG.api.workers),
+        log_level="info",
+    )
@@ -0,0 +1,44 @@
+# run_engine.py
+
+import asyncio
+import multiprocessing
+
+from config import CONFIG
+from run_all import main
+
+# Коллекторы, движки и воркеры без API: состояние пишется в Redis,
+# откуда его читает отдельный тир API (run_api.py, api.workers процессов).
+# engine.processes > 1 — сервисы делятся между процессами движков (каждый
+# сервис ровно в одном, см. run_all.main). CPU-задачи движков уходят в свои
+# пулы процессов: ml.process_pool_workers (обучение, кластеризация) и
+# tuner.backtest_workers.
+
+
+def _run(group: int = 0, groups: int = 1):
+    try:
+        asyncio.run(main(with_api=False, group=group, groups=groups))
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        if "Event loop is closed" not in str(e):
+            raise
+
+
+if __name__ == "__main__":
+    groups = max(1, CONFIG.engine.processes)
+    if groups == 1:
+        _run()
+    else:
+        processes = [
+            multiprocessing.Process(target=_run, args=(group, groups), name=f"Engine-{group}")
+            for group in range(groups)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # Ctrl+C получают и дочерние процессы; ждем их штатной остановки
+            for process in processes:
+                process.join()
@@ -26,6 +26,8 @@ class NormalizedBook(BaseModel):
 class MarketStats(BaseModel):
     symbol: str
     last_mid: float
+    volatility_1m: float = 0.0
+    volatility_15m: float = 0.0
     volatility_1h: float
     updated_at: datetime
 
@@ -62,6 +64,8 @@ class SystemStatus(BaseModel):
 # ============================
 
 class CoreSignal(BaseModel):
+    # Монотонный номер, присваивается в RedisState.push_signal
+    id: int | None = None
     symbol: str
     buy_exchange: str
     sell_exchange: str
@@ -79,6 +83,20 @@ class CoreSignal(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class SignalOutcome(BaseModel):
+    symbol: str
+    buy_exchange: str
+    sell_exchange: str
+    signal_created_at: datetime
+    entry_net_profit: float
+    # Сколько секунд спред маршрута оставался положительным (None — не закрылся в окне)
+    survival_sec: float | None = None
+    # Чистая прибыль (USD), доступная на горизонте: {"1s": 0.42, "5s": None, ...}
+    profit_at: Dict[str, float | None] = Field(default_factory=dict)
+    label: int | None = None
+    evaluated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class SignalStats(BaseModel):
     signals_total: int
     profitable_signals: int
@@ -99,12 +117,35 @@ class LLMSummary(BaseModel):
 #  PARAM TUNER
 # ============================
 
+class ScopeParams(BaseModel):
+    min_net_profit_usd: float
+    min_spread_bps: float
+    min_volume_usd: float
+
+
 class ParamSnapshot(BaseModel):
+    # Глобальные пороги (fallback)
     min_net_profit_usd: float
     min_spread_bps: float
     min_volume_usd: float
+    # Пороги по символу ("BTCUSDT") и маршруту ("BTCUSDT:binance>mexc")
+    per_symbol: Dict[str, ScopeParams] = Field(default_factory=dict)
+    per_route: Dict[str, ScopeParams] = Field(default_factory=dict)
+    # Порог ML-скора из бэктеста (None -> cfg.ml.min_score)
+    ml_min_score: float | None = None
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+    def for_route(self, symbol: str, buy_exchange: str, sell_exchange: str) -> ScopeParams:
+        """O(1): маршрут -> символ -> глобальные пороги."""
+        params = self.per_route.get(f"{symbol}:{buy_exchange}>{sell_exchange}") or self.per_symbol.get(symbol)
+        if params is not None:
+            return params
+        return ScopeParams(
+            min_net_profit_usd=self.min_net_profit_usd,
+            min_spread_bps=self.min_spread_bps,
+            min_volume_usd=self.min_volume_usd,
+        )
+
 # ============================
 #  CLUSTERING
 # ============================
@@ -116,8 +157,21 @@ class SignalCluster(BaseModel):
 
 class ClusterState(BaseModel):
     clusters: List["SignalCluster"]
+    # Число выбросов (cluster_id = -1) для density-based режима
+    noise: int = 0
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+# ============================
+#  METRICS
+# ============================
+
+class LoopLagStats(BaseModel):
+    avg_ms: float
+    p99_ms: float
+    max_ms: float
+    samples: int
+    updated_at: datetime
+
 # ============================
 #  EVENT
 # ============================
@@ -0,0 +1,22 @@
+import io
+import json
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# Имя массива с JSON-метаданными внутри npz
+_META = "__meta__"
+
+
+def pack_snapshot(meta: Dict[str, Any], arrays: Optional[Dict[str, np.ndarray]] = None) -> bytes:
+    """JSON-метаданные + numpy-массивы в один сжатый npz blob."""
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **{_META: np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)}, **(arrays or {}))
+    return buf.getvalue()
+
+
+def unpack_snapshot(blob: bytes) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        arrays = {name: data[name] for name in data.files if name != _META}
+        meta = json.loads(data[_META].tobytes().decode("utf-8"))
+    return meta, arrays
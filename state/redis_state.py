@@ -1,4 +1,5 @@
 import json
+import time
 from datetime import datetime
 from typing import Dict, List, Optional
 
@@ -14,9 +15,27 @@ from state.models import (
     CoreSignal,
     ParamSnapshot,
     ClusterState,
+    LoopLagStats,
 )
 
 
+# Сколько последних сигналов хранится в оперативном индексе (полная история — HistoryStore)
+SIGNALS_MAX_LEN = 1000
+# Список старого формата (LPUSH без id), до индексов по id
+LEGACY_SIGNALS = "state:signals"
+# Страница просмотра индекса, когда фильтры отсекают часть сигналов
+SIGNALS_SCAN_PAGE = 100
+
+
+def _version_key(name: str) -> str:
+    """Счетчик версии состояния: растет при каждой записи (для кэша ответов API)."""
+    return f"state:version:{name}"
+
+
+def _route_key(signal: CoreSignal) -> str:
+    return f"{signal.symbol}|{signal.buy_exchange}>{signal.sell_exchange}"
+
+
 def _encode(obj):
     """Recursively transform datetimes and Pydantic models into JSON-safe structures."""
     if isinstance(obj, datetime):
@@ -31,10 +50,30 @@ def _encode(obj):
     return obj
 
 
+def _index_signals(pipe, signals: List[CoreSignal]):
+    """Добавляет сигналы (с id) в общий и посимвольные индексы и обрезает их до SIGNALS_MAX_LEN."""
+    keys = set()
+    for signal in signals:
+        payload = json.dumps(_encode(signal))
+        for key in ("state:signals:by_id", f"state:signals:by_id:{signal.symbol}"):
+            pipe.zadd(key, {payload: signal.id})
+            keys.add(key)
+    for key in sorted(keys):
+        # Ограничиваем индекс, чтобы он не рос бесконечно
+        pipe.zremrangebyrank(key, 0, -(SIGNALS_MAX_LEN + 1))
+
+
 class RedisState:
     def __init__(self, cfg):
         url = f"redis://{cfg.host}:{cfg.port}/{cfg.db}"
         self.client: Redis = Redis.from_url(url, decode_responses=True)
+        # Клиент для бинарных payload'ов (упакованные массивы), без декодирования в str
+        self.binary: Redis = Redis.from_url(url, decode_responses=False)
+
+    async def get_versions(self, names: List[str]) -> Dict[str, Optional[str]]:
+        """Текущие версии состояний одним MGET."""
+        raw = await self.client.mget([_version_key(n) for n in names])
+        return dict(zip(names, raw))
 
     # --------------------------------------
     # BOOKS
@@ -50,6 +89,16 @@ class RedisState:
         data = json.loads(raw)
         return {k: NormalizedBook(**v) for k, v in data.items()}
 
+    async def get_all_books(self, symbols: List[str]) -> Dict[str, Dict[str, NormalizedBook]]:
+        """Книги всех символов одним MGET (один round-trip на тик)."""
+        if not symbols:
+            return {}
+        raw = await self.client.mget([f"state:books:{s}" for s in symbols])
+        return {
+            symbol: {k: NormalizedBook(**v) for k, v in json.loads(item).items()} if item else {}
+            for symbol, item in zip(symbols, raw)
+        }
+
     async def set_book(self, symbol: str, exchange: str, book: NormalizedBook):
         key = f"state:books:{symbol}"
         # Fetch, update, and set back to maintain atomic update of the whole book set
@@ -63,7 +112,10 @@ class RedisState:
     # --------------------------------------
     async def set_market_stats(self, stats: List[MarketStats]):
         dumped = {_s.symbol: _encode(_s) for _s in stats}
-        await self.client.set("state:market_stats", json.dumps(dumped))
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set("state:market_stats", json.dumps(dumped))
+        pipe.incr(_version_key("market_stats"))
+        await pipe.execute()
 
     async def get_market_stats(self) -> Optional[Dict[str, MarketStats]]:
         raw = await self.client.get("state:market_stats")
@@ -90,10 +142,10 @@ class RedisState:
     # SYSTEM STATUS
     # --------------------------------------
     async def set_system_status(self, status: SystemStatus):
-        await self.client.set(
-            "state:system_status",
-            json.dumps(_encode(status)),
-        )
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set("state:system_status", json.dumps(_encode(status)))
+        pipe.incr(_version_key("system_status"))
+        await pipe.execute()
 
     async def get_system_status(self) -> Optional[SystemStatus]:
         raw = await self.client.get("state:system_status")
@@ -105,22 +157,164 @@ class RedisState:
     # SIGNALS (НОВЫЕ/ИСПРАВЛЕННЫЕ МЕТОДЫ)
     # --------------------------------------
     async def push_signal(self, signal: CoreSignal):
-        # Сохраняем CoreSignal для движков оценки и API
-        await self.client.lpush("state:signals", json.dumps(_encode(signal)))
-        # Ограничиваем список, чтобы он не рос бесконечно
-        await self.client.ltrim("state:signals", 0, 1000)
-
-    async def get_signals(self, limit: int = 1000) -> List[CoreSignal]:
-        raw = await self.client.lrange("state:signals", 0, limit - 1)
-        signals = []
-        for item in raw:
-            try:
-                # CoreSignal — внутренняя модель, используется eval_engine
-                signals.append(CoreSignal(**json.loads(item)))
-            except Exception:
-                # Игнорируем некорректные записи
-                continue
-        return signals
+        """
+        Сохраняет CoreSignal для движков оценки и API под монотонным id.
+
+        state:signals:by_id[:{symbol}] — ZSET score = id (индекс для курсоров since_id/before_id).
+        Id берется из отдельного счетчика до записи; версия signals растет вместе с записью.
+        """
+        signal.id = int(await self.client.incr("state:signals:seq"))
+        pipe = self.client.pipeline(transaction=True)
+        _index_signals(pipe, [signal])
+        pipe.incr(_version_key("signals"))
+        await pipe.execute()
+
+    async def migrate_legacy_signals(self) -> int:
+        """
+        Переносит список старого формата (state:signals) в индексы по id и удаляет его.
+        Если индексы уже наполнены новыми сигналами, старые им уступают: ids выдаются
+        по порядку, и более поздний id у старого сигнала сломал бы курсоры, — список
+        просто удаляется. Вызывается писателем (core engine) до первого цикла.
+        """
+        raw = await self.client.lrange(LEGACY_SIGNALS, 0, -1)
+        if not raw:
+            return 0
+        moved: List[CoreSignal] = []
+        if not await self.client.exists("state:signals:by_id"):
+            # Список хранился от новых к старым
+            for item in reversed(raw):
+                try:
+                    moved.append(CoreSignal(**json.loads(item)))
+                except Exception:
+                    continue
+        pipe = self.client.pipeline(transaction=True)
+        if moved:
+            last = int(await self.client.incrby("state:signals:seq", len(moved)))
+            for offset, signal in enumerate(moved):
+                signal.id = last - len(moved) + 1 + offset
+            _index_signals(pipe, moved)
+            pipe.incr(_version_key("signals"))
+        pipe.delete(LEGACY_SIGNALS)
+        await pipe.execute()
+        return len(moved)
+
+    async def get_signals(
+        self,
+        limit: int = 1000,
+        since_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        symbol: Optional[str] = None,
+        min_profit_bps: Optional[float] = None,
+        buy_exchange: Optional[str] = None,
+        sell_exchange: Optional[str] = None,
+    ) -> List[CoreSignal]:
+        """
+        Сигналы от новых к старым. since_id — только новее (берутся ближайшие к since_id,
+        чтобы max(id) ответа был следующим курсором без пропусков), before_id — страница старше.
+        """
+        key = f"state:signals:by_id:{symbol}" if symbol else "state:signals:by_id"
+        hi = f"({before_id}" if before_id is not None else "+inf"
+        filtered = min_profit_bps is not None or buy_exchange is not None or sell_exchange is not None
+        # Фильтры вне индекса: индекс читается страницами от курсора, пока не наберется limit
+        page = max(limit, SIGNALS_SCAN_PAGE) if filtered else limit
+        signals: List[CoreSignal] = []
+        offset = 0
+        while len(signals) < limit:
+            if since_id is not None:
+                raw = await self.client.zrangebyscore(key, f"({since_id}", hi, start=offset, num=page)
+            else:
+                raw = await self.client.zrevrangebyscore(key, hi, "-inf", start=offset, num=page)
+            for item in raw:
+                try:
+                    # CoreSignal — внутренняя модель, используется eval_engine
+                    signal = CoreSignal(**json.loads(item))
+                except Exception:
+                    # Игнорируем некорректные записи
+                    continue
+                if (
+                    (min_profit_bps is not None and (signal.net_profit_bps or 0.0) < min_profit_bps)
+                    or (buy_exchange is not None and signal.buy_exchange != buy_exchange)
+                    or (sell_exchange is not None and signal.sell_exchange != sell_exchange)
+                ):
+                    continue
+                signals.append(signal)
+            if len(raw) < page:
+                break
+            offset += page
+        signals = signals[:limit]
+        # since_id читается от курсора вверх; ответ — от новых к старым
+        return signals[::-1] if since_id is not None else signals
+
+    # --------------------------------------
+    # SPREAD MATRIX (упакованный снимок символ x маршрут, см. analytics.spread_matrix)
+    # --------------------------------------
+    async def set_spread_matrix(self, blob: bytes):
+        pipe = self.binary.pipeline(transaction=True)
+        pipe.set("state:spread_matrix", blob)
+        pipe.incr(_version_key("spread_matrix"))
+        await pipe.execute()
+
+    async def get_spread_matrix(self) -> Optional[bytes]:
+        return await self.binary.get("state:spread_matrix")
+
+    # --------------------------------------
+    # TOP (лидерборд текущих возможностей)
+    # --------------------------------------
+    # state:top:signals  — ZSET маршрут -> net_profit_bps последнего сигнала
+    # state:top:payload  — HASH маршрут -> JSON последнего сигнала
+    # state:top:expiry   — ZSET маршрут -> момент (epoch), после которого маршрут неактуален
+    async def update_top_signals(self, signals: List[CoreSignal], ttl_sec: float, max_size: int):
+        """Обновляет маршруты сигналами цикла и выбрасывает те, что не обновлялись дольше ttl_sec."""
+        now = time.time()
+        expired = await self.client.zrangebyscore("state:top:expiry", "-inf", now)
+
+        pipe = self.client.pipeline(transaction=True)
+        if signals:
+            routes = {_route_key(s): s for s in signals}
+            pipe.zadd("state:top:signals", {r: s.net_profit_bps or 0.0 for r, s in routes.items()})
+            pipe.zadd("state:top:expiry", {r: now + ttl_sec for r in routes})
+            pipe.hset("state:top:payload", mapping={r: json.dumps(_encode(s)) for r, s in routes.items()})
+            expired = [r for r in expired if r not in routes]
+        if expired:
+            pipe.zrem("state:top:signals", *expired)
+            pipe.zrem("state:top:expiry", *expired)
+            pipe.hdel("state:top:payload", *expired)
+        # Хвост сверх max_size; его payload/expiry уберет истечение ttl
+        pipe.zremrangebyrank("state:top:signals", 0, -(max_size + 1))
+        if signals or expired:
+            pipe.incr(_version_key("top"))
+        await pipe.execute()
+
+    async def get_top_signals(self, limit: int = 20, min_profit_bps: Optional[float] = None) -> List[CoreSignal]:
+        """
+        Лучшие актуальные маршруты по net_profit_bps (O(log n + limit)). Протухшие
+        записи отсекаются при чтении (если core engine остановлен, их никто не чистит),
+        поэтому лидерборд читается страницами, пока не наберется limit живых.
+        """
+        result: List[CoreSignal] = []
+        if limit <= 0:
+            return result
+        low = "-inf" if min_profit_bps is None else min_profit_bps
+        offset = 0
+        while len(result) < limit:
+            routes = await self.client.zrevrangebyscore("state:top:signals", "+inf", low, start=offset, num=limit)
+            if not routes:
+                break
+            pipe = self.client.pipeline(transaction=False)
+            pipe.hmget("state:top:payload", routes)
+            pipe.zmscore("state:top:expiry", routes)
+            payloads, expiry = await pipe.execute()
+
+            now = time.time()
+            result.extend(
+                CoreSignal(**json.loads(raw))
+                for raw, exp in zip(payloads, expiry)
+                if raw and exp is not None and exp >= now
+            )
+            if len(routes) < limit:
+                break
+            offset += limit
+        return result[:limit]
 
     # --------------------------------------
     # SIGNAL STATS
@@ -162,4 +356,16 @@ class RedisState:
         raw = await self.client.get("state:clusters:signals")
         if not raw:
             return None
-        return ClusterState(**json.loads(raw))
\ No newline at end of file
+        return ClusterState(**json.loads(raw))
+
+    # --------------------------------------
+    # METRICS
+    # --------------------------------------
+    async def set_loop_lag(self, stats: LoopLagStats):
+        await self.client.set("state:metrics:loop_lag", json.dumps(_encode(stats)))
+
+    async def get_loop_lag(self) -> Optional[LoopLagStats]:
+        raw = await self.client.get("state:metrics:loop_lag")
+        if not raw:
+            return None
+        return LoopLagStats(**json.loads(raw))
@@ -0,0 +1,57 @@
+import logging
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from state.npz_codec import pack_snapshot, unpack_snapshot
+from state.redis_state import RedisState
+
+log = logging.getLogger("state.warm_start")
+
+
+class WarmStartStore:
+    """
+    Снимки in-memory состояния компонентов для быстрого рестарта.
+
+    Ключ: state:warm:{component} (бинарный npz). Компонент сам решает, что
+    сохранять; снимки старше warm_start.max_age_sec при восстановлении игнорируются.
+    """
+
+    def __init__(self, redis: RedisState, cfg):
+        self.redis = redis
+        self.cfg = cfg.warm_start
+        self._saved_at: Dict[str, float] = {}
+
+    @staticmethod
+    def _key(component: str) -> str:
+        return f"state:warm:{component}"
+
+    def due(self, component: str) -> bool:
+        """Пора ли делать периодический checkpoint компонента."""
+        last = self._saved_at.get(component, 0.0)
+        return self.cfg.enabled and time.monotonic() - last >= self.cfg.checkpoint_interval_sec
+
+    async def save(self, component: str, meta: Dict[str, Any], arrays: Optional[Dict[str, np.ndarray]] = None):
+        if not self.cfg.enabled:
+            return
+        blob = pack_snapshot({**meta, "saved_at": time.time()}, arrays)
+        await self.redis.binary.set(self._key(component), blob)
+        self._saved_at[component] = time.monotonic()
+
+    async def load(self, component: str) -> Optional[Tuple[Dict[str, Any], Dict[str, np.ndarray]]]:
+        if not self.cfg.enabled:
+            return None
+        blob = await self.redis.binary.get(self._key(component))
+        if not blob:
+            return None
+        try:
+            meta, arrays = unpack_snapshot(blob)
+        except Exception as exc:
+            log.warning("Warm-start snapshot '%s' is unreadable: %s", component, exc)
+            return None
+        age = time.time() - meta.get("saved_at", 0.0)
+        if age > self.cfg.max_age_sec:
+            log.info("Warm-start snapshot '%s' is stale (%.0fs), ignoring", component, age)
+            return None
+        return meta, arrays
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Protocol, Set
+
+from state.redis_state import RedisState, _encode
+
+logger = logging.getLogger("stream.broadcast")
+
+# loader(prev_version, version) -> JSON-совместимый payload или None (нечего слать);
+# prev_version=None — первый вызов (или после простоя без слушателей)
+Loader = Callable[[Optional[int], int], Awaitable[object]]
+
+
+class Channel(Protocol):
+    """Потребитель сырых payload'ов хаба (мультиплексированный поток и т.п.)."""
+
+    topics: Set[str]
+
+    @property
+    def active(self) -> bool: ...
+
+    def publish(self, topic: str, payload: object, version: int): ...
+
+
+class Subscriber:
+    """Ограниченная очередь клиента: при переполнении выбрасывается самый старый кадр."""
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, frame: bytes):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+
+class Topic:
+    def __init__(self, name: str, version: str, loader: Loader, snapshot: bool):
+        self.name = name
+        self.version = version
+        self.loader = loader
+        # snapshot-топик (status, market): новый клиент сразу получает последний кадр
+        self.snapshot = snapshot
+        self.last_version: Optional[int] = None
+        self.last_frame: Optional[bytes] = None
+        self.subscribers: Set[Subscriber] = set()
+
+
+class BroadcastHub:
+    """
+    Fan-out SSE: один upstream-опрос на все топики, один encode на обновление.
+
+    Раз в stream_poll_sec версии состояний (state:version:*) читаются одним MGET;
+    для изменившихся топиков с подписчиками payload загружается и кодируется в
+    SSE-кадр один раз, затем раскладывается по очередям клиентов.
+    """
+
+    def __init__(self, redis: RedisState, cfg):
+        self.redis = redis
+        self.cfg = cfg.api
+        self.topics: Dict[str, Topic] = {}
+        self.channels: List[Channel] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, loader: Loader, version: Optional[str] = None, snapshot: bool = True):
+        self.topics[name] = Topic(name, version or name, loader, snapshot)
+
+    def attach(self, channel: Channel):
+        """Канал получает payload своих топиков (уже загруженный, без повторного чтения Redis)."""
+        self.channels.append(channel)
+
+    def start(self):
+        self._ensure_upstream()
+
+    async def subscribe(self, name: str) -> AsyncIterator[bytes]:
+        """Поток SSE-кадров топика для одного клиента (отписка — при закрытии генератора)."""
+        topic = self.topics[name]
+        sub = Subscriber(self.cfg.stream_client_queue)
+        if topic.snapshot and topic.last_frame is not None:
+            sub.offer(topic.last_frame)
+        topic.subscribers.add(sub)
+        self._ensure_upstream()
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), timeout=self.cfg.stream_heartbeat_sec)
+                except asyncio.TimeoutError:
+                    # Комментарий SSE: держит соединение и выявляет отвалившихся клиентов
+                    yield b": ping\n\n"
+        finally:
+            topic.subscribers.discard(sub)
+            if sub.dropped:
+                logger.debug("Stream '%s' client dropped %d frames", name, sub.dropped)
+
+    def _ensure_upstream(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._upstream(), name="Stream_Broadcast")
+
+    async def _upstream(self):
+        while True:
+            try:
+                await self._poll()
+            except Exception as exc:
+                logger.error("Broadcast upstream error: %s", exc)
+            await asyncio.sleep(self.cfg.stream_poll_sec)
+
+    async def _poll(self):
+        names = sorted({t.version for t in self.topics.values()})
+        versions = await self.redis.get_versions(names)
+        for topic in self.topics.values():
+            raw = versions.get(topic.version)
+            version = int(raw) if raw else 0
+            if version == topic.last_version:
+                continue
+            channels = [c for c in self.channels if c.active and topic.name in c.topics]
+            if not topic.subscribers and not channels:
+                # Без слушателей ничего не грузим: событийный топик теряет позицию
+                # (загрузчик с prev=None только встает на текущую), снимок
+                # помечается устаревшим и догрузится для первого подписчика
+                if topic.snapshot:
+                    topic.last_frame = None
+                else:
+                    topic.last_version = None
+                continue
+            payload = await topic.loader(topic.last_version, version)
+            topic.last_version = version
+            if payload is None:
+                continue
+            for channel in channels:
+                channel.publish(topic.name, payload, version)
+            if not topic.subscribers:
+                # Кадр для будущих подписчиков устарел
+                topic.last_frame = None
+                continue
+            frame = f"data: {json.dumps(_encode(payload))}\n\n".encode("utf-8")
+            topic.last_frame = frame
+            for sub in list(topic.subscribers):
+                sub.offer(frame)
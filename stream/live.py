@@ -0,0 +1,211 @@
+import asyncio
+import json
+import logging
+import secrets
+from collections import OrderedDict, deque
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from state.redis_state import RedisState, _encode
+
+logger = logging.getLogger("stream.live")
+
+# Поля MarketStats, которые показывает клиент, и точность отображения;
+# updated_at и дрожание в младших разрядах кадр не порождают
+_MARKET_VOLATILITY_FIELDS = ("volatility_1m", "volatility_15m", "volatility_1h")
+_MARKET_VOLATILITY_DIGITS = 4
+
+
+class LiveSubscriber:
+    """
+    Очередь клиента дельта-потока. Дельты нельзя выбрасывать выборочно: при
+    переполнении очередь очищается и клиент получает resync (полный снимок).
+    """
+
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize=maxsize)
+        self.resync = False
+
+    def offer(self, frame: bytes):
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.resync = True
+        self.queue.put_nowait(frame)
+
+
+class LiveChannel:
+    """
+    Мультиплексированный дельта-поток дашборда (/stream/live).
+
+    SSE-события с id = "{epoch}-{seq}" (epoch — свой у каждого процесса API):
+      status          — SystemStatus, когда он изменился
+      market          — {"upsert": [MarketStats...], "remove": [symbol...]} только строки, где
+                        для клиента что-то изменилось: mid сдвинулся больше stream_live_mid_bps
+                        или волатильность на отображаемой точности
+      signal-added    — [signal...] новые сигналы (с монотонным id)
+      signal-expired  — {"ids": [...]} сигналы, вытесненные из окна stream_live_signals
+      resync          — {"status", "market", "signals"} полный снимок; после него
+                        клиент игнорирует события с id <= id снимка
+
+    Последние stream_live_replay событий хранятся в кольце: переподключившийся
+    клиент (Last-Event-ID) получает пропущенные дельты, если они еще в кольце,
+    иначе — resync (в том числе при переподключении к другому воркеру API).
+    Данные приходят из BroadcastHub (один upstream на всех).
+    """
+
+    topics: Set[str] = {"system", "market", "signals"}
+
+    def __init__(self, redis: RedisState, cfg, anchor_signals: Optional[Callable[[int], None]] = None):
+        self.redis = redis
+        self.cfg = cfg.api
+        # Сообщает загрузчику топика signals max id снимка bootstrap (см. streamhub.SignalFeed)
+        self._anchor_signals = anchor_signals
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self._ring: Deque[Tuple[int, bytes]] = deque(maxlen=self.cfg.stream_live_replay)
+        self._subscribers: Set[LiveSubscriber] = set()
+        self._status: Optional[dict] = None
+        self._market: Dict[str, dict] = {}
+        self._signals: "OrderedDict[int, dict]" = OrderedDict()
+        self._bootstrap_lock = asyncio.Lock()
+
+    @property
+    def active(self) -> bool:
+        return bool(self._subscribers)
+
+    # ------------------------
+    # Приём из хаба
+    # ------------------------
+    def publish(self, topic: str, payload: object, version: int):
+        if topic == "system":
+            status = _encode(payload)
+            if status != self._status:
+                self._status = status
+                self._emit("status", status)
+        elif topic == "market":
+            self._apply_market(_encode(payload))
+        elif topic == "signals":
+            # payload — новые сигналы от старых к новым
+            self._add_signals([_encode(s) for s in payload])
+
+    def _apply_market(self, rows: List[dict]):
+        # _market — строки в том виде, в каком их уже получили клиенты
+        current = {r["symbol"]: r for r in rows}
+        upsert = [r for symbol, r in current.items() if self._market_changed(self._market.get(symbol), r)]
+        remove = [symbol for symbol in self._market if symbol not in current]
+        for r in upsert:
+            self._market[r["symbol"]] = r
+        for symbol in remove:
+            del self._market[symbol]
+        if upsert or remove:
+            self._emit("market", {"upsert": upsert, "remove": remove})
+
+    def _market_changed(self, sent: Optional[dict], row: dict) -> bool:
+        if sent is None:
+            return True
+        old_mid, mid = sent.get("last_mid") or 0.0, row.get("last_mid") or 0.0
+        if abs(mid - old_mid) > abs(old_mid) * self.cfg.stream_live_mid_bps / 10_000:
+            return True
+        return any(
+            round(sent.get(f) or 0.0, _MARKET_VOLATILITY_DIGITS) != round(row.get(f) or 0.0, _MARKET_VOLATILITY_DIGITS)
+            for f in _MARKET_VOLATILITY_FIELDS
+        )
+
+    def _add_signals(self, signals: List[dict]):
+        last_id = next(reversed(self._signals), 0) if self._signals else 0
+        added = []
+        for record in signals:
+            if record["id"] <= last_id:
+                continue
+            self._signals[record["id"]] = record
+            added.append(record)
+        if not added:
+            return
+        self._emit("signal-added", added)
+        expired = []
+        while len(self._signals) > self.cfg.stream_live_signals:
+            expired.append(self._signals.popitem(last=False)[0])
+        if expired:
+            self._emit("signal-expired", {"ids": expired})
+
+    def _emit(self, event: str, data: object):
+        self.seq += 1
+        frame = self._frame(event, data)
+        self._ring.append((self.seq, frame))
+        for sub in list(self._subscribers):
+            sub.offer(frame)
+
+    # ------------------------
+    # Клиенты
+    # ------------------------
+    async def subscribe(self, last_event_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        if not self.active:
+            await self._bootstrap()
+        sub = LiveSubscriber(self.cfg.stream_client_queue)
+        replay = self._replay(last_event_id)
+        self._subscribers.add(sub)
+        try:
+            if replay is None:
+                yield self._resync_frame()
+            else:
+                for frame in replay:
+                    yield frame
+            while True:
+                if sub.resync:
+                    sub.resync = False
+                    yield self._resync_frame()
+                try:
+                    yield await asyncio.wait_for(sub.queue.get(), timeout=self.cfg.stream_heartbeat_sec)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+        finally:
+            self._subscribers.discard(sub)
+
+    def _replay(self, last_event_id: Optional[str]) -> Optional[List[bytes]]:
+        """Пропущенные кадры после last_event_id или None, если нужен resync."""
+        if not last_event_id:
+            return None
+        epoch, _, seq = last_event_id.rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        last = int(seq)
+        if last > self.seq:
+            return None
+        if last == self.seq:
+            return []
+        if not self._ring or self._ring[0][0] > last + 1:
+            return None
+        return [frame for seq, frame in self._ring if seq > last]
+
+    def _resync_frame(self) -> bytes:
+        snapshot = {
+            "status": self._status,
+            "market": list(self._market.values()),
+            "signals": list(self._signals.values()),
+        }
+        return self._frame("resync", snapshot)
+
+    async def _bootstrap(self):
+        """
+        Первый клиент после простоя: пока слушателей не было, хаб канал не кормил.
+        Состояние перечитывается из Redis; кольцо сбрасывается (старые дельты к нему
+        уже не применимы), seq продолжает расти.
+        """
+        async with self._bootstrap_lock:
+            if self.active:
+                return
+            status = await self.redis.get_system_status()
+            market = await self.redis.get_market_stats()
+            signals = await self.redis.get_signals(limit=self.cfg.stream_live_signals)
+
+            self._ring.clear()
+            self._status = _encode(status) if status else None
+            self._market = {r["symbol"]: r for r in _encode(list(market.values()))} if market else {}
+            self._signals = OrderedDict((s.id, _encode(s)) for s in reversed(signals))
+            self.seq += 1
+            # Хаб продолжит сигналы с max id снимка, а не с самого свежего на момент опроса
+            if self._anchor_signals is not None:
+                self._anchor_signals(signals[0].id if signals else 0)
+
+    def _frame(self, event: str, data: object) -> bytes:
+        return f"id: {self.epoch}-{self.seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
@@ -1,53 +1,105 @@
-import asyncio
-import json
 import logging
-from fastapi import APIRouter
+from typing import Optional
+
+from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
 
 from config import CONFIG, Config
 from state.redis_state import RedisState
+from stream.broadcast import BroadcastHub
+from stream.live import LiveChannel
 
 logger = logging.getLogger("stream.streamhub")
 
-
-def _encode_to_json(obj: BaseModel) -> str:
-    """Helper to convert Pydantic model to JSON string."""
-    # model_dump_json() - более эффективный способ сериализации в Pydantic v2
-    return obj.model_dump_json()
+# Больше этого за один опрос в signals-кадр не попадает (остальное видно через /api/signals)
+_MAX_SIGNALS_PER_FRAME = 100
 
 
-async def _system_status_stream(redis: RedisState, cfg: Config):
+class SignalFeed:
     """
-    Отправляет SystemStatus каждые N секунд как SSE.
+    Загрузчик топика signals: курсор по id сигналов, в кадр попадают только новые
+    с прошлого кадра. После простоя (prev=None) курсор встает на самый свежий сигнал,
+    если LiveChannel не задал якорь — max id своего снимка; тогда кадр содержит все
+    сигналы, появившиеся между чтением снимка и первым опросом.
     """
-    # Используем интервал из нового конфига
-    interval = cfg.api.status_stream_interval_sec
-    
-    while True:
-        try:
-            status = await redis.get_system_status()
-            if status:
-                # Отправляем в формате SSE
-                data = _encode_to_json(status)
-                yield f"data: {data}\n\n"
-        except Exception as e:
-            logger.error(f"System stream error: {e}")
-            # Ждем дольше в случае ошибки, чтобы не спамить
-            await asyncio.sleep(interval * 5)
-            continue
-
-        await asyncio.sleep(interval)
+
+    def __init__(self, redis: RedisState):
+        self.redis = redis
+        self.last_id: Optional[int] = None
+        self._anchor: Optional[int] = None
+
+    def anchor(self, signal_id: int):
+        self._anchor = signal_id if self._anchor is None else min(self._anchor, signal_id)
+
+    async def load(self, prev: Optional[int], version: int):
+        if prev is None or self.last_id is None:
+            if self._anchor is None:
+                latest = await self.redis.get_signals(limit=1)
+                self.last_id = latest[0].id if latest else 0
+                return None
+            self.last_id = self._anchor
+        # Курсор непрерывен (или только что встал на якорь) — якорь больше не нужен
+        self._anchor = None
+        signals = await self.redis.get_signals(limit=_MAX_SIGNALS_PER_FRAME, since_id=self.last_id)
+        if not signals:
+            return None
+        self.last_id = signals[0].id
+        return signals[::-1]
+
+
+def create_hub(redis: RedisState, cfg: Config, signal_feed: Optional[SignalFeed] = None) -> BroadcastHub:
+    """Топики SSE: status и market — снимки, signals — новые сигналы с прошлого кадра."""
+    hub = BroadcastHub(redis, cfg)
+    signal_feed = signal_feed or SignalFeed(redis)
+
+    async def load_status(prev: Optional[int], version: int):
+        return await redis.get_system_status()
+
+    async def load_market(prev: Optional[int], version: int):
+        market = await redis.get_market_stats()
+        return list(market.values()) if market else None
+
+    hub.register("system", load_status, version="system_status")
+    hub.register("market", load_market, version="market_stats")
+    hub.register("signals", signal_feed.load, snapshot=False)
+    return hub
 
 
 def get_stream_router(redis: RedisState, cfg: Config = CONFIG) -> APIRouter:
     router = APIRouter()
+    signal_feed = SignalFeed(redis)
+    hub = create_hub(redis, cfg, signal_feed)
+    live = LiveChannel(redis, cfg, anchor_signals=signal_feed.anchor)
+    hub.attach(live)
+
+    def _sse(topic: str) -> StreamingResponse:
+        return _event_stream(hub.subscribe(topic))
 
     @router.get("/stream/system")
     async def system_stream():
-        return StreamingResponse(
-            _system_status_stream(redis, cfg),
-            media_type="text/event-stream"
-        )
+        return _sse("system")
+
+    @router.get("/stream/market")
+    async def market_stream():
+        return _sse("market")
+
+    @router.get("/stream/signals")
+    async def signals_stream():
+        return _sse("signals")
+
+    @router.get("/stream/live")
+    async def live_stream(request: Request, last_event_id: Optional[str] = None):
+        """Мультиплексированный дельта-поток дашборда (см. stream/live.py)."""
+        hub.start()
+        # EventSource сам присылает Last-Event-ID при переподключении
+        return _event_stream(live.subscribe(request.headers.get("last-event-id") or last_event_id))
+
+    return router
+
 
-    return router
\ No newline at end of file
+def _event_stream(frames) -> StreamingResponse:
+    return StreamingResponse(
+        frames,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
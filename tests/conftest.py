@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from config import CONFIG
+from state.models import CoreSignal, NormalizedBook
+from state.redis_state import RedisState
+
+
+@pytest.fixture
+def cfg(tmp_path):
+    """Копия конфига; файловые хранилища — во временном каталоге теста."""
+    cfg = CONFIG.model_copy(deep=True)
+    cfg.history.disk_path = str(tmp_path / "history")
+    cfg.feature_store.path = str(tmp_path / "feature_store")
+    return cfg
+
+
+@pytest.fixture
+def redis():
+    """RedisState поверх fakeredis: текстовый и бинарный клиенты на одном сервере."""
+    fakeredis = pytest.importorskip("fakeredis")
+
+    class FakeRedisState(RedisState):
+        def __init__(self):
+            server = fakeredis.FakeServer()
+            self.client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+            self.binary = fakeredis.aioredis.FakeRedis(server=server, decode_responses=False)
+
+    return FakeRedisState()
+
+
+def _signal(symbol="BTCUSDT", buy="binance", sell="mexc", profit_bps=10.0, created_at=None) -> CoreSignal:
+    return CoreSignal(
+        symbol=symbol,
+        buy_exchange=buy,
+        sell_exchange=sell,
+        buy_price=100.0,
+        sell_price=100.0 + profit_bps / 100,
+        volume_usd=1000.0,
+        spread=profit_bps / 100,
+        spread_bps=profit_bps,
+        fee_rate=0.0,
+        slippage_rate=0.0,
+        net_profit=profit_bps / 10,
+        net_profit_bps=profit_bps,
+        created_at=created_at or datetime(2026, 1, 1) + timedelta(seconds=profit_bps),
+    )
+
+
+@pytest.fixture
+def make_signal():
+    return _signal
+
+
+def _book(exchange="binance", bid=100.0, ask=100.1, symbol="BTCUSDT", updated_at=None) -> NormalizedBook:
+    return NormalizedBook(
+        symbol=symbol,
+        bid=bid,
+        ask=ask,
+        bid_size=1.0,
+        ask_size=1.0,
+        exchange=exchange,
+        updated_at=updated_at or datetime(2026, 1, 1),
+    )
+
+
+@pytest.fixture
+def make_book():
+    return _book
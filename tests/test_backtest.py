@@ -0,0 +1,155 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from analytics.features import FEATURE_COLUMNS, N_FEATURES, fill_signal_features, route_feature_matrix
+from core.backtest import (
+    ReplayRows,
+    _replay_symbol,
+    build_symbol_replay,
+    candidate_grid,
+    evaluate_candidates,
+    market_series,
+    sample_market,
+)
+from state.models import ExchangeStats, MarketStats
+
+T0 = 1_767_225_600  # 2026-01-01 00:00 UTC
+
+
+@pytest.fixture
+def replay_cfg(cfg):
+    cfg.engine.cycle_core_sec = 1.0
+    cfg.engine.cycle_stats_sec = 3.0
+    cfg.eval.outcome_label_horizon_sec = 2.0
+    cfg.collector.cycle_sec = 1.0  # протяжка 1s-бакетов не дальше 2 с
+    return cfg
+
+
+def _route(ts, close):
+    data = np.zeros(len(ts), dtype=[("ts", "<u4"), ("close", "<f4")])
+    data["ts"] = np.asarray(ts) + T0
+    data["close"] = close
+    return data
+
+
+def test_build_symbol_replay_picks_best_route_and_label_horizon(replay_cfg):
+    routes = {
+        # бакета t=4 нет — протягивается значение t=3
+        "binance>mexc": _route([0, 1, 2, 3, 5], [1, 2, 3, 4, 6]),
+        "mexc>binance": _route(range(6), [3] * 6),
+    }
+    names, t_index, route_idx, spread_bps, realized = build_symbol_replay("BTCUSDT", routes, T0, T0 + 6, replay_cfg)
+
+    assert names == ["binance>mexc", "mexc>binance"]
+    assert t_index.tolist() == [0, 1, 2, 3]
+    # max спред в каждый момент; при равенстве — первый маршрут (как nanargmax)
+    assert route_idx.tolist() == [1, 1, 0, 0]
+    assert spread_bps.tolist() == [3, 3, 3, 4]
+    # спред того же маршрута через label-горизонт (2 с)
+    assert realized.tolist() == [3, 3, 4, 6]
+
+
+def test_build_symbol_replay_does_not_bridge_long_gaps(replay_cfg):
+    routes = {"binance>mexc": _route([0, 5], [2, 2])}
+    _, t_index, _, _, realized = build_symbol_replay("BTCUSDT", routes, T0, T0 + 8, replay_cfg)
+    # t=3,4 — провал длиннее 2 с: строк нет, метки в t=3,4 неизвестны
+    assert t_index.tolist() == [0, 1, 2, 5]
+    assert realized[[0, 3]].tolist() == [2, 2] and np.isnan(realized[[1, 2]]).all()
+
+
+def test_evaluate_candidates_hand_computed():
+    rows = ReplayRows(
+        spread_bps=np.array([1.0, 5.0, 10.0]),
+        net_profit=np.array([0.1, 0.5, 1.0]),
+        volume_usd=np.array([100.0, 100.0, 1000.0]),
+        ml_score=np.array([0.2, 0.9, 0.5]),
+        realized=np.array([-1.0, 2.0, 3.0]),
+    )
+    candidates = np.array(
+        [
+            [0, 0, 0, 0],  # все три
+            [5, 0, 0, 0],  # строки 2, 3
+            [0, 0.6, 500, 0],  # строка 3
+            [0, 0, 0, 0.6],  # строка 2
+            [11, 0, 0, 0],  # ничего
+        ],
+        dtype=float,
+    )
+    profit, count = evaluate_candidates(rows, candidates, block=2)
+    assert profit.tolist() == [4.0, 5.0, 3.0, 2.0, 0.0]
+    assert count.tolist() == [3, 2, 1, 1, 0]
+
+    # Без модели колонка ml_min_score не участвует
+    profit, count = evaluate_candidates(rows, candidates[:, :3])
+    assert profit.tolist() == [4.0, 5.0, 3.0, 4.0, 0.0]
+
+
+def test_candidate_grid_without_ml_has_three_columns(cfg):
+    t = cfg.tuner
+    full, no_ml = candidate_grid(cfg), candidate_grid(cfg, with_ml=False)
+    assert no_ml.shape == (len(t.grid_min_spread_bps) * len(t.grid_min_net_profit_usd) * len(t.grid_min_volume_usd), 3)
+    assert full.shape == (no_ml.shape[0] * len(t.grid_ml_min_score), 4)
+
+
+def test_route_feature_matrix_matches_live_features(make_signal):
+    created = datetime(2026, 1, 1, 13, 0, 5)
+    mid, half = 60_000.0, 12.0 / 20_000
+    signal = make_signal(created_at=created)
+    signal.buy_price, signal.sell_price = mid * (1 - half), mid * (1 + half)
+    signal.spread = signal.sell_price - signal.buy_price
+    market = {"BTCUSDT": MarketStats(symbol="BTCUSDT", last_mid=mid, volatility_1h=0.004, updated_at=created)}
+    exchanges = {
+        ex: ExchangeStats(exchange=ex, status="excellent", delay_ms=0.0, error_rate=0.0, updated_at=created)
+        for ex in ("binance", "mexc")
+    }
+    live = np.empty(N_FEATURES)
+    fill_signal_features(live, signal, market, exchanges)
+
+    replay = route_feature_matrix(
+        "BTCUSDT",
+        ["binance>mexc"],
+        np.array([0]),
+        np.array([created.replace(tzinfo=timezone.utc).timestamp()]),
+        np.array([signal.buy_price]),
+        np.array([signal.sell_price]),
+        np.array([signal.net_profit]),
+        signal.volume_usd,
+        np.array([mid]),
+        np.array([0.004]),
+    )
+    np.testing.assert_allclose(replay[0], live, rtol=1e-12)
+
+
+def test_replay_scores_with_recorded_market(replay_cfg):
+    records = [
+        {"updated_at": datetime.fromtimestamp(T0 + t, timezone.utc).replace(tzinfo=None).isoformat(),
+         "mid": 60_000.0 + t, "volatility_1h": 0.001 * t if t else None}
+        for t in (0, 3)
+    ]
+    market = market_series(records[::-1])
+    mid, vol = sample_market(market, T0, 12, np.arange(12), replay_cfg)
+    assert mid[:3].tolist() == [60_000.0] * 3 and mid[3:10].tolist() == [60_003.0] * 7
+    assert np.isnan(mid[10:]).all()  # записи старше двух тиков stats engine не протягиваются
+    assert np.isnan(vol[:3]).all() and vol[3] == pytest.approx(0.003)
+
+    class RecordingModel:
+        weights = [1.0]
+        feature_order = list(FEATURE_COLUMNS)
+
+        def predict_proba_matrix(self, X):
+            self.X = X.copy()
+            return np.full(len(X), 0.7)
+
+    model = RecordingModel()
+    routes = {"binance>mexc": _route(range(12), [10.0] * 12)}
+    rows = _replay_symbol("BTCUSDT", routes, market, T0, T0 + 12, model, replay_cfg)
+
+    col = {name: i for i, name in enumerate(FEATURE_COLUMNS)}
+    assert model.X[3, col["mid_price"]] == 60_003.0
+    assert model.X[3, col["spread_abs"]] == pytest.approx(60_003.0 * 10 / 10_000)
+    assert model.X[3, col["volatility_1h"]] == pytest.approx(0.003)
+    assert model.X[3, col["buy_exchange_score"]] == 1.0
+    # t=0..2 без volatility_1h и t>=10 без рынка не скорятся
+    assert np.isnan(rows.ml_score[:3]).all() and (rows.ml_score[3:] == 0.7).all()
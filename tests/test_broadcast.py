@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+from stream.broadcast import BroadcastHub, Subscriber
+
+
+def _frame(payload) -> bytes:
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+class Loader:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, prev, version):
+        self.calls.append((prev, version))
+        return {"v": version}
+
+
+class RecordingChannel:
+    def __init__(self, topics):
+        self.topics = set(topics)
+        self.active = True
+        self.published = []
+
+    def publish(self, topic, payload, version):
+        self.published.append((topic, payload, version))
+
+
+def _hub(cfg, redis, **topics):
+    hub = BroadcastHub(redis, cfg)
+    # Upstream-цикл в тестах не запускается: _poll вызывается явно
+    hub._ensure_upstream = lambda: None
+    loaders = {}
+    for name, snapshot in topics.items():
+        loaders[name] = Loader()
+        hub.register(name, loaders[name], snapshot=snapshot)
+    return hub, loaders
+
+
+async def _subscribe(hub, name):
+    """Запускает генератор клиента до ожидания кадра (подписка зарегистрирована)."""
+    agen = hub.subscribe(name)
+    pending = asyncio.ensure_future(agen.__anext__())
+    await asyncio.sleep(0)
+    return agen, pending
+
+
+def test_subscriber_drops_oldest_frame():
+    sub = Subscriber(maxsize=2)
+    for frame in (b"1", b"2", b"3", b"4"):
+        sub.offer(frame)
+    assert sub.dropped == 2
+    assert [sub.queue.get_nowait(), sub.queue.get_nowait()] == [b"3", b"4"]
+
+
+def test_one_load_and_encode_fan_out(cfg, redis):
+    hub, loaders = _hub(cfg, redis, market=True)
+    channel = RecordingChannel(["market"])
+    hub.attach(channel)
+
+    async def scenario():
+        clients = [await _subscribe(hub, "market") for _ in range(3)]
+        await redis.client.set("state:version:market", 5)
+        await hub._poll()
+        frames = [await asyncio.wait_for(pending, 1.0) for _, pending in clients]
+        assert frames == [_frame({"v": 5})] * 3
+        assert loaders["market"].calls == [(None, 5)]
+        assert channel.published == [("market", {"v": 5}, 5)]
+
+        # Версия не менялась — ничего не грузится
+        await hub._poll()
+        assert loaders["market"].calls == [(None, 5)]
+
+        # Новый клиент snapshot-топика сразу получает последний кадр
+        late, pending = await _subscribe(hub, "market")
+        assert await asyncio.wait_for(pending, 1.0) == _frame({"v": 5})
+
+        for agen, _ in clients + [(late, None)]:
+            await agen.aclose()
+        assert not hub.topics["market"].subscribers
+
+    asyncio.run(scenario())
+
+
+def test_slow_client_is_bounded(cfg, redis):
+    cfg.api.stream_client_queue = 2
+    hub, _ = _hub(cfg, redis, signals=False)
+
+    async def scenario():
+        agen, pending = await _subscribe(hub, "signals")
+        for version in range(1, 6):
+            await redis.client.set("state:version:signals", version)
+            await hub._poll()
+        # Первый кадр забрал ожидающий get, дальше в очереди — только два последних
+        assert await asyncio.wait_for(pending, 1.0) == _frame({"v": 1})
+        assert [await agen.__anext__(), await agen.__anext__()] == [_frame({"v": 4}), _frame({"v": 5})]
+        await agen.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_idle_topics_load_nothing(cfg, redis):
+    hub, loaders = _hub(cfg, redis, market=True, signals=False)
+
+    async def scenario():
+        await redis.client.set("state:version:market", 1)
+        await redis.client.set("state:version:signals", 1)
+        await hub._poll()
+        assert loaders["market"].calls == [] and loaders["signals"].calls == []
+        # Событийный топик без слушателей теряет позицию: первый подписчик начнет с prev=None
+        assert hub.topics["signals"].last_version is None
+
+        agen, pending = await _subscribe(hub, "signals")
+        await redis.client.set("state:version:signals", 2)
+        await hub._poll()
+        assert loaders["signals"].calls == [(None, 2)]
+        assert await asyncio.wait_for(pending, 1.0) == _frame({"v": 2})
+        await agen.aclose()
+
+        # Канал без SSE-клиентов тоже считается слушателем, но кадр не кэшируется
+        channel = RecordingChannel(["market"])
+        hub.attach(channel)
+        await redis.client.set("state:version:market", 3)
+        await hub._poll()
+        assert channel.published == [("market", {"v": 3}, 3)]
+        assert hub.topics["market"].last_frame is None
+
+    asyncio.run(scenario())
+
+
+def test_heartbeat_when_idle(cfg, redis):
+    cfg.api.stream_heartbeat_sec = 0.01
+    hub, _ = _hub(cfg, redis, market=True)
+
+    async def scenario():
+        agen = hub.subscribe("market")
+        assert await asyncio.wait_for(agen.__anext__(), 1.0) == b": ping\n\n"
+        await agen.aclose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from ml.grid_index import GridIndex
+from ml.signal_clustering import NOISE, dbscan
+
+
+def _brute_pairs(Q, P, eps):
+    d2 = ((Q[:, None, :] - P[None, :, :]) ** 2).sum(axis=2)
+    return {(int(i), int(j)) for i, j in zip(*np.nonzero(d2 <= eps * eps))}
+
+
+def _brute_dbscan(X, eps, min_samples):
+    """Эталон: core по полной матрице расстояний, BFS по core-графу, border -> ближайший core."""
+    d2 = ((X[:, None, :] - X[None, :, :]) ** 2).sum(axis=2)
+    adj = d2 <= eps * eps
+    core = adj.sum(axis=1) >= min_samples
+    labels = np.full(len(X), NOISE)
+    cluster = 0
+    for seed in np.flatnonzero(core):
+        if labels[seed] != NOISE:
+            continue
+        stack = [seed]
+        labels[seed] = cluster
+        while stack:
+            i = stack.pop()
+            for j in np.flatnonzero(adj[i] & core):
+                if labels[j] == NOISE:
+                    labels[j] = cluster
+                    stack.append(j)
+        cluster += 1
+    for i in np.flatnonzero(~core):
+        near = np.flatnonzero(adj[i] & core)
+        if near.size:
+            labels[i] = labels[near[np.argmin(d2[i, near])]]
+    return labels, core
+
+
+def _partition(labels):
+    return {frozenset(np.flatnonzero(labels == c).tolist()) for c in np.unique(labels) if c != NOISE}
+
+
+def _collect(index, Q, max_pairs):
+    pairs, batches = {}, 0
+    for qi, pj, d2 in index.query_pairs(Q, max_pairs=max_pairs):
+        batches += 1
+        for i, j, d in zip(qi.tolist(), pj.tolist(), d2.tolist()):
+            assert (i, j) not in pairs
+            pairs[(i, j)] = d
+    return pairs, batches
+
+
+@pytest.mark.parametrize("dims", [1, 3, 5])
+def test_query_pairs_matches_brute_force(dims):
+    rng = np.random.default_rng(dims)
+    P = rng.normal(size=(400, 5))
+    Q = rng.normal(size=(150, 5))
+    eps = 0.8
+    index = GridIndex(P, eps, dims)
+    pairs, _ = _collect(index, Q, 1 << 20)
+    assert set(pairs) == _brute_pairs(Q, P, eps)
+    for (i, j), d in pairs.items():
+        assert d == pytest.approx(((Q[i] - P[j]) ** 2).sum(), abs=1e-9)
+
+
+def test_query_pairs_small_batches_lose_nothing():
+    # Одна плотная ячейка: блок расстояний режется по max_pairs
+    rng = np.random.default_rng(7)
+    P = rng.uniform(0, 0.1, size=(300, 4))
+    index = GridIndex(P, 1.0, 2)
+    pairs, batches = _collect(index, P, 1000)
+    assert batches > 1
+    assert len(pairs) == 300 * 300
+
+
+def test_query_pairs_empty():
+    index = GridIndex(np.zeros((0, 3)), 1.0)
+    assert list(index.query_pairs(np.ones((4, 3)))) == []
+    index = GridIndex(np.ones((4, 3)), 1.0)
+    assert list(index.query_pairs(np.zeros((0, 3)))) == []
+
+
+@pytest.mark.parametrize("grid_dims", [2, 3])
+def test_dbscan_matches_reference(grid_dims):
+    rng = np.random.default_rng(11)
+    blobs = [c + rng.normal(0, 0.3, (120, 4)) for c in ([0, 0, 0, 0], [4, 4, 0, 0], [0, 4, 4, 4])]
+    X = np.vstack(blobs + [rng.uniform(-3, 7, size=(60, 4))])
+    eps, min_samples = 0.6, 5
+
+    labels, core = dbscan(X, eps, min_samples, grid_dims)
+    ref_labels, ref_core = _brute_dbscan(X, eps, min_samples)
+
+    np.testing.assert_array_equal(core, ref_core)
+    np.testing.assert_array_equal(labels == NOISE, ref_labels == NOISE)
+    assert _partition(labels) == _partition(ref_labels)
+    # Метки — плотные 0..k-1
+    assert set(np.unique(labels[labels != NOISE])) == set(range(len(_partition(labels))))
+
+
+def test_dbscan_chain_is_one_cluster_and_no_core_is_all_noise():
+    chain = np.column_stack([np.arange(50) * 0.5, np.zeros(50)])
+    labels, core = dbscan(chain, eps=0.6, min_samples=3, grid_dims=2)
+    assert core[1:-1].all() and not core[[0, -1]].any()
+    assert (labels == 0).all()
+
+    labels, core = dbscan(chain, eps=0.6, min_samples=4, grid_dims=2)
+    assert not core.any() and (labels == NOISE).all()
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+
+from analytics.feature_store import FeatureStore, Segment
+from analytics.features import FEATURE_SCHEMA_VERSION
+
+
+def _items(n, offset=0, columns=("a", "b")):
+    return [({c: float(offset + i + j / 10) for j, c in enumerate(columns)}, (offset + i) % 2) for i in range(n)]
+
+
+def _store(cfg, segment_rows=8, segment_sec=3600.0, retention_sec=86400.0):
+    fs = cfg.feature_store
+    fs.enabled = True
+    fs.segment_rows = segment_rows
+    fs.segment_sec = segment_sec
+    fs.retention_sec = retention_sec
+    return FeatureStore(cfg)
+
+
+def test_disabled_store_writes_nothing(cfg):
+    store = FeatureStore(cfg)
+    store.append(_items(3), ts=100.0)
+    assert store.segments() == [] and store.load() is None
+
+
+def test_append_rolls_segments_and_load_concatenates(cfg):
+    store = _store(cfg, segment_rows=8)
+    store.append(_items(5), ts=100.0)
+    store.append(_items(6, offset=5), ts=101.0)
+    store.append(_items(7, offset=11), ts=102.0)
+
+    segments = store.segments()
+    assert [s.rows for s in segments] == [8, 8, 2]
+    assert segments[0].meta["min_ts"] == 100.0 and segments[0].meta["max_ts"] == 101.0
+
+    window = store.load()
+    assert window.columns == ["a", "b"] and window.schema_version == FEATURE_SCHEMA_VERSION
+    np.testing.assert_array_equal(window.X[:, 0], np.arange(18, dtype=np.float32))
+    np.testing.assert_allclose(window.X[:, 1], np.arange(18) + 0.1, rtol=1e-6)
+    np.testing.assert_array_equal(window.y, np.arange(18) % 2)
+    np.testing.assert_array_equal(window.ts, [100.0] * 5 + [101.0] * 6 + [102.0] * 7)
+
+
+def test_single_segment_window_is_a_memmap_view(cfg):
+    store = _store(cfg, segment_rows=64)
+    store.append(_items(10), ts=100.0)
+    store.append(_items(10, offset=10), ts=200.0)
+
+    window = store.load(since_ts=150.0)
+    assert isinstance(window.X.base, np.memmap) or isinstance(window.X, np.memmap)
+    np.testing.assert_array_equal(window.X[:, 0], np.arange(10, 20, dtype=np.float32))
+    # Новый процесс (или открытие заново) видит те же данные
+    again = FeatureStore(cfg).load(since_ts=150.0)
+    np.testing.assert_array_equal(again.X, window.X)
+
+
+def test_load_max_rows_keeps_newest(cfg):
+    store = _store(cfg, segment_rows=4)
+    store.append(_items(10), ts=100.0)
+    window = store.load(max_rows=6)
+    np.testing.assert_array_equal(window.X[:, 0], np.arange(4, 10, dtype=np.float32))
+    assert len(window.ts) == len(window.y) == 6
+
+
+def test_schema_change_starts_new_segment_and_load_uses_latest_columns(cfg):
+    store = _store(cfg)
+    store.append(_items(3), ts=100.0)
+    store.append(_items(2, columns=("a", "b", "c")), ts=101.0)
+
+    assert [s.columns for s in store.segments()] == [["a", "b"], ["a", "b", "c"]]
+    window = store.load()
+    assert window.columns == ["a", "b", "c"] and window.X.shape == (2, 3)
+
+
+def test_segment_age_and_retention(cfg):
+    store = _store(cfg, segment_rows=100, segment_sec=60.0, retention_sec=300.0)
+    store.append(_items(2), ts=1000.0)
+    store.append(_items(2), ts=1030.0)
+    store.append(_items(2), ts=1100.0)
+    assert [s.rows for s in store.segments()] == [4, 2]
+
+    # cutoff=1040: первый сегмент (max_ts=1030) удаляется, второй ещё живой
+    store.append(_items(1), ts=1340.0)
+    assert [s.meta["max_ts"] for s in store.segments()] == [1100.0, 1340.0]
+    # Активный сегмент не удаляется, даже если устарел
+    store.enforce_retention(now=10_000.0)
+    assert len(store.segments()) == 1
+
+
+def test_segment_meta_hides_unwritten_rows(cfg, tmp_path):
+    seg = Segment.create(str(tmp_path / "seg"), ["a"], capacity=16, created_ts=0.0)
+    assert seg.append(np.arange(20.0), np.ones((20, 1), dtype=np.float32), np.zeros(20, dtype=np.int8)) == 16
+    assert seg.append(np.array([1.0]), np.ones((1, 1), dtype=np.float32), np.zeros(1, dtype=np.int8)) == 0
+    reopened = Segment.open(seg.path)
+    assert reopened.rows == 16 and len(reopened.view(since_ts=10.0).ts) == 6
+    assert not os.path.exists(os.path.join(seg.path, "meta.json.tmp"))
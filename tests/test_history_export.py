@@ -0,0 +1,36 @@
+import asyncio
+import io
+from datetime import datetime, timedelta, timezone
+
+from analytics.history_export import export_stream, iter_chunks, read_npz_chunks
+from analytics.history_store import HistoryStore
+
+
+def test_export_chunks_follow_chunk_size_not_query_cap(cfg, tmp_path, redis, make_signal):
+    cfg.history.disk_enabled = True
+    cfg.history.disk_path = str(tmp_path)
+    cfg.history.disk_block_records = 16
+    cfg.history.query_max_scan = 10
+    history = HistoryStore(redis, cfg)
+    base = datetime(2026, 1, 1)
+
+    async def scenario():
+        for i in range(120):
+            await history.append_signal(make_signal(profit_bps=i, created_at=base + timedelta(seconds=i)))
+        start = base.replace(tzinfo=timezone.utc).timestamp()
+
+        chunks = [(items, cursor) async for items, cursor in iter_chunks(history, "signals", start, start + 600, chunk_size=50)]
+        assert [len(items) for items, _ in chunks] == [50, 50, 20]
+        assert chunks[-1][1] is None
+        assert [r["spread_bps"] for items, _ in chunks for r in items] == list(range(119, -1, -1))
+
+        # Продолжение с курсора первого чанка отдает оставшиеся записи
+        rest = [r async for items, _ in iter_chunks(history, "signals", start, start + 600, cursor=chunks[0][1]) for r in items]
+        assert [r["spread_bps"] for r in rest] == list(range(69, -1, -1))
+
+        body = b"".join([b async for b in export_stream(history, "signals", start, start + 600, fmt="npz", chunk_size=50)])
+        frames = list(read_npz_chunks(io.BytesIO(body)))
+        assert [meta["rows"] for meta, _ in frames] == [50, 50, 20]
+        assert frames[0][1]["ts"][0] == start + 119
+
+    asyncio.run(scenario())
@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+from analytics.history_store import HistoryStore
+
+
+def test_drop_pending_outcomes_keeps_signals_pushed_after_read(cfg, redis, make_signal):
+    cfg.history.pending_outcomes_max_len = 5
+    history = HistoryStore(redis, cfg)
+
+    async def push(n):
+        for _ in range(n):
+            signal = make_signal()
+            await redis.push_signal(signal)
+            await history.append_pending_outcome(signal, [])
+
+    async def pending_ids():
+        return [p["signal"]["id"] for p in await history.oldest_pending_outcomes(100)]
+
+    async def scenario():
+        await push(5)
+        mature = await history.oldest_pending_outcomes(3)
+        assert [p["signal"]["id"] for p in mature] == [1, 2, 3]
+
+        # Пока оценивались созревшие, пришли новые: кап вытеснил самые старые (1, 2)
+        await push(2)
+        assert await pending_ids() == [3, 4, 5, 6, 7]
+
+        # Удаление по id не задевает сигналы, пришедшие после чтения
+        await history.drop_pending_outcomes([p["signal"]["id"] for p in mature])
+        assert await pending_ids() == [4, 5, 6, 7]
+
+    asyncio.run(scenario())
+
+
+def test_migrate_legacy_pending_moves_list_into_id_queue(cfg, redis, make_signal):
+    history = HistoryStore(redis, cfg)
+
+    async def scenario():
+        legacy = [make_signal().model_dump(mode="json") for _ in range(3)]
+        legacy[0]["id"], legacy[1]["id"] = 7, 3  # у третьей записи id нет
+        for signal in legacy:
+            await redis.client.lpush("history:outcomes:pending", json.dumps({"signal": signal, "features": {}}))
+
+        assert await history.migrate_legacy_pending() == 2
+        assert not await redis.client.exists("history:outcomes:pending")
+        assert [p["signal"]["id"] for p in await history.oldest_pending_outcomes(10)] == [3, 7]
+        assert await history.migrate_legacy_pending() == 0
+
+    asyncio.run(scenario())
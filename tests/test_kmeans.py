@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from ml.signal_clustering import ClusterModel, SignalClusterer, _assign, cluster_job, fit_kmeans
+
+CENTERS = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 5.0], [0.0, 10.0, -5.0], [10.0, 10.0, 10.0]])
+
+
+def _blobs(n_per=500, seed=0):
+    rng = np.random.default_rng(seed)
+    X = np.vstack([c + rng.normal(0, 0.5, (n_per, 3)) for c in CENTERS])
+    return X, np.repeat(np.arange(len(CENTERS)), n_per)
+
+
+def _match(centroids):
+    """Для каждого истинного центра — расстояние до ближайшего найденного."""
+    d = np.linalg.norm(CENTERS[:, None, :] - centroids[None, :, :], axis=2)
+    return d.min(axis=1)
+
+
+def test_assign_matches_brute_force():
+    rng = np.random.default_rng(1)
+    X, C = rng.normal(size=(1000, 5)), rng.normal(size=(7, 5))
+    brute = np.linalg.norm(X[:, None, :] - C[None, :, :], axis=2).argmin(axis=1)
+    np.testing.assert_array_equal(_assign(X, C, chunk=64), brute)
+
+
+@pytest.mark.parametrize("batch_size", [0, 64])
+def test_fit_kmeans_recovers_separated_blobs(batch_size):
+    X, truth = _blobs()
+    centroids = fit_kmeans(X, 4, max_iter=200, batch_size=batch_size, seed=3)
+    assert _match(centroids).max() < 0.3
+    labels = _assign(X, centroids)
+    # Каждый blob целиком в одном кластере, кластеры разные
+    mapping = {t: np.unique(labels[truth == t]) for t in range(4)}
+    assert all(len(v) == 1 for v in mapping.values())
+    assert len({int(v[0]) for v in mapping.values()}) == 4
+
+
+def test_fit_kmeans_is_deterministic_for_seed():
+    X, _ = _blobs(200)
+    np.testing.assert_array_equal(fit_kmeans(X, 4, seed=5), fit_kmeans(X, 4, seed=5))
+
+
+def test_cluster_job_and_batch_predict(cfg, redis):
+    X, truth = _blobs(300)
+    result = cluster_job(X, 4, max_iter=100, tol=1e-4, batch_size=0, seed=3)
+    assert sorted(result.sizes.tolist()) == [300] * 4
+    np.testing.assert_allclose(result.centroids * result.std + result.mean, CENTERS[_order(result)], atol=0.2)
+
+    clusterer = SignalClusterer(cfg, redis)
+    order = ["a", "b", "c"]
+    clusterer.model = ClusterModel(order, result.mean, result.std, result.centroids)
+    labels = clusterer.predict_batch(X)
+    # Колонки в другом порядке выравниваются по feature_order модели
+    np.testing.assert_array_equal(clusterer.predict_batch(X[:, ::-1], ["c", "b", "a"]), labels)
+    assert all(len(np.unique(labels[truth == t])) == 1 for t in range(4))
+
+
+def _order(result):
+    raw = result.centroids * result.std + result.mean
+    return np.linalg.norm(raw[:, None, :] - CENTERS[None, :, :], axis=2).argmin(axis=1)
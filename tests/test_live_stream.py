@@ -0,0 +1,112 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+from state.models import MarketStats
+from stream.live import LiveChannel
+from stream.streamhub import SignalFeed, create_hub
+
+T0 = datetime(2026, 1, 1)
+
+
+def _events(frames):
+    """SSE-кадры -> [(event, data)], без heartbeat."""
+    result = []
+    for frame in frames:
+        lines = frame.decode("utf-8").strip().split("\n")
+        fields = dict(line.split(": ", 1) for line in lines if not line.startswith(":"))
+        if "event" in fields:
+            result.append((fields["event"], json.loads(fields["data"])))
+    return result
+
+
+def _setup(cfg, redis):
+    feed = SignalFeed(redis)
+    hub = create_hub(redis, cfg, feed)
+    hub._ensure_upstream = lambda: None
+    live = LiveChannel(redis, cfg, anchor_signals=feed.anchor)
+    hub.attach(live)
+    return hub, live
+
+
+async def _drain(agen, n):
+    return [await asyncio.wait_for(agen.__anext__(), 1.0) for _ in range(n)]
+
+
+def _stats(symbol, mid, vol=0.01, ts=T0):
+    return MarketStats(symbol=symbol, last_mid=mid, volatility_1h=vol, updated_at=ts)
+
+
+def test_signals_created_after_bootstrap_are_not_lost(cfg, redis, make_signal):
+    hub, live = _setup(cfg, redis)
+
+    async def scenario():
+        for _ in range(3):
+            await redis.push_signal(make_signal())
+        agen = live.subscribe()
+        (resync,) = _events(await _drain(agen, 1))
+        assert resync[0] == "resync" and [s["id"] for s in resync[1]["signals"]] == [1, 2, 3]
+
+        # Между чтением снимка и первым опросом хаба (топик был без слушателей)
+        for _ in range(2):
+            await redis.push_signal(make_signal())
+        await hub._poll()
+        (added,) = _events(await _drain(agen, 1))
+        assert added[0] == "signal-added" and [s["id"] for s in added[1]] == [4, 5]
+
+        await redis.push_signal(make_signal())
+        await hub._poll()
+        (added,) = _events(await _drain(agen, 1))
+        assert [s["id"] for s in added[1]] == [6]
+        await agen.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_signal_feed_without_anchor_starts_at_latest(redis, make_signal):
+    feed = SignalFeed(redis)
+
+    async def scenario():
+        for _ in range(3):
+            await redis.push_signal(make_signal())
+        assert await feed.load(None, 1) is None and feed.last_id == 3
+        await redis.push_signal(make_signal())
+        assert [s.id for s in await feed.load(1, 2)] == [4]
+        # Якорь, заданный при живом курсоре, сбрасывается и не вызывает повторов позже
+        feed.anchor(1)
+        assert await feed.load(2, 3) is None
+        assert await feed.load(None, 4) is None and feed.last_id == 4
+
+    asyncio.run(scenario())
+
+
+def test_market_deltas_ignore_timestamp_churn(cfg, redis):
+    cfg.api.stream_live_mid_bps = 1.0
+    hub, live = _setup(cfg, redis)
+
+    async def scenario():
+        await redis.set_market_stats([_stats("BTCUSDT", 100_000.0), _stats("ETHUSDT", 3000.0)])
+        agen = live.subscribe()
+        await _drain(agen, 1)
+
+        # Только updated_at и сдвиг mid < 1 bps — кадра нет
+        await redis.set_market_stats(
+            [_stats("BTCUSDT", 100_005.0, ts=T0 + timedelta(seconds=1)), _stats("ETHUSDT", 3000.1, ts=T0 + timedelta(seconds=1))]
+        )
+        await hub._poll()
+        assert live.seq == 1
+
+        # BTC накопил сдвиг > 1 bps относительно отправленного значения, у ETH сменилась волатильность
+        await redis.set_market_stats([_stats("BTCUSDT", 100_011.0), _stats("ETHUSDT", 3000.1, vol=0.02)])
+        await hub._poll()
+        (market,) = _events(await _drain(agen, 1))
+        assert market[0] == "market"
+        assert {r["symbol"]: r["last_mid"] for r in market[1]["upsert"]} == {"BTCUSDT": 100_011.0, "ETHUSDT": 3000.1}
+
+        await redis.set_market_stats([_stats("BTCUSDT", 100_011.0)])
+        await hub._poll()
+        (market,) = _events(await _drain(agen, 1))
+        assert market[1] == {"upsert": [], "remove": ["ETHUSDT"]}
+        await agen.aclose()
+
+    asyncio.run(scenario())
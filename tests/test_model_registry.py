@@ -0,0 +1,105 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from ml.model_registry import ModelRegistry
+from ml.signal_filter import SignalFilter, SimpleLogisticModel
+
+
+def _model(bias: float) -> SimpleLogisticModel:
+    model = SimpleLogisticModel()
+    model.feature_order = ["spread_bps"]
+    model.weights = {"spread_bps": 1.0}
+    model.bias = bias
+    model._w = np.array([1.0])
+    return model
+
+
+def test_publish_activate_and_rollback(redis):
+    registry = ModelRegistry(redis, "test")
+
+    async def scenario():
+        assert await registry.load_active() == (None, None)
+        v1 = await registry.publish(b"one", {"note": "first"})
+        v2 = await registry.publish(b"two")
+        v3 = await registry.publish(b"three", activate=False)
+        assert (v1, v2, v3) == (1, 2, 3)
+        assert await registry.load_active() == (2, b"two")
+        versions = await registry.versions()
+        assert [v for v, _ in versions] == [1, 2, 3]
+        assert versions[0][1]["note"] == "first" and "created_at" in versions[0][1]
+
+        await registry.activate(3)
+        assert await registry.load_active() == (3, b"three")
+        assert await registry.rollback() == 2
+        assert await registry.rollback() == 1
+        assert await registry.load_active() == (1, b"one")
+        with pytest.raises(KeyError):
+            await registry.rollback()
+        with pytest.raises(KeyError):
+            await registry.activate(42)
+        assert await registry.active_version() == 1
+
+    asyncio.run(scenario())
+
+
+def test_prune_keeps_active_version(redis):
+    registry = ModelRegistry(redis, "test", keep_versions=2)
+
+    async def scenario():
+        await registry.publish(b"v1")
+        for n in range(2, 6):
+            await registry.publish(f"v{n}".encode(), activate=False)
+        # Активна v1 — самая старая, но не удаляется
+        assert [v for v, _ in await registry.versions()] == [1, 4, 5]
+        assert await registry.load(2) is None
+        assert await registry.load_active() == (1, b"v1")
+        with pytest.raises(KeyError):
+            await registry.activate(3)
+
+    asyncio.run(scenario())
+
+
+def test_watch_notifies_on_activate(redis):
+    registry = ModelRegistry(redis, "test")
+    seen = []
+
+    async def scenario():
+        event = asyncio.Event()
+
+        async def on_change(version):
+            seen.append(version)
+            if len(seen) == 2:
+                event.set()
+
+        await registry.publish(b"one", activate=False)
+        watcher = asyncio.create_task(registry.watch(on_change))
+        await asyncio.sleep(0.05)
+        await registry.publish(b"two")
+        await registry.activate(1)
+        await asyncio.wait_for(event.wait(), 2.0)
+        watcher.cancel()
+        await asyncio.gather(watcher, return_exceptions=True)
+
+    asyncio.run(scenario())
+    assert seen == [2, 1]
+
+
+def test_signal_filter_follows_active_version(cfg, redis):
+    cfg.ml.enabled = True
+    sf = SignalFilter(cfg, redis)
+
+    async def scenario():
+        v1 = await sf.registry.publish(_model(-1.0).to_bytes())
+        v2 = await sf.registry.publish(_model(1.0).to_bytes())
+        await sf._refresh_model(force=True)
+        assert sf.version == v2 and sf.model.bias == 1.0
+
+        await sf.registry.rollback()
+        await sf._refresh_model(force=True)
+        assert sf.version == v1 and sf.model.bias == -1.0
+        scores = await sf.score_batch(np.array([[1.0]]), ["spread_bps"])
+        assert scores[0] == pytest.approx(0.5)
+
+    asyncio.run(scenario())
@@ -0,0 +1,145 @@
+import asyncio
+import json
+from datetime import datetime
+
+import numpy as np
+
+from analytics.features import FEATURE_COLUMNS, N_FEATURES
+from analytics.history_store import HistoryStore
+from analytics.outcomes import BookSeries, OutcomeEvaluator, evaluate_routes
+from core.signal_math import route_metrics
+
+
+def _series():
+    """Две биржи, снимки раз в секунду: маршрут 0>1 в плюсе до t=5, обратный — всегда в минусе."""
+    ts = np.arange(10, dtype=float)
+    bid = np.vstack([np.full(10, 99.9), np.where(ts < 5, 101.0, 99.5)])
+    ask = np.vstack([np.full(10, 100.0), np.full(10, 101.1)])
+    return BookSeries(ts, bid, ask)
+
+
+def test_evaluate_routes_survival_and_horizon_profit():
+    t0 = np.array([1.5, 0.5, 20.0])
+    buy_idx = np.array([0, 1, 0])
+    sell_idx = np.array([1, 0, 1])
+    ones = np.ones(3)
+
+    survival, profit = evaluate_routes(
+        _series(), t0, buy_idx, sell_idx,
+        horizons=[2.0, 5.0],
+        volume_usd=1000 * ones,
+        fee_rate=0 * ones,
+        slippage_rate=0 * ones,
+        max_gap_sec=1.0,
+    )
+
+    # Спред 0>1 закрывается на снимке t=5; обратный маршрут закрыт уже на первом снимке
+    np.testing.assert_allclose(survival[:2], [3.5, 0.5])
+    assert np.isnan(survival[2])  # после сигнала снимков нет
+
+    open_net = route_metrics(100.0, 101.0, 1000.0, 0.0, 0.0).net_profit
+    closed_net = route_metrics(100.0, 99.5, 1000.0, 0.0, 0.0).net_profit
+    np.testing.assert_allclose(profit[0], [open_net, closed_net])
+    assert profit[1, 0] < 0
+    # Ближайший снимок к t0+h старше max_gap_sec — прибыль неизвестна
+    assert np.isnan(profit[2]).all()
+
+
+def test_evaluate_routes_empty_inputs():
+    survival, profit = evaluate_routes(
+        _series(), np.empty(0), np.empty(0, dtype=int), np.empty(0, dtype=int),
+        horizons=[1.0], volume_usd=np.empty(0), fee_rate=np.empty(0), slippage_rate=np.empty(0),
+        max_gap_sec=1.0,
+    )
+    assert survival.shape == (0,) and profit.shape == (0, 1)
+
+
+def _evaluate(series, t0, horizons, max_gap_sec):
+    n = len(t0)
+    return evaluate_routes(
+        series, np.array(t0), np.zeros(n, dtype=int), np.ones(n, dtype=int),
+        horizons=horizons, volume_usd=np.full(n, 1000.0), fee_rate=np.zeros(n), slippage_rate=np.zeros(n),
+        max_gap_sec=max_gap_sec,
+    )
+
+
+def test_evaluate_routes_missing_book_is_not_closure():
+    series = _series()
+    series.bid[1, 3] = np.nan  # на снимке t=3 нет книги биржи продажи
+    survival, profit = _evaluate(series, [1.5], [1.0, 1.5], max_gap_sec=1.0)
+    assert survival[0] == 3.5  # спред закрылся на t=5, а не на пропуске t=3
+    assert profit[0, 0] > 0  # t=2.5 -> снимок t=2
+    assert np.isnan(profit[0, 1])  # t=3 -> снимок без книги: прибыль неизвестна
+
+
+def test_evaluate_routes_horizon_ignores_snapshots_before_signal():
+    # Сигнал в t=4.5, горизонт 0.2 с: ближайший снимок <= 4.7 — t=4, он раньше сигнала
+    _, profit = _evaluate(_series(), [4.5], [0.2, 1.0], max_gap_sec=3.0)
+    assert np.isnan(profit[0, 0])
+    assert profit[0, 1] < 0  # t=5: спред уже закрыт
+
+
+def test_run_batch_skips_immature_head_of_queue(cfg, redis, make_signal, make_book):
+    history = HistoryStore(redis, cfg)
+    evaluator = OutcomeEvaluator(history, cfg)
+    t0 = datetime(2026, 1, 1)
+    t0_epoch = 1_767_225_600.0
+
+    async def enqueue(signal):
+        await redis.push_signal(signal)
+        await history.append_pending_outcome(signal, [])
+
+    async def scenario():
+        # Первым в очереди — свежий сигнал символа без снимков: он еще не созрел
+        await enqueue(make_signal(symbol="ETHUSDT", created_at=datetime.utcnow()))
+        await enqueue(make_signal(symbol="BTCUSDT", created_at=t0))
+        for k in range(40):
+            books = {"binance": make_book("binance", 99.9, 100.0), "mexc": make_book("mexc", 101.0, 101.1)}
+            await history.append_books("BTCUSDT", books, ts=t0_epoch + k)
+
+        assert await evaluator.run_batch() == 1
+        pending = await history.oldest_pending_outcomes(10)
+        assert [p["signal"]["symbol"] for p in pending] == ["ETHUSDT"]
+        outcomes = await redis.client.lrange("history:outcomes", 0, -1)
+        assert len(outcomes) == 1
+
+    asyncio.run(scenario())
+
+
+def test_run_batch_labels_feature_rows(cfg, redis, make_signal, make_book):
+    cfg.feature_store.enabled = True
+    history = HistoryStore(redis, cfg)
+    evaluator = OutcomeEvaluator(history, cfg)
+    t0 = datetime(2026, 1, 1)
+    t0_epoch = 1_767_225_600.0
+    row = np.arange(N_FEATURES, dtype=float)
+
+    async def scenario():
+        fresh = make_signal(symbol="BTCUSDT", created_at=t0)
+        await redis.push_signal(fresh)
+        await history.append_pending_outcome(fresh, row)
+        # Запись старого формата (признаки словарём) в очереди после обновления
+        legacy = make_signal(symbol="BTCUSDT", created_at=t0)
+        await redis.push_signal(legacy)
+        await history.append_pending_outcome(legacy, [])
+        raw = (await redis.client.zrange("history:outcomes:pending:by_id", 1, 1))[0]
+        await redis.client.zrem("history:outcomes:pending:by_id", raw)
+        record = json.loads(raw)
+        record["features"] = {"spread_bps": 7.0}
+        await redis.client.zadd("history:outcomes:pending:by_id", {json.dumps(record): legacy.id})
+
+        for k in range(40):
+            books = {"binance": make_book("binance", 99.9, 100.0), "mexc": make_book("mexc", 101.0, 101.1)}
+            await history.append_books("BTCUSDT", books, ts=t0_epoch + k)
+
+        assert await evaluator.run_batch() == 2
+        stored = await history.recent_features(10)
+        by_spread = {r["features"]["spread_bps"]: r for r in stored}
+        assert set(by_spread) == {row[FEATURE_COLUMNS.index("spread_bps")], 7.0}
+        assert list(by_spread[7.0]["features"]) == list(FEATURE_COLUMNS)
+
+    asyncio.run(scenario())
+    window = evaluator.feature_store.load()
+    assert window.columns == list(FEATURE_COLUMNS)
+    np.testing.assert_array_equal(np.sort(window.X[:, 0]), [0.0, 0.0])
+    assert sorted(window.X[:, FEATURE_COLUMNS.index("spread_bps")].tolist()) == [7.0, 8.0]
@@ -0,0 +1,98 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from analytics.history_store import HistoryStore
+from analytics.quantile_sketch import KLLSketch
+from core.param_tuner import TunerSketches, _ingest
+
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def _rank_error(sketch: KLLSketch, data: np.ndarray) -> float:
+    ordered = np.sort(data)
+    worst = 0.0
+    for q in QUANTILES:
+        rank = np.searchsorted(ordered, sketch.quantile(q), side="right") / ordered.size
+        worst = max(worst, abs(rank - q))
+    return worst
+
+
+def _sketch(values, k=200) -> KLLSketch:
+    sketch = KLLSketch(k)
+    for v in values:
+        sketch.update(v)
+    return sketch
+
+
+def test_small_stream_is_exact():
+    data = np.arange(1, 101, dtype=float)
+    sketch = _sketch(np.random.default_rng(0).permutation(data))
+    assert sketch.quantile(0.5) == 50.0
+    assert sketch.quantile(0.0) == 1.0 and sketch.quantile(1.0) == 100.0
+    assert KLLSketch().quantile(0.5) is None
+
+
+def test_large_stream_rank_error_and_bounded_memory():
+    data = np.random.default_rng(1).lognormal(0, 1, 100_000)
+    sketch = _sketch(data)
+    assert sketch.n == data.size
+    assert sketch._size < 3 * sketch.k  # память O(k), а не O(n)
+    assert _rank_error(sketch, data) < 0.02
+
+
+def test_merge_approximates_union():
+    rng = np.random.default_rng(2)
+    a, b = rng.normal(0, 1, 40_000), rng.normal(3, 1, 60_000)
+    merged = _sketch(a)
+    merged.merge(_sketch(b))
+    assert merged.n == a.size + b.size
+    assert _rank_error(merged, np.concatenate([a, b])) < 0.02
+
+
+def test_deterministic_and_dict_roundtrip():
+    data = np.random.default_rng(3).uniform(0, 1, 20_000)
+    a, b = _sketch(data), _sketch(data)
+    assert a.to_dict() == b.to_dict()
+
+    restored = KLLSketch.from_dict(a.to_dict())
+    for v in data[:5000]:
+        a.update(v)
+        restored.update(v)
+    assert restored.to_dict() == a.to_dict()
+
+
+def test_tuner_ingest_counts_each_signal_once(cfg, redis, make_signal):
+    history = HistoryStore(redis, cfg)
+    sketches = TunerSketches(k=50)
+
+    async def push(n):
+        for i in range(n):
+            signal = make_signal(profit_bps=float(i))
+            await redis.push_signal(signal)
+            await history.append_signal(signal)
+
+    async def scenario():
+        await push(30)
+        assert await _ingest(sketches, history, cfg) == 30
+        assert sketches.last_id == 30
+        assert await _ingest(sketches, history, cfg) == 0
+        await push(5)
+        assert await _ingest(sketches, history, cfg) == 5
+        assert sketches.current["global"]["net_profit"].n == 35
+        assert sketches.current["route:BTCUSDT:binance>mexc"]["spread_bps"].n == 35
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("k", [50, 200])
+def test_tuner_sketches_roundtrip(k):
+    sketches = TunerSketches(k)
+    for i in range(500):
+        sketches.observe({"symbol": "BTCUSDT", "buy_exchange": "binance", "sell_exchange": "mexc",
+                          "net_profit": float(i), "spread_bps": i / 10, "volume_usd": 1000.0})
+    sketches.last_id = 500
+    restored = TunerSketches.from_dict(sketches.to_dict())
+    assert restored.last_id == 500
+    assert restored._merged("global")["net_profit"].quantile(0.5) == sketches._merged("global")["net_profit"].quantile(0.5)
@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import pytest
+
+from state import redis_state
+from state.redis_state import _encode
+
+
+@pytest.fixture
+def pushed(redis, make_signal):
+    """10 сигналов: четные — BTCUSDT binance>mexc, нечетные — ETHUSDT mexc>binance; прибыль = id."""
+
+    async def push():
+        for i in range(1, 11):
+            if i % 2:
+                signal = make_signal(symbol="ETHUSDT", buy="mexc", sell="binance", profit_bps=float(i))
+            else:
+                signal = make_signal(profit_bps=float(i))
+            await redis.push_signal(signal)
+            assert signal.id == i
+
+    asyncio.run(push())
+    return redis
+
+
+def _ids(redis, **kwargs):
+    return [s.id for s in asyncio.run(redis.get_signals(**kwargs))]
+
+
+def test_get_signals_newest_first_and_before_id_pages(pushed):
+    assert _ids(pushed, limit=3) == [10, 9, 8]
+    assert _ids(pushed, limit=3, before_id=8) == [7, 6, 5]
+    assert _ids(pushed, limit=3, before_id=2) == [1]
+
+
+def test_get_signals_since_id_returns_closest_to_cursor(pushed):
+    # Страница сразу после курсора: max(id) ответа — следующий since_id без пропусков
+    assert _ids(pushed, limit=3, since_id=4) == [7, 6, 5]
+    assert _ids(pushed, limit=3, since_id=7) == [10, 9, 8]
+    assert _ids(pushed, since_id=10) == []
+    assert _ids(pushed, since_id=2, before_id=6) == [5, 4, 3]
+
+
+def test_get_signals_filters_apply_before_limit(pushed):
+    assert _ids(pushed, symbol="BTCUSDT", limit=2) == [10, 8]
+    assert _ids(pushed, symbol="ETHUSDT", since_id=1, limit=2) == [5, 3]
+    assert _ids(pushed, min_profit_bps=4.0, buy_exchange="mexc", limit=2) == [9, 7]
+    assert _ids(pushed, min_profit_bps=4.0, sell_exchange="mexc", since_id=0, limit=2) == [6, 4]
+
+
+
+def test_filtered_scan_reads_pages_until_limit(pushed, monkeypatch):
+    monkeypatch.setattr(redis_state, "SIGNALS_SCAN_PAGE", 2)
+    calls = []
+    for name in ("zrangebyscore", "zrevrangebyscore"):
+        original = getattr(pushed.client, name)
+
+        async def counted(*args, _original=original, **kwargs):
+            calls.append(kwargs["num"])
+            return await _original(*args, **kwargs)
+
+        monkeypatch.setattr(pushed.client, name, counted)
+
+    # Страницы по 2 с головы индекса: 10,9 | 8,7 — дальше не читается
+    assert _ids(pushed, limit=2, buy_exchange="mexc") == [9, 7]
+    assert len(calls) == 2
+    assert _ids(pushed, limit=3, sell_exchange="mexc", since_id=0) == [6, 4, 2]
+    assert _ids(pushed, limit=5, min_profit_bps=8.0) == [10, 9, 8]
+    assert _ids(pushed, limit=2, since_id=3, min_profit_bps=6.0) == [7, 6]
+
+
+def test_migrate_legacy_signals(redis, make_signal):
+    async def scenario():
+        legacy = [make_signal(profit_bps=float(i)) for i in range(3)]
+        # Старый формат: LPUSH (новые в голове), без id
+        await redis.client.lpush("state:signals", *[json.dumps(_encode(s)) for s in legacy], "not json")
+        assert await redis.migrate_legacy_signals() == 3
+        assert not await redis.client.exists("state:signals")
+        migrated = await redis.get_signals()
+        assert [(s.id, s.net_profit_bps) for s in migrated] == [(3, 2.0), (2, 1.0), (1, 0.0)]
+        assert [s.id for s in await redis.get_signals(symbol="BTCUSDT")] == [3, 2, 1]
+
+        fresh = make_signal()
+        await redis.push_signal(fresh)
+        assert fresh.id == 4
+        assert await redis.migrate_legacy_signals() == 0
+
+        # Индекс уже наполнен: устаревший список просто удаляется
+        await redis.client.lpush("state:signals", json.dumps(_encode(make_signal())))
+        assert await redis.migrate_legacy_signals() == 0
+        assert not await redis.client.exists("state:signals")
+        assert [s.id for s in await redis.get_signals()] == [4, 3, 2, 1]
+
+    asyncio.run(scenario())
+
+
+def test_top_signals_skip_expired_without_losing_limit(redis, make_signal):
+    exchanges = ["binance", "mexc", "okx", "bybit"]
+
+    async def scenario():
+        routes = [(b, s) for b in exchanges for s in exchanges if b != s]
+        live = [make_signal(buy=b, sell=s, profit_bps=float(i)) for i, (b, s) in enumerate(routes[:6])]
+        await redis.update_top_signals(live, ttl_sec=60.0, max_size=100)
+        # Самые прибыльные маршруты протухли, а core engine их не вычистил
+        stale = [make_signal(buy=b, sell=s, profit_bps=100.0 + i) for i, (b, s) in enumerate(routes[6:])]
+        await redis.update_top_signals(stale, ttl_sec=60.0, max_size=100)
+        await redis.client.zadd("state:top:expiry", {f"BTCUSDT|{s.buy_exchange}>{s.sell_exchange}": 0 for s in stale})
+
+        top = await redis.get_top_signals(limit=4)
+        assert [s.net_profit_bps for s in top] == [5.0, 4.0, 3.0, 2.0]
+        assert [s.net_profit_bps for s in await redis.get_top_signals(limit=10)] == [5.0, 4.0, 3.0, 2.0, 1.0, 0.0]
+        assert [s.net_profit_bps for s in await redis.get_top_signals(limit=10, min_profit_bps=3.0)] == [5.0, 4.0, 3.0]
+        assert await redis.get_top_signals(limit=0) == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,128 @@
+import asyncio
+import json
+
+from starlette.requests import Request
+
+from api.response_cache import ResponseCache, _etag_matches
+
+
+def _request(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+class Source:
+    """Загрузчик с управляемым телом и счетчиком вызовов."""
+
+    def __init__(self, body=b'{"v": 1}'):
+        self.body = body
+        self.calls = []
+
+    async def __call__(self, *params):
+        self.calls.append(params)
+        if isinstance(self.body, Exception):
+            raise self.body
+        return self.body
+
+
+def _cache(cfg, redis, **sources):
+    cache = ResponseCache(redis, cfg)
+    # Фоновый refresher в тестах не нужен: _refresh вызывается явно
+    cache._ensure_refresher = lambda: None
+    for name, loader in sources.items():
+        cache.register(name, loader, missing=f"No {name}")
+    return cache
+
+
+def test_etag_matching():
+    assert _etag_matches('"abc"', '"abc"')
+    assert _etag_matches('W/"abc"', '"abc"')
+    assert _etag_matches('"x", "abc"', '"abc"')
+    assert _etag_matches("*", '"abc"')
+    assert not _etag_matches('"abd"', '"abc"')
+    assert not _etag_matches(None, '"abc"')
+
+
+def test_conditional_get_returns_304(cfg, redis):
+    source = Source()
+    cache = _cache(cfg, redis, top=source)
+
+    async def scenario():
+        first = await cache.response(_request(), "top", 20)
+        assert first.status_code == 200 and first.body == b'{"v": 1}'
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "no-cache"
+
+        again = await cache.response(_request(etag), "top", 20)
+        assert again.status_code == 304 and again.body == b""
+        assert again.headers["etag"] == etag
+        assert (await cache.response(_request(f'W/{etag}, "other"'), "top", 20)).status_code == 304
+        assert (await cache.response(_request('"other"'), "top", 20)).status_code == 200
+        # Другие параметры — отдельная запись
+        await cache.response(_request(etag), "top", 50)
+        assert source.calls == [(20,), (50,)]
+
+    asyncio.run(scenario())
+
+
+def test_missing_body_is_404(cfg, redis):
+    cache = _cache(cfg, redis, matrix=Source(None))
+    response = asyncio.run(cache.response(_request(), "matrix"))
+    assert response.status_code == 404
+    assert json.loads(response.body) == {"detail": "No matrix"}
+
+
+def test_refresh_reloads_only_changed_sources(cfg, redis):
+    top, stats = Source(), Source(b"stats")
+    cache = _cache(cfg, redis, top=top, stats=stats)
+
+    async def scenario():
+        old = (await cache.get("top")).etag
+        await cache.get("stats")
+        await cache._refresh()
+        top.body = b'{"v": 2}'
+        await cache._refresh()
+        assert len(top.calls) == 1  # версия не менялась — тело прежнее
+
+        await redis.client.incr("state:version:top")
+        await cache._refresh()
+        entry = await cache.get("top")
+        assert entry.body == b'{"v": 2}' and entry.etag != old
+        assert len(top.calls) == 2 and len(stats.calls) == 1
+
+        # Клиент со старым ETag получает новое тело
+        response = await cache.response(_request(old), "top")
+        assert response.status_code == 200 and response.body == b'{"v": 2}'
+
+    asyncio.run(scenario())
+
+
+def test_refresh_by_age_and_failed_reload_keeps_entry(cfg, redis):
+    cfg.api.cache_max_age_sec = 0.0
+    source = Source()
+    cache = _cache(cfg, redis, top=source)
+
+    async def scenario():
+        await cache.get("top")
+        await cache._refresh()
+        assert len(source.calls) == 2
+        source.body = RuntimeError("redis down")
+        await cache._refresh()
+        assert (await cache.get("top")).body == b'{"v": 1}'
+
+    asyncio.run(scenario())
+
+
+def test_lru_eviction(cfg, redis):
+    cfg.api.cache_max_entries = 2
+    source = Source()
+    cache = _cache(cfg, redis, top=source)
+
+    async def scenario():
+        for limit in (1, 2, 1, 3):
+            await cache.get("top", limit)
+        assert [k[1] for k in cache._entries] == [(1,), (3,)]
+        await cache.get("top", 2)
+        assert source.calls == [(1,), (2,), (3,), (2,)]
+
+    asyncio.run(scenario())
@@ -0,0 +1,153 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from analytics.history_store import HistoryStore
+from analytics import segment_store
+from analytics.segment_store import SegmentStore
+
+T0 = 1_767_225_600.0  # 2026-01-01 UTC
+
+
+def _history_cfg(cfg, tmp_path):
+    cfg.history.disk_enabled = True
+    cfg.history.disk_path = str(tmp_path)
+    cfg.history.disk_block_records = 4
+    cfg.history.disk_compact_block_records = 64
+    cfg.history.disk_segment_sec = 30.0
+    return cfg
+
+
+def _records(n):
+    return [
+        {"symbol": "BTCUSDT" if i % 3 else "ETHUSDT", "seq": i, "created_at": T0 + i}
+        for i in range(n)
+    ]
+
+
+def _write(store, records):
+    for record in records:
+        if store.append(record):
+            store.flush()
+    store.flush()
+
+
+def test_segment_store_write_query_compact_roundtrip(cfg, tmp_path):
+    cfg = _history_cfg(cfg, tmp_path)
+    store = SegmentStore(str(tmp_path), "signals", cfg.history)
+    records = _records(100)
+    _write(store, records)
+
+    segments = store.segments()
+    assert len(segments) > 1
+    assert store.watermark() == T0 + 99
+
+    def seqs(**kwargs):
+        return [r["seq"] for r in store.query(**kwargs)]
+
+    expected_range = [r["seq"] for r in records if T0 + 10 <= r["created_at"] <= T0 + 70]
+    expected_eth = [r["seq"] for r in records if r["symbol"] == "ETHUSDT"][::-1]
+    assert seqs(start_ts=T0 + 10, end_ts=T0 + 70) == expected_range
+    assert seqs(start_ts=T0, end_ts=T0 + 99, symbol="ETHUSDT", newest_first=True) == expected_eth
+    assert seqs(start_ts=T0, end_ts=T0 + 99, limit=5, newest_first=True) == [99, 98, 97, 96, 95]
+
+    # Закрытые сегменты переписываются крупными блоками, результаты запросов не меняются
+    blocks_before = sum(s.meta["blocks"] for s in segments)
+    assert store.compact() == len(segments) - 1
+    assert sum(s.meta["blocks"] for s in store.segments()) < blocks_before
+    assert seqs(start_ts=T0 + 10, end_ts=T0 + 70) == expected_range
+    assert seqs(start_ts=T0, end_ts=T0 + 99, symbol="ETHUSDT", newest_first=True) == expected_eth
+    assert store.compact() == 0
+
+    assert store.enforce_retention(now=T0 + 99 + cfg.history.disk_retention_sec) > 0
+    assert seqs(start_ts=T0, end_ts=T0 + 99)[-1] == 99
+
+
+def test_history_range_pages_disk_and_unflushed_tail(cfg, tmp_path, redis, make_signal):
+    cfg = _history_cfg(cfg, tmp_path)
+    history = HistoryStore(redis, cfg)
+    base = datetime(2026, 1, 1)
+
+    async def scenario():
+        for i in range(30):
+            await history.append_signal(
+                make_signal(symbol="BTCUSDT" if i % 2 else "ETHUSDT", profit_bps=i, created_at=base + timedelta(seconds=i // 2))
+            )
+        # Часть записей еще в буфере писателя: видна только через горячий список Redis
+        assert history.disk["signals"]._buffer
+
+        start = base.replace(tzinfo=timezone.utc).timestamp()
+        pages, cursor = [], None
+        while True:
+            items, cursor = await history.query_signals(start, start + 60, limit=7, cursor=cursor)
+            pages.append(items)
+            if cursor is None:
+                break
+        seen = [r["spread_bps"] for page in pages for r in page]
+        assert sorted(seen) == list(range(30))
+        assert len(pages) == 5
+
+        btc, _ = await history.query_signals(start, start + 60, symbol="BTCUSDT", min_profit=2.0, limit=100)
+        assert sorted(r["spread_bps"] for r in btc) == [i for i in range(30) if i % 2 and i / 10 >= 2.0]
+
+    asyncio.run(scenario())
+
+
+def _files(tmp_path, stream="signals"):
+    return sorted(os.listdir(tmp_path / stream))
+
+
+def test_retention_removes_originals_left_by_interrupted_compaction(cfg, tmp_path, monkeypatch):
+    cfg = _history_cfg(cfg, tmp_path)
+    store = SegmentStore(str(tmp_path), "signals", cfg.history)
+    _write(store, _records(100))
+    sealed = [s for s in store.segments() if s.meta.get("sealed")]
+
+    # Падение после публикации копии, но до удаления исходника
+    monkeypatch.setattr(segment_store, "_remove_segment", lambda seg: True)
+    assert store.compact() == len(sealed)
+    monkeypatch.undo()
+    originals = {os.path.basename(s.base) for s in sealed}
+    assert {n.rsplit(".", 1)[0] for n in _files(tmp_path)} >= originals
+    assert not originals & {os.path.basename(s.base) for s in store.segments()}
+    assert [r["seq"] for r in store.query(T0, T0 + 99)] == list(range(100))
+
+    assert store.enforce_retention(now=T0) == len(sealed)
+    assert not originals & {n.rsplit(".", 1)[0] for n in _files(tmp_path)}
+    assert [r["seq"] for r in store.query(T0, T0 + 99)] == list(range(100))
+
+
+def test_busy_segment_removal_is_retried(cfg, tmp_path, monkeypatch):
+    cfg = _history_cfg(cfg, tmp_path)
+    store = SegmentStore(str(tmp_path), "signals", cfg.history)
+    _write(store, _records(100))
+    sealed = [s for s in store.segments() if s.meta.get("sealed")]
+    real_remove = os.remove
+
+    def locked(path):
+        # Как на Windows: файл, отображенный читателем через mmap, не удаляется
+        if path.endswith(".dat") and not path.endswith("c.dat"):
+            raise PermissionError(13, "file is mapped", path)
+        real_remove(path)
+
+    monkeypatch.setattr(os, "remove", locked)
+    assert store.compact() == len(sealed)
+    assert store.enforce_retention(now=T0) == 0
+    assert all(os.path.exists(s.meta_path) for s in sealed)
+    assert [r["seq"] for r in store.query(T0, T0 + 99)] == list(range(100))
+
+    monkeypatch.setattr(os, "remove", real_remove)
+    assert store.enforce_retention(now=T0) == len(sealed)
+    assert not any(os.path.exists(p) for s in sealed for p in (s.dat, s.idx, s.meta_path))
+
+
+def test_query_skips_segment_removed_after_listing(cfg, tmp_path):
+    cfg = _history_cfg(cfg, tmp_path)
+    store = SegmentStore(str(tmp_path), "signals", cfg.history)
+    _write(store, _records(100))
+    first = store.segments()[0]
+    os.remove(first.dat)
+    seqs = [r["seq"] for r in store.query(T0, T0 + 99)]
+    assert seqs and seqs[-1] == 99 and 0 not in seqs
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from analytics.features import FEATURE_SCHEMA_VERSION
+from ml.signal_filter import SimpleLogisticModel, _log_loss, _sigmoid
+
+ORDER = ["net_profit_usd", "spread_bps", "volume_usd"]
+
+
+def _data(n=2000, seed=0):
+    """Метка зависит от первых двух признаков; шкалы признаков сильно различаются."""
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([rng.normal(0, 1, n), rng.normal(10, 5, n), rng.uniform(100, 5000, n)])
+    logit = 2.0 * X[:, 0] + 0.4 * (X[:, 1] - 10)
+    y = (rng.uniform(size=n) < _sigmoid(logit)).astype(float)
+    return X, y
+
+
+def _model(**kwargs) -> SimpleLogisticModel:
+    X, y = _data()
+    model = SimpleLogisticModel()
+    model.feature_order = list(ORDER)
+    model.fit_arrays(X, y, **kwargs)
+    return model
+
+
+@pytest.mark.parametrize("batch_size", [0, 128])
+def test_fit_arrays_converges_to_true_coefficients(batch_size):
+    X, y = _data()
+    model = _model(batch_size=batch_size, epochs=300, lr=0.5, patience=10)
+    # Признаки исходной шкалы: веса близки к истинным, лишний признак ~0
+    w = np.array([model.weights[k] for k in ORDER])
+    assert w[0] == pytest.approx(2.0, abs=0.4)
+    assert w[1] == pytest.approx(0.4, abs=0.1)
+    assert abs(w[2]) < 1e-3
+    loss = _log_loss(model.predict_proba_matrix(X), y)
+    assert loss < _log_loss(np.full(len(y), y.mean()), y) * 0.7
+
+
+def test_binary_roundtrip_preserves_predictions():
+    model = _model()
+    X, _ = _data(200, seed=1)
+    restored = SimpleLogisticModel.from_bytes(model.to_bytes())
+    assert restored.feature_order == ORDER
+    assert restored.schema_version == FEATURE_SCHEMA_VERSION
+    assert restored.bias == model.bias and restored.weights == model.weights
+    np.testing.assert_array_equal(restored.scaler_mean, model.scaler_mean)
+    np.testing.assert_array_equal(restored.predict_proba_matrix(X), model.predict_proba_matrix(X))
+
+    with pytest.raises(ValueError):
+        SimpleLogisticModel.from_bytes(b"XXXX" + model.to_bytes()[4:])
+
+
+def test_load_snapshot_reads_legacy_dict_format():
+    legacy = {"weights": {"net_profit_usd": 1.5, "spread_bps": -0.2}, "bias": 0.3, "feature_order": ORDER[:2]}
+    model = SimpleLogisticModel()
+    model.load_snapshot(legacy)
+    assert model.schema_version == 1  # снимки без версии — схема v1
+    assert model.scaler_mean is None
+    X = np.array([[1.0, 2.0], [0.0, 0.0]])
+    np.testing.assert_allclose(model.predict_proba_matrix(X), _sigmoid(X @ np.array([1.5, -0.2]) + 0.3))
+
+    # snapshot() нового формата читается так же
+    fitted = _model()
+    again = SimpleLogisticModel()
+    again.load_snapshot(fitted.snapshot())
+    X, _ = _data(50, seed=2)
+    np.testing.assert_allclose(again.predict_proba_matrix(X), fitted.predict_proba_matrix(X))
+    assert again.seen == fitted.seen
@@ -0,0 +1,71 @@
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from analytics.features import to_epoch
+from analytics.spread_matrix import build_spread_matrix, matrix_to_json, pack_matrix, unpack_matrix
+from core.signal_math import route_metrics
+
+NOW_DT = datetime(2026, 1, 1, 0, 1)
+NOW = to_epoch(NOW_DT)
+EXCHANGES = ["binance", "mexc", "okx"]
+
+
+def _matrix(make_book):
+    books = {
+        "BTCUSDT": {
+            "binance": make_book("binance", 99.9, 100.0, updated_at=NOW_DT - timedelta(seconds=2)),
+            "mexc": make_book("mexc", 101.0, 101.1, updated_at=NOW_DT - timedelta(seconds=5)),
+            "okx": make_book("okx", 100.2, 100.3, updated_at=NOW_DT),
+            "kraken": make_book("kraken", 1.0, 1.1, updated_at=NOW_DT),  # вне списка бирж
+        },
+        "ETHUSDT": {
+            "mexc": make_book("mexc", 10.0, 10.1, symbol="ETHUSDT", updated_at=NOW_DT - timedelta(seconds=1)),
+        },
+    }
+    return build_spread_matrix(books, ["BTCUSDT", "ETHUSDT", "SOLUSDT"], EXCHANGES, 1000.0, 0.001, 0.0005, NOW)
+
+
+def test_build_matches_scalar_route_metrics(make_book):
+    matrix = _matrix(make_book)
+    assert matrix.pairs == ["binance>mexc", "binance>okx", "mexc>binance", "mexc>okx", "okx>binance", "okx>mexc"]
+    assert matrix.spread_bps.shape == matrix.net_profit.shape == matrix.book_age_sec.shape == (3, 6)
+    assert matrix.spread_bps.dtype == np.float32
+
+    asks = {"binance": 100.0, "mexc": 101.1, "okx": 100.3}
+    bids = {"binance": 99.9, "mexc": 101.0, "okx": 100.2}
+    ages = {"binance": 2.0, "mexc": 5.0, "okx": 0.0}
+    for p, pair in enumerate(matrix.pairs):
+        buy, sell = pair.split(">")
+        _, spread_bps, net_profit, _ = route_metrics(asks[buy], bids[sell], 1000.0, 0.001, 0.0005)
+        assert matrix.spread_bps[0, p] == pytest.approx(spread_bps, rel=1e-6)
+        assert matrix.net_profit[0, p] == pytest.approx(net_profit, rel=1e-5)
+        assert matrix.book_age_sec[0, p] == pytest.approx(max(ages[buy], ages[sell]))
+
+
+def test_missing_books_are_nan(make_book):
+    matrix = _matrix(make_book)
+    # ETH — одна книга: ни один маршрут не посчитан; SOL — книг нет вовсе
+    assert np.isnan(matrix.spread_bps[1:]).all() and np.isnan(matrix.net_profit[1:]).all()
+    assert np.isnan(matrix.book_age_sec[1:]).all()
+
+
+def test_pack_unpack_round_trip(make_book):
+    matrix = _matrix(make_book)
+    restored = unpack_matrix(pack_matrix(matrix))
+    assert (restored.ts, restored.symbols, restored.exchanges, restored.pairs) == (
+        matrix.ts, matrix.symbols, matrix.exchanges, matrix.pairs
+    )
+    for name in ("spread_bps", "net_profit", "book_age_sec"):
+        np.testing.assert_array_equal(getattr(restored, name), getattr(matrix, name))
+        assert getattr(restored, name).dtype == np.float32
+
+
+def test_matrix_to_json_nulls_nan(make_book):
+    payload = json.loads(json.dumps(matrix_to_json(_matrix(make_book))))
+    assert payload["symbols"] == ["BTCUSDT", "ETHUSDT", "SOLUSDT"]
+    assert all(v is None for v in payload["spread_bps"][2])
+    assert payload["spread_bps"][0][0] == pytest.approx(round(float(_matrix(make_book).spread_bps[0, 0]), 4))
+    assert payload["book_age_sec"][0][0] == 5.0
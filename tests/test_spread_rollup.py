@@ -0,0 +1,101 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from analytics.spread_rollup import SpreadRollup
+from core.stats_engine import _feed_rollup
+
+T0 = 1_767_225_600  # 2026-01-01 UTC, начало часа
+
+
+def test_rollup_packs_closed_and_open_buckets(cfg, redis):
+    rollup = SpreadRollup(redis, cfg)
+
+    async def scenario():
+        # Два значения в секунде T0, одно в T0+1, затем T0+61 (закрывает минуту)
+        for ts, value in ((T0, 4.0), (T0 + 0.5, 2.0), (T0 + 1, 6.0), (T0 + 61, 8.0)):
+            rollup.add("BTCUSDT", "binance>mexc", ts, value)
+        await rollup.flush()
+
+        sec = await rollup.query("BTCUSDT", "binance>mexc", "1s", T0, T0 + 120)
+        assert sec["ts"].tolist() == [T0, T0 + 1, T0 + 61]  # последняя — открытый бакет
+        first = sec[0]
+        assert (first["open"], first["high"], first["low"], first["close"]) == (4.0, 4.0, 2.0, 2.0)
+        assert first["mean"] == pytest.approx(3.0) and first["count"] == 2
+
+        minute = await rollup.query("BTCUSDT", "binance>mexc", "1m", T0, T0 + 120)
+        assert minute["ts"].tolist() == [T0, T0 + 60]
+        assert minute["count"].tolist() == [3, 1]
+        assert minute["high"].tolist() == [6.0, 8.0]
+
+        # Границы: [start, end)
+        assert (await rollup.query("BTCUSDT", "binance>mexc", "1s", T0 + 1, T0 + 61))["ts"].tolist() == [T0 + 1]
+        assert (await rollup.query("BTCUSDT", "mexc>binance", "1s", T0, T0 + 120)).size == 0
+
+    asyncio.run(scenario())
+
+
+def test_rollup_failed_flush_keeps_buckets(cfg, redis, monkeypatch):
+    rollup = SpreadRollup(redis, cfg)
+
+    async def scenario():
+        for k in range(3):
+            rollup.add("BTCUSDT", "binance>mexc", T0 + k, float(k))
+
+        real_pipeline = rollup.client.pipeline
+
+        def broken_pipeline(*args, **kwargs):
+            pipe = real_pipeline(*args, **kwargs)
+
+            async def fail():
+                raise ConnectionError("redis down")
+
+            pipe.execute = fail
+            return pipe
+
+        monkeypatch.setattr(rollup.client, "pipeline", broken_pipeline)
+        with pytest.raises(ConnectionError):
+            await rollup.flush()
+        monkeypatch.setattr(rollup.client, "pipeline", real_pipeline)
+
+        await rollup.flush()
+        sec = await rollup.query("BTCUSDT", "binance>mexc", "1s", T0, T0 + 10)
+        assert sec["close"].tolist() == [0.0, 1.0, 2.0]
+
+    asyncio.run(scenario())
+
+
+def test_rollup_state_roundtrip_restores_open_and_unflushed(cfg, redis):
+    source = SpreadRollup(redis, cfg)
+    for k in range(5):
+        source.add("BTCUSDT", "binance>mexc", T0 + k, float(k))
+
+    restored = SpreadRollup(redis, cfg)
+    assert restored.restore_state(*source.to_state())
+
+    async def scenario():
+        await restored.flush()
+        sec = await restored.query("BTCUSDT", "binance>mexc", "1s", T0, T0 + 10)
+        assert sec["close"].tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
+        hour = await restored.query("BTCUSDT", "binance>mexc", "1h", T0, T0 + 3600)
+        assert hour["count"].tolist() == [5] and hour["mean"][0] == pytest.approx(2.0)
+
+    asyncio.run(scenario())
+
+
+def test_collector_snapshots_fill_every_second_bucket(cfg, redis):
+    rollup = SpreadRollup(redis, cfg)
+    for k in range(6):
+        snap = {"ts": T0 + k + 0.2, "books": {"binance": [100.0, 100.1], "mexc": [100.2 + k * 0.01, 100.3]}}
+        _feed_rollup(rollup, cfg, "BTCUSDT", snap)
+
+    async def scenario():
+        await rollup.flush()
+        sec = await rollup.query("BTCUSDT", "binance>mexc", "1s", T0, T0 + 10)
+        assert sec["ts"].tolist() == [T0 + k for k in range(6)]
+        expected = [(100.2 + k * 0.01 - 100.1) / ((100.2 + k * 0.01 + 100.1) / 2) * 10_000 for k in range(6)]
+        np.testing.assert_allclose(sec["close"], expected, rtol=1e-5)
+        assert (await rollup.query("BTCUSDT", "mexc>binance", "1s", T0, T0 + 10))["close"].max() < 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,86 @@
+import asyncio
+import math
+
+import numpy as np
+
+from analytics.history_store import HistoryStore
+from analytics.volatility import WINDOWS_SEC, VolatilityEstimator
+from core.stats_engine import _book_updates
+
+
+def _walk(n, seed=1, dt=1.0):
+    rng = np.random.default_rng(seed)
+    ts = 1000.0 + np.cumsum(rng.uniform(0.5, 1.5, n)) * dt
+    mid = 100.0 * np.exp(np.cumsum(rng.normal(0, 1e-3, n)))
+    return ts, mid
+
+
+def _brute_force(ts, mid, window):
+    """Корень суммы квадратов лог-доходностей с ts в (t_last - window, t_last]."""
+    r = np.diff(np.log(mid))
+    inside = ts[1:] > ts[-1] - window
+    return math.sqrt(float(np.sum(r[inside] ** 2)))
+
+
+def test_window_volatility_matches_brute_force():
+    ts, mid = _walk(6000)
+    est = VolatilityEstimator("window", capacity=8192)
+    for k, (t, m) in enumerate(zip(ts, mid)):
+        est.update("BTCUSDT", t, m)
+        if k in (30, 700, 5999):
+            vol = est.get("BTCUSDT")
+            for name, window in WINDOWS_SEC.items():
+                assert math.isclose(vol[name], _brute_force(ts[: k + 1], mid[: k + 1], window), rel_tol=1e-9)
+
+
+def test_small_buffer_keeps_only_capacity_returns():
+    ts, mid = _walk(500)
+    est = VolatilityEstimator("window", capacity=64)
+    for t, m in zip(ts, mid):
+        est.update("BTCUSDT", t, m)
+    r = np.diff(np.log(mid))[-64:]
+    assert math.isclose(est.get("BTCUSDT")["1h"], math.sqrt(float(np.sum(r**2))), rel_tol=1e-9)
+
+
+def test_ewma_volatility_tracks_constant_variance():
+    rng = np.random.default_rng(7)
+    sigma = 2e-4  # на секунду
+    est = VolatilityEstimator("ewma")
+    mid = 100.0
+    for k in range(20000):
+        mid *= math.exp(rng.normal(0, sigma))
+        est.update("BTCUSDT", float(k), mid)
+    assert math.isclose(est.get("BTCUSDT")["1m"], sigma * math.sqrt(60), rel_tol=0.5)
+    assert math.isclose(est.get("BTCUSDT")["1h"], sigma * math.sqrt(3600), rel_tol=0.15)
+
+
+def test_state_roundtrip_continues_identically():
+    ts, mid = _walk(3000)
+    a = VolatilityEstimator("window", capacity=1024)
+    for t, m in zip(ts[:2000], mid[:2000]):
+        a.update("BTCUSDT", t, m)
+    b = VolatilityEstimator("window", capacity=1024)
+    assert b.restore_state(*a.to_state())
+    assert not VolatilityEstimator("window", capacity=512).restore_state(*a.to_state())
+    for t, m in zip(ts[2000:], mid[2000:]):
+        a.update("BTCUSDT", t, m)
+        b.update("BTCUSDT", t, m)
+    assert a.get("BTCUSDT") == b.get("BTCUSDT")
+    assert a.last_ts("BTCUSDT") == b.last_ts("BTCUSDT") == ts[-1]
+
+
+def test_book_updates_feed_every_collector_snapshot_once(cfg, redis, make_book):
+    history = HistoryStore(redis, cfg)
+    cfg.collector.symbols = ["BTCUSDT"]
+
+    async def scenario():
+        for k in range(5):
+            books = {"binance": make_book("binance", 100.0 + k, 100.1 + k)}
+            await history.append_books("BTCUSDT", books, ts=1000.0 + k)
+        fed_ts = {"BTCUSDT": 1001.0}
+        updates = await _book_updates(cfg, history, {}, fed_ts)
+        assert [s["ts"] for s in updates["BTCUSDT"]] == [1002.0, 1003.0, 1004.0]
+        assert fed_ts["BTCUSDT"] == 1004.0
+        assert await _book_updates(cfg, history, {}, fed_ts) == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import numpy as np
+
+from ml.grid_index import GridIndex
+from ml.signal_clustering import ClusterModel, DensityModel, SignalClusterer, cluster_job, density_job
+from state.npz_codec import pack_snapshot, unpack_snapshot
+from state.warm_start import WarmStartStore
+
+
+def test_npz_codec_round_trip():
+    arrays = {
+        "f8": np.linspace(0, 1, 7),
+        "i1": np.array([-1, 0, 1], dtype=np.int8),
+        "grid": np.arange(12, dtype=np.float32).reshape(3, 4),
+        "empty": np.zeros((0, 3)),
+    }
+    meta = {"kind": "kmeans", "order": ["a", "б"], "eps": 0.5, "nested": {"k": [1, 2]}}
+    got_meta, got = unpack_snapshot(pack_snapshot(meta, arrays))
+    assert got_meta == meta
+    assert set(got) == set(arrays)
+    for name, arr in arrays.items():
+        assert got[name].dtype == arr.dtype and got[name].shape == arr.shape
+        np.testing.assert_array_equal(got[name], arr)
+
+    assert unpack_snapshot(pack_snapshot({"x": 1})) == ({"x": 1}, {})
+
+
+def test_store_save_load_and_age(cfg, redis, monkeypatch):
+    warm = WarmStartStore(redis, cfg)
+
+    async def scenario():
+        assert await warm.load("comp") is None
+        await warm.save("comp", {"n": 3}, {"v": np.arange(3)})
+        meta, arrays = await warm.load("comp")
+        assert meta["n"] == 3 and meta["saved_at"] <= time.time()
+        np.testing.assert_array_equal(arrays["v"], np.arange(3))
+
+        # Снимок старше max_age_sec игнорируется
+        saved_at = meta["saved_at"]
+        monkeypatch.setattr(time, "time", lambda: saved_at + cfg.warm_start.max_age_sec + 1)
+        assert await warm.load("comp") is None
+        monkeypatch.undo()
+
+        await redis.binary.set("state:warm:comp", b"not an npz")
+        assert await warm.load("comp") is None
+
+    asyncio.run(scenario())
+
+
+def test_store_disabled_and_due(cfg, redis):
+    cfg.warm_start.checkpoint_interval_sec = 3600.0
+    warm = WarmStartStore(redis, cfg)
+
+    async def scenario():
+        assert warm.due("comp")
+        await warm.save("comp", {"n": 1})
+        assert not warm.due("comp") and warm.due("other")
+
+        cfg.warm_start.enabled = False
+        assert not warm.due("other")
+        await warm.save("other", {"n": 2})
+        assert await warm.load("comp") is None
+        assert await redis.binary.get("state:warm:other") is None
+
+    asyncio.run(scenario())
+
+
+def _features(seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.array([[0.0, 0.0, 0.0], [5.0, 5.0, 0.0], [0.0, 5.0, 5.0]])
+    return np.vstack([c + rng.normal(0, 0.3, (100, 3)) for c in centers])
+
+
+def test_clusterer_kmeans_checkpoint_restore(cfg, redis):
+    X = _features()
+    result = cluster_job(X, 3, max_iter=50, tol=1e-4, batch_size=0)
+    source = SignalClusterer(cfg, redis)
+    source.model = ClusterModel(["a", "b", "c"], result.mean, result.std, result.centroids)
+
+    async def scenario():
+        await source.checkpoint()
+        restored = SignalClusterer(cfg, redis)
+        await restored.restore()
+        return restored
+
+    restored = asyncio.run(scenario())
+    assert isinstance(restored.model, ClusterModel) and restored.model.feature_order == ["a", "b", "c"]
+    np.testing.assert_array_equal(restored.predict_batch(X), source.predict_batch(X))
+
+
+def test_clusterer_dbscan_checkpoint_restore(cfg, redis):
+    X = _features(1)
+    cc = cfg.clustering
+    result = density_job(X, 0.5, 5, cc.grid_dims)
+    Xs = (X - result.mean) / result.std
+    index = GridIndex(Xs[result.core], 0.5, cc.grid_dims)
+    source = SignalClusterer(cfg, redis)
+    source.model = DensityModel(["a", "b", "c"], result.mean, result.std, index, result.labels[result.core])
+
+    async def scenario():
+        await source.checkpoint()
+        restored = SignalClusterer(cfg, redis)
+        await restored.restore()
+        return restored
+
+    restored = asyncio.run(scenario())
+    assert isinstance(restored.model, DensityModel) and restored.model.index.eps == 0.5
+    queries = np.vstack([X, [[50.0, 50.0, 50.0]]])
+    labels = restored.predict_batch(queries)
+    np.testing.assert_array_equal(labels, source.predict_batch(queries))
+    assert labels[-1] == -1
+
+
+def test_clusterer_restore_without_snapshot(cfg, redis):
+    clusterer = SignalClusterer(cfg, redis)
+    asyncio.run(clusterer.restore())
+    assert clusterer.model is None and clusterer.predict_batch(np.ones((2, 3))) is None
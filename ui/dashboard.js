@@ -22,12 +22,26 @@
 
   let isRefreshing = false;
 
+  // Условный GET: сервер отвечает 304, если данные не менялись с прошлого опроса
+  const etags = {};
+  const lastBodies = {};
+
   async function fetchJson(url) {
-    const res = await fetch(url, { cache: "no-store" });
+    const headers = etags[url] ? { "If-None-Match": etags[url] } : {};
+    const res = await fetch(url, { cache: "no-store", headers });
+    if (res.status === 304 && url in lastBodies) {
+      return lastBodies[url];
+    }
     if (!res.ok) {
       throw new Error(`HTTP ${res.status}`);
     }
-    return res.json();
+    const body = await res.json();
+    const etag = res.headers.get("ETag");
+    if (etag) {
+      etags[url] = etag;
+      lastBodies[url] = body;
+    }
+    return body;
   }
 
   function updateStatus(status) {
@@ -141,83 +155,136 @@
     }
   }
 
-  function updateSignals(signals) {
-    const list = els.signalsList;
-    list.innerHTML = "";
-
-    if (!Array.isArray(signals) || !signals.length) {
-      els.signalsCount.textContent = "0";
-      const empty = document.createElement("div");
-      empty.textContent = "No signals yet.";
-      empty.style.fontSize = "12px";
-      empty.style.color = "var(--text-muted)";
-      list.appendChild(empty);
-      return;
+  // ---- Signals: виртуализированный список (в DOM только видимые карточки) ----
+  const ROW_HEIGHT = 64;
+  const OVERSCAN = 4;
+  const signalsById = new Map();
+  let signalOrder = []; // id по возрастанию; рендер — от новых к старым
+  let renderPending = false;
+
+  const spacer = document.createElement("div");
+  spacer.className = "signals-spacer";
+  const emptyLabel = document.createElement("div");
+  emptyLabel.textContent = "No signals yet.";
+  emptyLabel.style.fontSize = "12px";
+  emptyLabel.style.color = "var(--text-muted)";
+  els.signalsList.classList.add("signals-virtual");
+  els.signalsList.appendChild(spacer);
+  els.signalsList.addEventListener("scroll", scheduleSignalsRender);
+
+  function buildSignalCard(s) {
+    const card = document.createElement("div");
+    card.className = "signal-card";
+
+    const header = document.createElement("div");
+    header.className = "signal-header";
+
+    const sym = document.createElement("div");
+    sym.className = "signal-symbol";
+    sym.textContent = s.symbol;
+
+    const route = document.createElement("div");
+    route.className = "signal-route";
+    route.textContent = `${s.buy_exchange} → ${s.sell_exchange}`;
+
+    header.appendChild(sym);
+    header.appendChild(route);
+
+    const metrics = document.createElement("div");
+    metrics.className = "signal-metrics";
+
+    const spread = document.createElement("div");
+    spread.className = "signal-tag";
+    spread.textContent = `Spread: ${s.spread?.toFixed?.(4) ?? s.spread}`;
+
+    const vol = document.createElement("div");
+    vol.className = "signal-tag";
+    vol.textContent = `Vol: $${s.volume_usd?.toFixed?.(2) ?? s.volume_usd}`;
+
+    const net = document.createElement("div");
+    net.className = "signal-tag";
+    const netVal =
+      typeof s.net_profit === "number"
+        ? s.net_profit.toFixed(4)
+        : String(s.net_profit ?? "—");
+    net.textContent = `Net: ${netVal}`;
+    if (typeof s.net_profit === "number") {
+      if (s.net_profit > 0) {
+        net.classList.add("signal-profit-positive");
+      } else if (s.net_profit < 0) {
+        net.classList.add("signal-profit-negative");
+      }
     }
 
-    const limited = signals.slice(0, 20);
-    els.signalsCount.textContent = String(limited.length);
-
-    for (const s of limited) {
-      const card = document.createElement("div");
-      card.className = "signal-card";
-
-      const header = document.createElement("div");
-      header.className = "signal-header";
-
-      const sym = document.createElement("div");
-      sym.className = "signal-symbol";
-      sym.textContent = s.symbol;
-
-      const route = document.createElement("div");
-      route.className = "signal-route";
-      route.textContent = `${s.buy_exchange} → ${s.sell_exchange}`;
-
-      header.appendChild(sym);
-      header.appendChild(route);
-
-      const metrics = document.createElement("div");
-      metrics.className = "signal-metrics";
-
-      const spread = document.createElement("div");
-      spread.className = "signal-tag";
-      spread.textContent = `Spread: ${s.spread?.toFixed?.(4) ?? s.spread}`;
-
-      const vol = document.createElement("div");
-      vol.className = "signal-tag";
-      vol.textContent = `Vol: $${s.volume_usd?.toFixed?.(2) ?? s.volume_usd}`;
-
-      const net = document.createElement("div");
-      net.className = "signal-tag";
-      const netVal =
-        typeof s.net_profit === "number"
-          ? s.net_profit.toFixed(4)
-          : String(s.net_profit ?? "—");
-      net.textContent = `Net: ${netVal}`;
-      if (typeof s.net_profit === "number") {
-        if (s.net_profit > 0) {
-          net.classList.add("signal-profit-positive");
-        } else if (s.net_profit < 0) {
-          net.classList.add("signal-profit-negative");
-        }
-      }
+    metrics.appendChild(spread);
+    metrics.appendChild(vol);
+    metrics.appendChild(net);
 
-      metrics.appendChild(spread);
-      metrics.appendChild(vol);
-      metrics.appendChild(net);
+    const meta = document.createElement("div");
+    meta.className = "signal-meta";
+    meta.textContent = s.created_at || "—";
 
-      const meta = document.createElement("div");
-      meta.className = "signal-meta";
-      meta.textContent = s.created_at || "—";
+    card.appendChild(header);
+    card.appendChild(metrics);
+    card.appendChild(meta);
 
-      card.appendChild(header);
-      card.appendChild(metrics);
-      card.appendChild(meta);
+    return card;
+  }
 
-      list.appendChild(card);
+  function scheduleSignalsRender() {
+    if (renderPending) return;
+    renderPending = true;
+    requestAnimationFrame(renderSignals);
+  }
+
+  function renderSignals() {
+    renderPending = false;
+    const list = els.signalsList;
+    const total = signalOrder.length;
+    els.signalsCount.textContent = String(total);
+    spacer.style.height = `${total * ROW_HEIGHT}px`;
+    spacer.innerHTML = "";
+
+    if (!total) {
+      spacer.appendChild(emptyLabel);
+      return;
+    }
+
+    const first = Math.max(0, Math.floor(list.scrollTop / ROW_HEIGHT) - OVERSCAN);
+    const last = Math.min(total, Math.ceil((list.scrollTop + list.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+    for (let i = first; i < last; i++) {
+      const card = buildSignalCard(signalsById.get(signalOrder[total - 1 - i]));
+      card.style.top = `${i * ROW_HEIGHT}px`;
+      card.style.height = `${ROW_HEIGHT - 8}px`;
+      spacer.appendChild(card);
     }
   }
 
+  function addSignals(signals) {
+    for (const s of signals) {
+      if (!signalsById.has(s.id)) {
+        signalsById.set(s.id, s);
+        signalOrder.push(s.id);
+      }
+    }
+    scheduleSignalsRender();
+  }
+
+  function expireSignals(ids) {
+    const gone = new Set(ids);
+    for (const id of ids) signalsById.delete(id);
+    signalOrder = signalOrder.filter((id) => !gone.has(id));
+    scheduleSignalsRender();
+  }
+
+  function updateSignals(signals) {
+    // Полный список (resync или опрос): сигналы без id нумеруются по порядку
+    signalsById.clear();
+    signalOrder = [];
+    const list = Array.isArray(signals) ? signals : [];
+    addSignals(list.map((s, i) => (s.id === undefined ? { ...s, id: list.length - i } : s)).reverse());
+  }
+
   async function refreshAll() {
     if (isRefreshing) return;
     isRefreshing = true;
@@ -256,8 +323,56 @@
     }
   }
 
+  // ---- Live: один мультиплексированный поток дельт вместо опроса трех эндпоинтов ----
+  const marketBySymbol = new Map();
+  let lastSeq = 0;
+
+  function renderMarket() {
+    updateMarket(Array.from(marketBySymbol.values()));
+  }
+
+  function applyMarketDelta(delta) {
+    for (const row of delta.upsert || []) marketBySymbol.set(row.symbol, row);
+    for (const symbol of delta.remove || []) marketBySymbol.delete(symbol);
+    renderMarket();
+  }
+
+  function connectLive() {
+    const source = new EventSource("/stream/live");
+
+    // Кадры с id <= последнего примененного уже учтены (например, снимком resync);
+    // id = "{epoch}-{seq}", epoch меняется вместе с процессом API (после resync)
+    function handler(apply) {
+      return (ev) => {
+        const seq = Number(String(ev.lastEventId).split("-").pop());
+        if (seq && seq <= lastSeq && ev.type !== "resync") return;
+        lastSeq = seq || lastSeq;
+        apply(JSON.parse(ev.data));
+      };
+    }
+
+    source.addEventListener("resync", handler((snap) => {
+      updateStatus(snap.status);
+      marketBySymbol.clear();
+      applyMarketDelta({ upsert: snap.market || [] });
+      updateSignals((snap.signals || []).slice().reverse());
+    }));
+    source.addEventListener("status", handler(updateStatus));
+    source.addEventListener("market", handler(applyMarketDelta));
+    source.addEventListener("signal-added", handler(addSignals));
+    source.addEventListener("signal-expired", handler((d) => expireSignals(d.ids || [])));
+    source.onerror = () => {
+      // EventSource переподключается сам и передает Last-Event-ID — сервер дошлет пропущенное
+      updateStatus(null);
+    };
+  }
+
   window.addEventListener("load", () => {
-    refreshAll();
-    setInterval(refreshAll, POLL_INTERVAL_MS);
+    if (window.EventSource) {
+      connectLive();
+    } else {
+      refreshAll();
+      setInterval(refreshAll, POLL_INTERVAL_MS);
+    }
   });
 })();